@@ -0,0 +1,64 @@
+# batch_parser.py
+import os
+import argparse
+from datetime import date
+
+from gtfs_utils import load_profiles
+from gtfs_cache import load_feed_cache, CACHE_DIR
+from gtfs_index import load_feed_index, INDEX_DIR
+from weekly_parser import (
+    get_week_days,
+    build_weekly_schedule_from_cache,
+    build_weekly_schedule_from_index,
+    write_weekly_schedule,
+)
+from stop_grid import resolve_profile_locations
+
+# ----------------------------------------------------
+# הפקת לוחות זמנים שבועיים לכמה פרופילים (קבוצות נוסעים) מטעינה אחת של ה-Feed.
+# ----------------------------------------------------
+
+DEFAULT_OUTPUT_DIR = 'schedules'
+
+
+def generate_profile_schedules(zip_path, profiles, output_dir=DEFAULT_OUTPUT_DIR, engine='index'):
+    """
+    טוענת את ה-Feed פעם אחת (אינדקס או Cache עמודתי) ומייצרת קובץ <profile>.txt לכל פרופיל.
+    כל פרופיל נושא את המצב שלו (Profile) - אין שימוש במשתנים הגלובליים של gtfs_utils.
+    מחזירה { profile_name: output_path } עבור הפרופילים שנכתבו בהצלחה.
+    """
+    week_days = get_week_days(date.today())
+    os.makedirs(output_dir, exist_ok=True)
+
+    feed_cache = load_feed_cache(zip_path, CACHE_DIR) if engine == 'cache' else None
+    feed_index = load_feed_index(zip_path, INDEX_DIR) if feed_cache is None else None
+
+    written = {}
+    for profile in profiles:
+        output_path = os.path.join(output_dir, f"{profile.name}.txt")
+        print(f"\n--- Building weekly schedule for profile {profile.name} ---")
+        try:
+            resolve_profile_locations(profile, zip_path)
+            if feed_cache is not None:
+                weekly_schedule = build_weekly_schedule_from_cache(feed_cache, week_days, profile)
+            else:
+                weekly_schedule = build_weekly_schedule_from_index(feed_index, week_days, profile)
+
+            if write_weekly_schedule(weekly_schedule, week_days, output_path):
+                written[profile.name] = output_path
+        except Exception as e:
+            print(f"WARNING: Skipping profile {profile.name} due to error: {e}")
+
+    print(f"\nSUCCESS: Generated {len(written)}/{len(profiles)} profile schedules in {output_dir}.")
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate weekly schedules for many config profiles from one feed load.")
+    parser.add_argument('profiles', help="Directory of *.ini profiles, or one ini file with [LINES:name]/[STOP_CODES:name]/[LOCATIONS:name] sections.")
+    parser.add_argument('--zip', default='gtfs.zip', help="Path to the GTFS zip (default: gtfs.zip).")
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help=f"Output directory (default: {DEFAULT_OUTPUT_DIR}).")
+    parser.add_argument('--engine', choices=('index', 'cache'), default='index', help="Feed representation to load once (default: index).")
+    args = parser.parse_args()
+
+    generate_profile_schedules(args.zip, load_profiles(args.profiles), args.output_dir, args.engine)
@@ -0,0 +1,114 @@
+# benchmarks/load_test_service.py
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from urllib.parse import urlencode
+
+# ----------------------------------------------------
+# בדיקת עומס ל-query_service.py: כמה לקוחות במקביל (חיבור Keep-Alive לכל לקוח) שולחים
+# /departures על זוגות (קו, תחנה) אקראיים, ומודדים זמן תגובה (p50/p90/p99) ותפוקה.
+# עם --touch-zip ה-ZIP "מתעדכן" באמצע הבדיקה, כדי לוודא שה-Reload לא מפיל בקשות.
+# ----------------------------------------------------
+
+
+async def http_get(reader, writer, host, path):
+    """בקשת GET אחת על חיבור פתוח. מחזיר (status, body)."""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by the server.")
+    status = int(status_line.split()[1])
+    content_length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            content_length = int(value)
+    body = await reader.readexactly(content_length)
+    return status, json.loads(body)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def run_client(host, port, pairs, requests, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            route, stop_code = random.choice(pairs)
+            path = f"/departures?{urlencode({'route': route, 'stop': stop_code, 'count': 5})}"
+            started = time.perf_counter()
+            try:
+                status, _ = await http_get(reader, writer, host, path)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                errors.append('connection')
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def main(args):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    status, body = await http_get(reader, writer, args.host, '/stops')
+    writer.close()
+    if status != 200 or not body['stops']:
+        raise SystemExit(f"ERROR: The service returned {status} for /stops: {body}")
+    pairs = [(item['route'], item['stop']) for item in body['stops']]
+    print(f"INFO: {len(pairs)} route/stop pairs, {args.clients} clients x {args.requests} requests.")
+
+    latencies = []
+    errors = []
+    clients = [run_client(args.host, args.port, pairs, args.requests, latencies, errors) for _ in range(args.clients)]
+
+    async def touch_zip():
+        # באמצע הבדיקה: עדכון ה-mtime של ה-ZIP כדי שהשירות יבנה ויחליף אינדקס
+        await asyncio.sleep(args.touch_after)
+        os.utime(args.touch_zip)
+        print(f"INFO: Touched {args.touch_zip} to trigger a reload.")
+
+    started = time.perf_counter()
+    await asyncio.gather(*clients, *([touch_zip()] if args.touch_zip else []))
+    wall_s = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'wall_s': round(wall_s, 3),
+        'requests_per_s': round(len(latencies) / wall_s),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+    }
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test the local timetable query service.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--clients', type=int, default=20, help="Concurrent keep-alive clients.")
+    parser.add_argument('--requests', type=int, default=500, help="Requests per client.")
+    parser.add_argument('--touch-zip', help="Touch this feed zip during the test to exercise hot reload.")
+    parser.add_argument('--touch-after', type=float, default=1.0, help="Seconds into the test to touch the zip.")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    asyncio.run(main(args))
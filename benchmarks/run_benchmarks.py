@@ -0,0 +1,142 @@
+# benchmarks/run_benchmarks.py
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from synthetic_gtfs import PRESETS
+
+# ----------------------------------------------------
+# הרצת ה-Pipeline המלא (download_gtfs.py) על Feed-ים סינתטיים בכמה גדלים,
+# מדידת זמן, Peak RSS ותפוקה (שורות לשנייה) לכל שלב, והשוואה ל-Baseline שמור.
+# כל הרצה (וגם יצירת ה-Feed) היא תהליך נפרד: ב-Linux ה-Peak RSS עובר בירושה מתהליך האב,
+# ולכן האב חייב להישאר קטן כדי שהמדידה של כל מנוע וכל גודל תהיה נקייה.
+# ----------------------------------------------------
+
+DATA_DIR = os.path.join(BENCHMARKS_DIR, '.data')
+BASELINE_FILE = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+SCHEDULE_FILE = 'schedule2.txt'
+STATS_FILE = 'schedule2.stats.json'
+
+# (שם, ארגומנטים ל-download_gtfs.py, האם למחוק Cache/אינדקס לפני ההרצה)
+RUNS = [
+    ('zip', ['--engine', 'zip'], True),
+    ('cache_cold', ['--engine', 'cache'], True),
+    ('cache_warm', ['--engine', 'cache'], False),
+    ('index_cold', ['--engine', 'index'], True),
+    ('index_warm', ['--engine', 'index'], False),
+]
+
+
+def run_pipeline(work_dir, args, clean):
+    """מריץ את download_gtfs.py בתיקיית העבודה ומחזיר את תוצאות המדידה."""
+    if clean:
+        for cache_dir in ('.gtfs_cache', '.gtfs_index'):
+            shutil.rmtree(os.path.join(work_dir, cache_dir), ignore_errors=True)
+    for stale in (SCHEDULE_FILE, STATS_FILE):
+        if os.path.exists(os.path.join(work_dir, stale)):
+            os.remove(os.path.join(work_dir, stale))
+
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, 'download_gtfs.py'), *args],
+                            cwd=work_dir, env=env, capture_output=True, text=True)
+    wall_s = time.perf_counter() - started
+
+    stats_path = os.path.join(work_dir, STATS_FILE)
+    if result.returncode != 0 or not os.path.exists(stats_path):
+        print(result.stdout[-2000:], result.stderr[-2000:])
+        raise Exception(f"Pipeline run {args} failed in {work_dir}.")
+
+    with open(stats_path, encoding='utf-8') as f:
+        stats = json.load(f)
+
+    stages = {}
+    for stage in stats['stages']:
+        rows_per_s = round(stage['rows_scanned'] / stage['wall_s']) if stage['rows_scanned'] and stage['wall_s'] else None
+        stages[stage['stage']] = {
+            'wall_s': stage['wall_s'],
+            'rows_scanned': stage['rows_scanned'],
+            'rows_kept': stage['rows_kept'],
+            'rows_per_s': rows_per_s,
+        }
+
+    return {
+        'wall_s': round(wall_s, 3),
+        'peak_rss_mb': stats['peak_rss_mb'],
+        'output_bytes': os.path.getsize(os.path.join(work_dir, SCHEDULE_FILE)),
+        'stages': stages,
+    }
+
+
+def run_size(preset, seed):
+    """מייצר (או משתמש מחדש ב-) Feed בגודל preset ומריץ עליו את כל המנועים."""
+    work_dir = os.path.join(DATA_DIR, f"{preset}-{seed}")
+    zip_path = os.path.join(work_dir, 'gtfs.zip')
+    if not os.path.exists(zip_path):
+        print(f"INFO: Generating synthetic '{preset}' feed in {work_dir}.")
+        subprocess.run([sys.executable, os.path.join(BENCHMARKS_DIR, 'synthetic_gtfs.py'), work_dir,
+                        '--preset', preset, '--seed', str(seed)], check=True)
+
+    scale = PRESETS[preset]
+    results = {'scale': scale, 'zip_bytes': os.path.getsize(zip_path), 'stop_times_rows': scale['trips'] * scale['stops_per_trip'], 'runs': {}}
+    for name, args, clean in RUNS:
+        print(f"INFO: Running {preset}/{name}...")
+        results['runs'][name] = run_pipeline(work_dir, args, clean)
+        print(f"DEBUG: {preset}/{name}: {results['runs'][name]['wall_s']}s, {results['runs'][name]['peak_rss_mb']} MB peak RSS.")
+    return results
+
+
+def compare_with_baseline(current, baseline):
+    """מדפיס את היחס (נוכחי / Baseline) של זמן ו-Peak RSS לכל גודל ומנוע."""
+    print("\n--- Comparison with baseline (current / baseline) ---")
+    for preset, results in current['sizes'].items():
+        base_size = baseline.get('sizes', {}).get(preset)
+        if not base_size:
+            print(f"{preset}: no baseline.")
+            continue
+        for name, run in results['runs'].items():
+            base_run = base_size['runs'].get(name)
+            if not base_run:
+                continue
+            wall_ratio = run['wall_s'] / base_run['wall_s'] if base_run['wall_s'] else float('nan')
+            rss_ratio = run['peak_rss_mb'] / base_run['peak_rss_mb'] if base_run['peak_rss_mb'] else float('nan')
+            flag = '  <-- REGRESSION' if wall_ratio > 1.2 or rss_ratio > 1.2 else ''
+            print(f"{preset:>9}/{name:<11} wall x{wall_ratio:.2f}  rss x{rss_ratio:.2f}{flag}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the schedule pipeline on synthetic GTFS feeds.")
+    parser.add_argument('--sizes', nargs='+', choices=sorted(PRESETS), default=['tiny', 'small'])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save-baseline', action='store_true', help=f"Store the results as {BASELINE_FILE}.")
+    parser.add_argument('--output', help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    current = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'sizes': {preset: run_size(preset, args.seed) for preset in args.sizes},
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding='utf-8') as f:
+            compare_with_baseline(current, json.load(f))
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(current, f, indent=2)
+        print(f"SUCCESS: Baseline saved to {BASELINE_FILE}.")
@@ -0,0 +1,146 @@
+# benchmarks/synthetic_gtfs.py
+import os
+import csv
+import io
+import random
+import zipfile
+import argparse
+from datetime import date, timedelta
+
+# ----------------------------------------------------
+# מחולל Feed סינתטי ודטרמיניסטי (אותו seed -> אותו ZIP) בקנה מידה לבחירה,
+# לצורך מדידת ביצועים ללא הורדה של ה-Feed הארצי.
+# ----------------------------------------------------
+
+# גדלים מוכנים. national מתקרב לסדר הגודל של ה-Feed של משרד התחבורה.
+PRESETS = {
+    'tiny':     {'stops': 500,   'routes': 40,   'trips': 2000,   'stops_per_trip': 12},
+    'small':    {'stops': 3000,  'routes': 200,  'trips': 10000,  'stops_per_trip': 20},
+    'medium':   {'stops': 10000, 'routes': 800,  'trips': 60000,  'stops_per_trip': 25},
+    'national': {'stops': 30000, 'routes': 3000, 'trips': 300000, 'stops_per_trip': 30},
+}
+
+DAY_COLUMNS = ('sunday', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday')
+
+# מספר הקווים והתחנות שנכנסים לקובץ config.ini הסינתטי
+CONFIG_ROUTES = 14
+CONFIG_STOPS = 6
+
+
+def _write_table(zfile, file_name, header, rows):
+    """כותב טבלה ל-ZIP עם BOM ו-CRLF, כמו ב-Feed האמיתי."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+    writer.writerow(['\ufeff' + header[0]] + list(header[1:]))
+    writer.writerows(rows)
+    zfile.writestr(file_name, buffer.getvalue().encode('utf-8'))
+
+
+def _format_time(seconds):
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def generate_feed(zip_path, stops, routes, trips, stops_per_trip, services=40, seed=1, start_date=None):
+    """
+    מייצר gtfs.zip סינתטי ומחזיר (target_routes, stop_codes) שמתאימים לכתיבת config.ini.
+    מספר שורות stop_times.txt הוא בערך trips * stops_per_trip.
+    """
+    rng = random.Random(seed)
+    start_date = start_date or date.today()
+
+    # תחנות מפוזרות סביב חדרה, עם קודים בני 5 ספרות
+    stop_rows = []
+    for s in range(stops):
+        stop_rows.append((
+            str(100000 + s), str(10000 + s), f"תחנה {s}", '',
+            f"{32.2 + rng.random() * 0.4:.6f}", f"{34.8 + rng.random() * 0.4:.6f}", '0', '', str(rng.randint(1, 30))
+        ))
+
+    route_names = [f"{r + 1}" if r % 5 else f"{r + 1}א" for r in range(routes)]
+    route_rows = [(str(r + 1), str(r % 25 + 1), name, f"קו {name}", '', '3', '') for r, name in enumerate(route_names)]
+
+    calendar_rows = []
+    for s in range(services):
+        days = [rng.randint(0, 1) for _ in DAY_COLUMNS]
+        first = start_date - timedelta(days=rng.randint(0, 30))
+        last = start_date + timedelta(days=rng.randint(7, 90))
+        calendar_rows.append((str(s + 1), *days, first.strftime('%Y%m%d'), last.strftime('%Y%m%d')))
+
+    calendar_dates_rows = [
+        (str(rng.randint(1, services)), (start_date + timedelta(days=rng.randint(0, 30))).strftime('%Y%m%d'), str(rng.randint(1, 2)))
+        for _ in range(services // 2)
+    ]
+
+    # כל קו עובר ברצף קבוע של תחנות (דפוס), וה-Trips שלו חוזרים עליו בשעות שונות
+    route_patterns = [rng.sample(range(stops), min(stops, stops_per_trip)) for _ in range(routes)]
+
+    trip_rows = []
+    stop_times_rows = []
+    for t in range(trips):
+        route = rng.randrange(routes)
+        trip_id = f"{t + 1}_{start_date.strftime('%d%m%y')}"
+        trip_rows.append((str(route + 1), str(rng.randint(1, services)), trip_id, f"יעד {route}", str(t % 2), str(route + 1)))
+
+        departure = rng.randint(4 * 3600, 25 * 3600)
+        for sequence, stop in enumerate(route_patterns[route], start=1):
+            stop_time = _format_time(departure + (sequence - 1) * rng.randint(60, 180))
+            stop_times_rows.append((trip_id, stop_time, stop_time, stop_rows[stop][0], str(sequence), '0', '0', ''))
+
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zfile:
+        _write_table(zfile, 'agency.txt', ('agency_id', 'agency_name', 'agency_url', 'agency_timezone'),
+                     [(str(a + 1), f"מפעיל {a + 1}", 'http://example.com', 'Asia/Jerusalem') for a in range(25)])
+        _write_table(zfile, 'calendar.txt', ('service_id', *DAY_COLUMNS, 'start_date', 'end_date'), calendar_rows)
+        _write_table(zfile, 'calendar_dates.txt', ('service_id', 'date', 'exception_type'), calendar_dates_rows)
+        _write_table(zfile, 'stops.txt', ('stop_id', 'stop_code', 'stop_name', 'stop_desc', 'stop_lat', 'stop_lon',
+                                          'location_type', 'parent_station', 'zone_id'), stop_rows)
+        _write_table(zfile, 'routes.txt', ('route_id', 'agency_id', 'route_short_name', 'route_long_name',
+                                           'route_desc', 'route_type', 'route_color'), route_rows)
+        _write_table(zfile, 'trips.txt', ('route_id', 'service_id', 'trip_id', 'trip_headsign', 'direction_id', 'shape_id'), trip_rows)
+        _write_table(zfile, 'stop_times.txt', ('trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence',
+                                               'pickup_type', 'drop_off_type', 'shape_dist_traveled'), stop_times_rows)
+
+    # הקונפיג: תחנות מהדפוסים של הקווים הנבחרים, כדי שהפלט לא יהיה ריק
+    target_routes = route_names[:CONFIG_ROUTES]
+    stop_codes = sorted({stop_rows[route_patterns[r][len(route_patterns[r]) // 2]][1] for r in range(min(routes, CONFIG_STOPS))})
+    return target_routes, stop_codes
+
+
+def write_config(config_path, target_routes, stop_codes):
+    """כותב config.ini בפורמט של הפרויקט."""
+    with open(config_path, 'w', encoding='utf-8') as f:
+        f.write('[LINES]\n')
+        f.writelines(f"{route}= 1\n" for route in target_routes)
+        f.write('\n[STOP_CODES]\n')
+        f.writelines(f"{code}= 1\n" for code in stop_codes)
+
+
+def generate_preset(output_dir, preset, seed=1, start_date=None):
+    """מייצר gtfs.zip + config.ini לגודל מוכן בתיקייה output_dir ומחזיר את נתיב ה-ZIP."""
+    os.makedirs(output_dir, exist_ok=True)
+    zip_path = os.path.join(output_dir, 'gtfs.zip')
+    target_routes, stop_codes = generate_feed(zip_path, seed=seed, start_date=start_date, **PRESETS[preset])
+    write_config(os.path.join(output_dir, 'config.ini'), target_routes, stop_codes)
+    return zip_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic GTFS feed.")
+    parser.add_argument('output_dir', help="Directory for gtfs.zip and config.ini.")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    parser.add_argument('--stops', type=int)
+    parser.add_argument('--routes', type=int)
+    parser.add_argument('--trips', type=int)
+    parser.add_argument('--stops-per-trip', type=int)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    scale = dict(PRESETS[args.preset])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    zip_path = os.path.join(args.output_dir, 'gtfs.zip')
+    routes, codes = generate_feed(zip_path, seed=args.seed, **scale)
+    write_config(os.path.join(args.output_dir, 'config.ini'), routes, codes)
+    print(f"SUCCESS: Wrote {zip_path} ({os.path.getsize(zip_path)} bytes) with scale {scale}.")
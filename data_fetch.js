@@ -2,6 +2,9 @@
 
 // הגדרת קבוע עבור URL בלבד, כיוון שהוא מיוחד לקובץ זה
 const GITHUB_RAW_URL = "https://raw.githubusercontent.com/ahstern100/BusTimes/main/schedule2.txt"; 
+// ה-Manifest וה-Patch מהבנייה הקודמת (ראו schedule_delta.py) - מאפשרים להוריד רק את השינויים
+const GITHUB_MANIFEST_URL = GITHUB_RAW_URL.replace(/\.txt$/, ".manifest.json");
+const GITHUB_PATCH_BASE_URL = GITHUB_RAW_URL.slice(0, GITHUB_RAW_URL.lastIndexOf("/") + 1);
 
 // *** עדכון ערכי המפתחות הגלובליים שהוצהרו ב-utils.js ***
 // (אין const/let/var כאן כדי למנוע את שגיאת הכפילות)
@@ -43,7 +46,91 @@ function init() {
     }
 }
 
+async function sha256Hex(text) {
+    // crypto.subtle זמין רק בהקשר מאובטח (https) - בלעדיו מורידים את הקובץ המלא
+    if (!window.crypto || !crypto.subtle) return null;
+    const digest = await crypto.subtle.digest("SHA-256", new TextEncoder().encode(text));
+    return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, "0")).join("");
+}
+
+function applySchedulePatch(oldText, patch) {
+    // אותו אלגוריתם כמו apply_schedule_patch ב-schedule_delta.py
+    const oldDays = {};
+    for (const line of oldText ? oldText.split("\n") : []) {
+        const parts = line.split("|");
+        const dayPart = parts.pop();
+        const colon = dayPart.indexOf(":");
+        const day = dayPart.slice(0, colon);
+        (oldDays[day] = oldDays[day] || []).push(`${parts.join("|")}|${dayPart.slice(colon)}`);
+    }
+
+    const lines = [];
+    for (const dayPatch of patch.days) {
+        const source = oldDays[String(dayPatch.source)] || [];
+        // ה-'|' האחרון ולא ה-"|:" הראשון: שם תחנה יכול להתחיל ב-':'
+        const withDay = entry => {
+            const cut = entry.lastIndexOf("|") + 1;
+            return `${entry.slice(0, cut)}${dayPatch.day}${entry.slice(cut)}`;
+        };
+        for (const op of dayPatch.ops) {
+            if (typeof op === "string") {
+                lines.push(withDay(op));
+            } else {
+                source.slice(op[0], op[0] + op[1]).forEach(entry => lines.push(withDay(entry)));
+            }
+        }
+    }
+    return lines.join("\n");
+}
+
+async function fetchPatchedData() {
+    // מחזיר את הלוח העדכני בלי להוריד את הקובץ המלא (אם אפשר), אחרת null
+    const storedData = localStorage.getItem(STORAGE_KEY_DATA);
+    if (!storedData) return null;
+
+    const storedHash = await sha256Hex(storedData);
+    if (!storedHash) return null;
+
+    const manifestResponse = await fetch(GITHUB_MANIFEST_URL, { cache: "no-cache" });
+    if (!manifestResponse.ok) return null;
+    const manifest = await manifestResponse.json();
+
+    if (manifest.snapshot.sha256 === storedHash) {
+        logDebug("DEBUG: Stored schedule matches the published snapshot. Nothing to download.");
+        return storedData;
+    }
+    if (!manifest.patch || manifest.patch.from_sha256 !== storedHash) {
+        logDebug("DEBUG: No patch from the stored schedule. Falling back to the full download.");
+        return null;
+    }
+
+    const patchResponse = await fetch(GITHUB_PATCH_BASE_URL + manifest.patch.path, { cache: "no-cache" });
+    if (!patchResponse.ok) return null;
+    const patchedData = applySchedulePatch(storedData, await patchResponse.json());
+
+    if (await sha256Hex(patchedData) !== manifest.snapshot.sha256) {
+        logDebug("WARNING: Patched schedule does not match the published sha256. Falling back to the full download.");
+        return null;
+    }
+    logDebug(`DEBUG: Applied ${manifest.patch.bytes} byte patch (${manifest.patch.new_lines} new lines) instead of downloading ${manifest.snapshot.bytes} bytes.`);
+    return patchedData;
+}
+
 async function fetchData() {
+    let patchedData = null;
+    try {
+        patchedData = await fetchPatchedData();
+    } catch (error) {
+        logDebug(`WARNING: Incremental update failed (${error.message}). Falling back to the full download.`);
+    }
+    if (patchedData !== null) {
+        localStorage.setItem(STORAGE_KEY_DATA, patchedData);
+        localStorage.setItem(STORAGE_KEY_DATE, TODAY);
+        showFloatingMessage("✔ לוח זמנים שבועי עודכן בהצלחה.");
+        loadData();
+        return;
+    }
+
     logDebug(`DEBUG: Fetching data from ${GITHUB_RAW_URL}`);
     try {
         const response = await fetch(GITHUB_RAW_URL);
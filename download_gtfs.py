@@ -1,8 +1,15 @@
 import os
+import argparse
 from datetime import datetime
 # ייבוא: מחליפים את gtfs_parser ב-weekly_parser, שהוא קובץ ה-Wrapper החדש
 import weekly_parser 
 import subprocess 
+from pipeline_stats import get_report_path
+from schedule_format import get_compact_path
+from trip_patterns import get_pairs_path
+from stop_departures import get_stops_path
+from schedule_delta import get_patch_path, get_manifest_path
+import feed_download
 
 # --- הגדרות ---
 OUTPUT_FILENAME = "gtfs.zip"
@@ -11,13 +18,42 @@ OUTPUT_SCHEDULE_FILENAME = "schedule2.txt"
 
 
 if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Generate the weekly schedule from the downloaded GTFS zip.")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for scanning stop_times.txt (default: 1).")
+    parser.add_argument('--engine', choices=('zip', 'cache', 'index'), default=None,
+                        help="Feed engine (default: 'cache', or 'zip' when --workers > 1).")
+    parser.add_argument('--download', action='store_true', help="Download the feed first (conditional and resumable).")
+    parser.add_argument('--insecure', action='store_true', help="Skip TLS certificate verification when downloading.")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the feed, config and date are unchanged.")
+    parser.add_argument('--compact', action='store_true', help="Also write the compact schedule (schedule2.json, .gz, .br).")
+    parser.add_argument('--delta', action='store_true', help="Also write a patch from the previous schedule and a manifest (schedule2.patch.json, schedule2.manifest.json).")
+    args = parser.parse_args()
+    engine = args.engine or ('zip' if args.workers > 1 else 'cache')
     
     commit_msg = f"GTFS Weekly Schedule Update for {datetime.now().strftime('%Y-%m-%d')}"
     files_to_commit = ""
 
+    # --- שלב ההורדה (אופציונלי): מוריד רק אם ה-Feed השתנה ---
+    if args.download:
+        try:
+            feed_download.download_feed(feed_download.FEED_URL, OUTPUT_FILENAME, insecure=args.insecure)
+        except Exception as e:
+            # כמו בהורדה עם cURL: כישלון בהורדה מכשיל את ה-Action
+            print(f"FATAL ERROR: Feed download failed: {e}")
+            raise SystemExit(1)
+
+    # מפתח הבנייה: SHA-256 של ה-Feed והקונפיג + התאריך
+    build_key = None
+    if os.path.exists(OUTPUT_FILENAME):
+        build_key = feed_download.get_build_key(feed_download.file_sha256(OUTPUT_FILENAME))
+
     # *** קובץ GTFS.zip צריך להיות קיים ***
-    if not os.path.exists(OUTPUT_FILENAME):
+    if build_key is None:
         print(f"FATAL ERROR: Downloaded file {OUTPUT_FILENAME} not found. Aborting parsing.")
+    elif not args.force and os.path.exists(OUTPUT_SCHEDULE_FILENAME) and feed_download.is_build_current(build_key):
+        # אותו Feed, אותו קונפיג ואותו יום - הפלט הקיים כבר נכון, אין מה לבנות או לבצע Commit
+        print("INFO: Feed, config and date are unchanged since the last build. Skipping parsing.")
     else:
         
         # --- שלב הפארסינג ---
@@ -26,8 +62,9 @@ if __name__ == '__main__':
 
         try:
             # *** שינוי קריטי: קוראים לפונקציה הראשית של weekly_parser.py ***
-            weekly_parser.generate_weekly_schedule(OUTPUT_FILENAME, OUTPUT_SCHEDULE_FILENAME)
+            weekly_parser.generate_weekly_schedule(OUTPUT_FILENAME, OUTPUT_SCHEDULE_FILENAME, engine=engine, workers=args.workers, compact=args.compact, delta=args.delta)
             print("INFO: Attempted to generate weekly schedule.")
+            feed_download.record_build(build_key)
         except Exception as e:
             # אם יש שגיאה ב-Parser, היא תודפס כאן!
             print(f"CRITICAL ERROR in Weekly Parser: {e}")
@@ -45,6 +82,26 @@ if __name__ == '__main__':
         # מכיוון שרק schedule2.txt נוצר, רק אותו נבקש לבצע Commit
         if schedule_generated:
             files_to_commit = OUTPUT_SCHEDULE_FILENAME
+            # דוח המדידות נשמר יחד עם הפלט כדי להשוות בין הרצות
+            if os.path.exists(get_report_path(OUTPUT_SCHEDULE_FILENAME)):
+                files_to_commit += f" {get_report_path(OUTPUT_SCHEDULE_FILENAME)}"
+            # היציאות בתחנות שבקונפיג עצמן
+            if os.path.exists(get_stops_path(OUTPUT_SCHEDULE_FILENAME)):
+                files_to_commit += f" {get_stops_path(OUTPUT_SCHEDULE_FILENAME)}"
+            # הנסיעות הישירות בין הזוגות שב-[PAIRS] (אם הוגדרו)
+            if os.path.exists(get_pairs_path(OUTPUT_SCHEDULE_FILENAME)):
+                files_to_commit += f" {get_pairs_path(OUTPUT_SCHEDULE_FILENAME)}"
+            # הפורמט הקומפקטי וגרסאותיו הדחוסות (רק אלה שנכתבו)
+            if args.compact:
+                compact_path = get_compact_path(OUTPUT_SCHEDULE_FILENAME)
+                for path in (compact_path, f"{compact_path}.gz", f"{compact_path}.br"):
+                    if os.path.exists(path):
+                        files_to_commit += f" {path}"
+            # ה-Manifest וה-Patch מהפלט הקודם (אם נכתב; בלעדיו ה-Manifest מפנה רק לקובץ המלא)
+            if args.delta:
+                for path in (get_manifest_path(OUTPUT_SCHEDULE_FILENAME), get_patch_path(OUTPUT_SCHEDULE_FILENAME)):
+                    if os.path.exists(path):
+                        files_to_commit += f" {path}"
         
     
     # --- הגדרת המשתנים כהדפסה פשוטה לקונסולה ---
@@ -0,0 +1,206 @@
+# feed_download.py
+import os
+import ssl
+import json
+import hashlib
+import argparse
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+# ----------------------------------------------------
+# הורדת ה-Feed עם זיהוי שינויים: בקשות מותנות (ETag / Last-Modified), המשך הורדה חלקית
+# (Range), כתיבה לדיסק בזרימה עם זיכרון חסום, ושמירת SHA-256 של ה-Feed ושל הקונפיג
+# כדי לדלג על בנייה חוזרת באותו יום כשלא השתנה דבר. בכל יום חדש הבנייה רצה תמיד:
+# הימים בפלט הם offsets מיום הבנייה, ולכן הפלט משתנה גם כשה-Feed והקונפיג לא השתנו.
+# ----------------------------------------------------
+
+FEED_URL = "https://gtfs.mot.gov.il/gtfsfiles/israel-public-transportation.zip"
+ZIP_FILE = 'gtfs.zip'
+META_FILE = 'gtfs.meta.json'
+CONFIG_FILE = 'config.ini'
+
+# שימוש ב-User-Agent ייחודי ומתאים לבוטים (Googlebot), כמו בהורדה עם cURL
+USER_AGENT = 'Googlebot'
+CHUNK_SIZE = 1024 * 1024
+# קובץ GTFS אמור להיות גדול מ-1MB; קובץ קטן יותר הוא כנראה דף שגיאה ב-HTML
+MIN_FEED_BYTES = 1000000
+
+
+def load_meta(meta_path=META_FILE):
+    """טוען את המטא-דאטה של ההורדה/הבנייה הקודמת (מילון ריק אם אין)."""
+    if not os.path.exists(meta_path):
+        return {}
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"WARNING: Failed to read {meta_path}: {e}. Ignoring previous metadata.")
+        return {}
+
+
+def save_meta(meta, meta_path=META_FILE):
+    """שומר את המטא-דאטה באופן אטומי."""
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+def file_sha256(path):
+    """SHA-256 של קובץ, בקריאה בחלקים."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _open(request, insecure, timeout):
+    context = ssl._create_unverified_context() if insecure else None
+    try:
+        return urllib.request.urlopen(request, timeout=timeout, context=context)
+    except urllib.error.HTTPError as e:
+        # 304 ו-416 הן תשובות צפויות כאן ולא שגיאות
+        if e.code in (304, 416):
+            return e
+        raise
+
+
+def download_feed(url=FEED_URL, zip_path=ZIP_FILE, meta_path=META_FILE, insecure=False, timeout=60, min_bytes=MIN_FEED_BYTES):
+    """
+    מוריד את ה-Feed רק אם השתנה. מחזיר {'changed': bool, 'sha256': str, 'bytes': int}.
+    - בקשה מותנית נשלחת רק אם הקובץ המקומי תואם ל-SHA-256 שנשמר בהורדה הקודמת.
+    - הורדה שנקטעה נשמרת ב-<zip>.part וממשיכה מהמקום שבו נעצרה (Range + If-Range).
+    """
+    meta = load_meta(meta_path)
+    part_path = f"{zip_path}.part"
+    headers = {'User-Agent': USER_AGENT}
+
+    local_is_current = (
+        meta.get('url') == url and meta.get('sha256') and os.path.exists(zip_path)
+        and file_sha256(zip_path) == meta['sha256']
+    )
+    if local_is_current:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    # המשך הורדה חלקית, רק אם יש לנו מזהה גרסה (validator) של אותה הורדה
+    partial = meta.get('partial') or {}
+    resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = partial.get('etag') or partial.get('last_modified')
+    if resume_from and partial.get('url') == url and validator:
+        headers['Range'] = f"bytes={resume_from}-"
+        headers['If-Range'] = validator
+    else:
+        resume_from = 0
+
+    print(f"INFO: Requesting {url} (conditional: {bool(local_is_current)}, resume from byte {resume_from}).")
+    response = _open(urllib.request.Request(url, headers=headers), insecure, timeout)
+
+    with response:
+        status = response.status if hasattr(response, 'status') else response.code
+
+        if status == 304:
+            print("INFO: Feed not modified since the last download.")
+            return {'changed': False, 'sha256': meta['sha256'], 'bytes': os.path.getsize(zip_path)}
+
+        if status == 416:
+            # ה-part כבר שלם או לא תואם - מתחילים מחדש בפעם הבאה
+            os.remove(part_path)
+            raise Exception("Server rejected the resume range. Partial download discarded; retry the download.")
+
+        digest = hashlib.sha256()
+        if status == 206:
+            print(f"INFO: Resuming download at byte {resume_from}.")
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            mode = 'ab'
+        else:
+            mode = 'wb'
+
+        # שמירת ה-validator לפני הזרמת הגוף, כדי שאפשר יהיה להמשיך אם ההורדה תיקטע
+        meta['partial'] = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        save_meta(meta, meta_path)
+
+        content_length = response.headers.get('Content-Length')
+        expected_size = (resume_from if status == 206 else 0) + int(content_length) if content_length else None
+
+        with open(part_path, mode) as f:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size != expected_size:
+        # ה-part וה-validator נשארים על הדיסק - ההרצה הבאה תמשיך מהבית הזה
+        raise Exception(f"Download interrupted at {size}/{expected_size} bytes. Run again to resume.")
+
+    with open(part_path, 'rb') as f:
+        signature = f.read(4)
+    if size < min_bytes or signature != b'PK\x03\x04':
+        os.remove(part_path)
+        meta.pop('partial', None)
+        save_meta(meta, meta_path)
+        raise Exception(f"Downloaded file size ({size} bytes) is too small or not a zip. Probably received an HTML error.")
+
+    sha256 = digest.hexdigest()
+    changed = sha256 != meta.get('sha256')
+    os.replace(part_path, zip_path)
+
+    meta.pop('partial', None)
+    meta.update({
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'sha256': sha256,
+        'bytes': size,
+        'downloaded_at': datetime.now().isoformat(timespec='seconds'),
+    })
+    save_meta(meta, meta_path)
+    print(f"SUCCESS: GTFS file downloaded. Size: {size} bytes. Changed: {changed}.")
+    return {'changed': changed, 'sha256': sha256, 'bytes': size}
+
+
+def get_build_key(feed_sha256, config_path=CONFIG_FILE, build_date=None):
+    """
+    מפתח הבנייה: ה-Feed, הקונפיג, ותאריך תחילת החלון השבועי
+    (הפלט מבוסס על offsets מהיום, ולכן הוא משתנה גם כשה-Feed והקונפיג לא השתנו).
+    לכן is_build_current חוסך רק הרצה חוזרת באותו יום (הרצה ידנית, או ניסיון חוזר אחרי כישלון).
+    """
+    config_sha256 = file_sha256(config_path) if os.path.exists(config_path) else None
+    return {
+        'feed_sha256': feed_sha256,
+        'config_sha256': config_sha256,
+        'build_date': (build_date or datetime.now()).strftime('%Y%m%d'),
+    }
+
+
+def is_build_current(build_key, meta_path=META_FILE):
+    """True אם הבנייה האחרונה נעשתה בדיוק עם אותו Feed, אותו קונפיג ובאותו יום."""
+    return load_meta(meta_path).get('build') == build_key
+
+
+def record_build(build_key, meta_path=META_FILE):
+    """שומר את מפתח הבנייה המוצלחת האחרונה."""
+    meta = load_meta(meta_path)
+    meta['build'] = build_key
+    save_meta(meta, meta_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Download the GTFS feed only if it changed.")
+    parser.add_argument('--url', default=FEED_URL)
+    parser.add_argument('--output', default=ZIP_FILE)
+    parser.add_argument('--insecure', action='store_true', help="Skip TLS certificate verification (like curl -k).")
+    args = parser.parse_args()
+
+    result = download_feed(args.url, args.output, insecure=args.insecure)
+    print(f"ACTION_OUTPUT_FEED_CHANGED:{str(result['changed']).lower()}")
@@ -0,0 +1,309 @@
+# gtfs_cache.py
+import os
+import json
+import shutil
+import hashlib
+import zipfile
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # numpy אינו חובה - ללא numpy ה-Pipeline עובד ישירות מול ה-ZIP
+    np = None
+
+from gtfs_utils import iter_csv_columns, list_zip_contents, load_service_calendar, stop_time_seconds, extract_weekly_stop_departures
+from service_calendar import ServiceCalendar, parse_gtfs_date
+from schedule_table import WeeklySchedule, parse_gtfs_time
+
+# ----------------------------------------------------
+# Cache עמודתי של ה-Feed: המרה חד-פעמית של ה-ZIP למערכים בינאריים
+# (מזהים ממוספרים, זמנים כשניות מחצות) שנקראים ב-memory map.
+# ----------------------------------------------------
+
+CACHE_DIR = '.gtfs_cache'
+CACHE_VERSION = 3
+# ימי החלון נשמרים כביטים ב-uint64 לכל Trip, ולכן חלון של ה-Cache מוגבל ל-64 ימים
+MAX_WINDOW_DAYS = 64
+
+
+def is_cache_available():
+    """ה-Cache דורש numpy. מחזיר False אם הספרייה לא מותקנת."""
+    return np is not None
+
+
+def get_feed_key(zip_path, use_hash=False):
+    """
+    מחשב מפתח ל-Feed: לפי גודל ו-mtime של הקובץ (מהיר), או לפי SHA-256 של התוכן (use_hash=True).
+    """
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    if use_hash:
+        with open(zip_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    else:
+        stat = os.stat(zip_path)
+        digest.update(f"{os.path.abspath(zip_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+class _Interner:
+    """ממספר מחרוזות (0, 1, 2, ...) לפי סדר ההופעה הראשונה."""
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def add(self, value):
+        """מוסיף ערך חדש ומחזיר True, או False אם הערך כבר קיים (שורה כפולה)."""
+        if value in self.index:
+            return False
+        self.index[value] = len(self.values)
+        self.values.append(value)
+        return True
+
+
+def build_feed_cache(zip_path, cache_path):
+    """קורא את ה-ZIP פעם אחת וכותב את כל הטבלאות הנדרשות כמערכים עמודתיים ל-cache_path."""
+    print(f"INFO: Building columnar feed cache for {zip_path} in {cache_path}.")
+    tmp_path = f"{cache_path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    services = _Interner()
+    stops = _Interner()
+    routes = _Interner()
+    trips = _Interner()
+
+    with zipfile.ZipFile(zip_path, 'r') as zfile:
+        zip_contents = list_zip_contents(zfile)
+        for required in ('stops.txt', 'routes.txt', 'trips.txt', 'stop_times.txt'):
+            if required not in zip_contents: raise Exception(f"File {required} is not in the archive!")
+
+        # 1. calendar.txt + calendar_dates.txt -> Bitmap של שירות x תאריך
+        service_calendar = load_service_calendar(zfile, zip_contents)
+        for service_id in service_calendar.service_ids:
+            services.add(service_id)
+
+        # 2. stops.txt
+        stop_codes = []
+        stop_names = []
+        for stop_id, stop_code, stop_name in iter_csv_columns(zfile, 'stops.txt', ('stop_id', 'stop_code', 'stop_name')):
+            if stops.add(stop_id):
+                stop_codes.append(stop_code)
+                stop_names.append(stop_name.strip())
+
+        # 3. routes.txt
+        route_short_names = []
+        for route_id, route_short_name in iter_csv_columns(zfile, 'routes.txt', ('route_id', 'route_short_name')):
+            if routes.add(route_id):
+                route_short_names.append(route_short_name)
+
+        # 4. trips.txt (-1 = קו/שירות שלא מופיע בטבלאות)
+        trip_route = array('i')
+        trip_service = array('i')
+        for route_id, service_id, trip_id in iter_csv_columns(zfile, 'trips.txt', ('route_id', 'service_id', 'trip_id')):
+            if trips.add(trip_id):
+                trip_route.append(routes.index.get(route_id, -1))
+                trip_service.append(services.index.get(service_id, -1))
+
+        # 5. stop_times.txt - עמודות trip/stop/יציאה לכל השורות, ושורות המוצא (stop_sequence=1) בנפרד
+        st_trip = array('i')
+        st_stop = array('i')
+        st_departure = array('i')
+        first_row = array('i')
+        first_departure = array('i')
+        stop_times_data = iter_csv_columns(zfile, 'stop_times.txt', ('trip_id', 'departure_time', 'stop_id', 'stop_sequence', 'arrival_time'))
+        for row_number, (trip_id, departure_time, stop_id, stop_sequence, arrival_time) in enumerate(stop_times_data):
+            st_trip.append(trips.index.get(trip_id, -1))
+            st_stop.append(stops.index.get(stop_id, -1))
+            st_departure.append(stop_time_seconds(departure_time, arrival_time))
+            if stop_sequence == '1':
+                first_row.append(row_number)
+                first_departure.append(parse_gtfs_time(departure_time))
+
+    arrays = {
+        'trip_route': np.frombuffer(trip_route, dtype=np.int32),
+        'trip_service': np.frombuffer(trip_service, dtype=np.int32),
+        'st_trip': np.frombuffer(st_trip, dtype=np.int32),
+        'st_stop': np.frombuffer(st_stop, dtype=np.int32),
+        'st_departure': np.frombuffer(st_departure, dtype=np.int32),
+        'first_row': np.frombuffer(first_row, dtype=np.int32),
+        'first_departure': np.frombuffer(first_departure, dtype=np.int32),
+    }
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+
+    strings = {
+        'service_ids': services.values,
+        'stop_ids': stops.values,
+        'stop_codes': stop_codes,
+        'stop_names': stop_names,
+        'route_ids': routes.values,
+        'route_short_names': route_short_names,
+        'trip_ids': trips.values,
+    }
+    with open(os.path.join(tmp_path, 'service_calendar.json'), 'w', encoding='utf-8') as f:
+        json.dump(service_calendar.to_dict(), f, ensure_ascii=False)
+    # strings.json נכתב אחרון ומשמש כסימן לכך שה-Cache שלם
+    with open(os.path.join(tmp_path, 'strings.json'), 'w', encoding='utf-8') as f:
+        json.dump(strings, f, ensure_ascii=False)
+
+    # החלפה אטומית - Cache חלקי לעולם לא ייקרא
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.rename(tmp_path, cache_path)
+    print(f"DEBUG: Cached {len(trips.values)} trips, {len(st_trip)} stop_times rows, {len(first_row)} departures.")
+
+
+def load_feed_cache(zip_path, cache_dir=CACHE_DIR, use_hash=False):
+    """
+    מחזיר FeedCache עבור ה-ZIP. בונה את ה-Cache רק אם ה-Feed השתנה (לפי get_feed_key).
+    מחזיר None אם numpy לא מותקן.
+    """
+    if not is_cache_available():
+        print("WARNING: numpy is not installed. Feed cache is disabled.")
+        return None
+
+    key = get_feed_key(zip_path, use_hash=use_hash)
+    cache_path = os.path.join(cache_dir, key)
+
+    if not os.path.exists(os.path.join(cache_path, 'strings.json')):
+        os.makedirs(cache_dir, exist_ok=True)
+        # מחיקת Cache-ים ישנים של Feed-ים קודמים
+        for old_key in os.listdir(cache_dir):
+            shutil.rmtree(os.path.join(cache_dir, old_key), ignore_errors=True)
+        build_feed_cache(zip_path, cache_path)
+    else:
+        print(f"INFO: Using feed cache {cache_path}.")
+
+    return FeedCache(cache_path)
+
+
+class FeedCache:
+    """
+    גישה ל-Cache העמודתי. המתודות מקבילות לשלבים ב-gtfs_utils,
+    אבל מסננות מערכים (vectorized) במקום לקרוא CSV.
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        with open(os.path.join(cache_path, 'strings.json'), encoding='utf-8') as f:
+            self.strings = json.load(f)
+        with open(os.path.join(cache_path, 'service_calendar.json'), encoding='utf-8') as f:
+            self.service_calendar = ServiceCalendar.from_dict(json.load(f))
+        for name in ('trip_route', 'trip_service', 'st_trip', 'st_stop', 'st_departure', 'first_row', 'first_departure'):
+            setattr(self, name, np.load(os.path.join(cache_path, f"{name}.npy"), mmap_mode='r'))
+
+    def map_service_ids_for_days(self, week_days):
+        """
+        week_days: רשימה של (day_offset, date_str).
+        service_id -> tuple של ה-offsets שבהם הוא פעיל (כמו gtfs_utils.map_service_ids_for_days).
+        """
+        window_days = max((day_offset for day_offset, _ in week_days), default=-1) + 1
+        if window_days > MAX_WINDOW_DAYS:
+            raise Exception(f"A window of {window_days} days is too long for the feed cache (max {MAX_WINDOW_DAYS}). Use the zip or index engine.")
+        service_offsets = self.service_calendar.service_offsets(
+            [(day_offset, parse_gtfs_date(date_str)) for day_offset, date_str in week_days]
+        )
+        print(f"DEBUG: Found {len(service_offsets)} service IDs active during the window.")
+        return service_offsets
+
+    def map_stop_info(self):
+        """מחזיר (stop_id_to_info, stop_code_to_ids) כמו gtfs_utils.map_stop_info."""
+        stop_id_to_info = {}
+        stop_code_to_ids = {}
+        for s_id, s_code, s_name in zip(self.strings['stop_ids'], self.strings['stop_codes'], self.strings['stop_names']):
+            stop_id_to_info[s_id] = {'code': s_code if s_code else s_id, 'name': s_name}
+            if s_code:
+                stop_code_to_ids.setdefault(s_code, []).append(s_id)
+        print(f"DEBUG: Mapped {len(stop_id_to_info)} stops. Found {len(stop_code_to_ids)} unique stop codes.")
+        return stop_id_to_info, stop_code_to_ids
+
+    def _stop_indices(self, stop_ids):
+        lookup = {s_id: idx for idx, s_id in enumerate(self.strings['stop_ids'])}
+        return np.array([lookup[s_id] for s_id in stop_ids if s_id in lookup], dtype=np.int32)
+
+    def find_relevant_trips_by_stops(self, critical_stop_ids):
+        """מחזיר מסכה בוליאנית על ה-Trips שעוברים באחת התחנות, או None אם אין סינון גיאוגרפי."""
+        if not critical_stop_ids:
+            print("WARNING: CRITICAL_STOP_IDS is empty after conversion. Proceeding without geographic filtering.")
+            return None
+        hits = np.isin(self.st_stop, self._stop_indices(critical_stop_ids))
+        trip_indices = self.st_trip[hits]
+        relevant = np.zeros(len(self.trip_route), dtype=bool)
+        relevant[trip_indices[trip_indices >= 0]] = True
+        print(f"DEBUG: Identified {int(relevant.sum())} trips that pass through the critical stops (using mapped IDs).")
+        return relevant
+
+    def map_trip_days(self, service_offsets, relevant_trips, target_routes):
+        """
+        מחזיר מערך (לפי אינדקס Trip) של ביטים: ביט d דולק אם ה-Trip רלוונטי ב-offset d.
+        """
+        service_bits = np.zeros(len(self.strings['service_ids']) + 1, dtype=np.uint64)
+        service_lookup = {s_id: idx for idx, s_id in enumerate(self.strings['service_ids'])}
+        for service_id, offsets in service_offsets.items():
+            service_bits[service_lookup[service_id]] = sum(1 << offset for offset in offsets)
+
+        targets = set(target_routes)
+        route_ok = np.array([name in targets for name in self.strings['route_short_names']] + [False], dtype=bool)
+
+        # אינדקס -1 (לא נמצא) מצביע על התא האחרון, שהוא תמיד 0/False
+        trip_bits = service_bits[self.trip_service] * route_ok[self.trip_route]
+        if relevant_trips is not None:
+            trip_bits = trip_bits * relevant_trips
+        print(f"DEBUG: Identified {int(np.count_nonzero(trip_bits))} relevant trips for the window after filtering by stops and routes.")
+        return trip_bits
+
+    def extract_weekly_stop_times(self, trip_bits, stop_id_to_info):
+        """WeeklySchedule - באותו סדר כמו gtfs_utils.extract_weekly_stop_times."""
+        weekly_schedule = WeeklySchedule()
+        strings = weekly_schedule.strings
+        first_trip = self.st_trip[self.first_row]
+        first_bits = np.where(first_trip >= 0, trip_bits[first_trip], 0)
+        kept = np.flatnonzero(first_bits)
+
+        stop_ids = self.strings['stop_ids']
+        route_short_names = self.strings['route_short_names']
+        first_stop = self.st_stop[self.first_row[kept]]
+        route_idx = self.trip_route[first_trip[kept]]
+
+        for bits, stop_idx, r_idx, seconds in zip(first_bits[kept].tolist(), first_stop.tolist(), route_idx.tolist(), self.first_departure[kept].tolist()):
+            if stop_idx < 0:
+                continue
+            stop_id = stop_ids[stop_idx]
+            stop_info = stop_id_to_info.get(stop_id)
+            if not stop_info:
+                continue
+            if seconds < 0:
+                continue
+            route = strings.route(route_short_names[r_idx])
+            stop = strings.stop(stop_id, stop_info)
+            minutes = seconds // 60
+            day_offset = 0
+            while bits:
+                if bits & 1:
+                    weekly_schedule[day_offset].add_minutes(route, stop, minutes)
+                bits >>= 1
+                day_offset += 1
+
+        return weekly_schedule
+
+    def extract_weekly_stop_departures(self, trip_bits, stop_id_to_info, critical_stop_ids):
+        """WeeklySchedule של היציאות בתחנות הקריטיות עצמן (כמו gtfs_utils.extract_weekly_stop_departures)."""
+        rows = np.flatnonzero(np.isin(self.st_stop, self._stop_indices(critical_stop_ids)))
+        row_trips = self.st_trip[rows]
+        row_bits = np.where(row_trips >= 0, trip_bits[row_trips], 0)
+        kept = np.flatnonzero(row_bits)
+        rows = rows[kept]
+
+        stop_ids = self.strings['stop_ids']
+        route_short_names = self.strings['route_short_names']
+        trip_days = {}
+        for trip, bits in zip(row_trips[kept].tolist(), row_bits[kept].tolist()):
+            if trip not in trip_days:
+                offsets = tuple(day_offset for day_offset in range(bits.bit_length()) if bits >> day_offset & 1)
+                trip_days[trip] = (route_short_names[self.trip_route[trip]], offsets)
+
+        # ה-Cache לא שומר stop_sequence (הפלט לא תלוי בו)
+        stop_rows = [(trip, stop_ids[stop], None, seconds) for trip, stop, seconds
+                     in zip(row_trips[kept].tolist(), self.st_stop[rows].tolist(), self.st_departure[rows].tolist())]
+        return extract_weekly_stop_departures(stop_rows, trip_days, stop_id_to_info)
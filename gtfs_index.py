@@ -0,0 +1,221 @@
+# gtfs_index.py
+import os
+import pickle
+import zipfile
+from array import array
+from collections import defaultdict
+
+from gtfs_utils import (
+    iter_csv_columns,
+    list_zip_contents,
+    load_service_calendar,
+    dedupe_service_days,
+    expand_service_days,
+    stop_time_seconds,
+    extract_weekly_stop_departures,
+)
+from gtfs_cache import get_feed_key
+from service_calendar import ServiceCalendar, parse_gtfs_date
+from schedule_table import WeeklySchedule, parse_departure_minutes
+
+# ----------------------------------------------------
+# אינדקס הפוך של ה-Feed: stop_code -> stop_ids -> trips -> (קו, שירות, שעת מוצא).
+# נבנה פעם אחת לכל Feed, כך ששינוי ב-[LINES] או [STOP_CODES] הוא רק חיפוש באינדקס.
+# ----------------------------------------------------
+
+INDEX_DIR = '.gtfs_index'
+INDEX_VERSION = 3
+
+
+class FeedIndex:
+    """
+    המבנה הנשמר (pickle). Trips ממוספרים לפי סדר trips.txt:
+    - service_calendar: ServiceCalendar (שירות x תאריך, כולל calendar_dates.txt)
+    - trip_ids[t], trip_route[t] (route_short_name), trip_service[t] (service_id)
+    - trip_first[t] = (stop_id, departure_time) של תחנת המוצא, או None
+    - trip_rank[t] = מיקום שורת המוצא ב-stop_times.txt (לשמירה על סדר הפלט המקורי)
+    - stop_trips[stop_id] = array של אינדקסי Trips שעוברים בתחנה
+    - stop_visits[stop_id] = array של זוגות (אינדקס Trip, שעת יציאה בשניות) לכל שורה בתחנה
+    - route_trips[route_short_name] = array של אינדקסי Trips של הקו
+    """
+
+    def __init__(self):
+        self.version = INDEX_VERSION
+        self.service_calendar = ServiceCalendar(None, [], [])
+        self.stop_info = {}
+        self.stop_code_to_ids = defaultdict(list)
+        self.trip_ids = []
+        self.trip_route = []
+        self.trip_service = []
+        self.trip_first = []
+        self.trip_rank = []
+        self.stop_trips = defaultdict(lambda: array('i'))
+        self.stop_visits = defaultdict(lambda: array('i'))
+        self.route_trips = defaultdict(lambda: array('i'))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['stop_code_to_ids'] = dict(self.stop_code_to_ids)
+        state['stop_trips'] = dict(self.stop_trips)
+        state['stop_visits'] = dict(self.stop_visits)
+        state['route_trips'] = dict(self.route_trips)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def convert_codes_to_ids(self, stop_codes):
+        """ממיר Stop Codes לכל ה-Stop IDs התואמים (כמו gtfs_utils.convert_codes_to_ids, ללא גלובליים)."""
+        converted_ids = set()
+        for code in stop_codes:
+            stop_ids = self.stop_code_to_ids.get(code)
+            if stop_ids:
+                converted_ids.update(stop_ids)
+            else:
+                print(f"WARNING: Critical Stop Code {code} not found in stops.txt. Ignoring.")
+        return converted_ids
+
+    def find_trips(self, target_routes, critical_stop_ids):
+        """מחזיר את אינדקסי ה-Trips של הקווים המבוקשים שעוברים בתחנות (או כולם, אם אין תחנות)."""
+        route_trips = set()
+        for route_short_name in target_routes:
+            route_trips.update(self.route_trips.get(route_short_name, ()))
+
+        if not critical_stop_ids:
+            print("WARNING: CRITICAL_STOP_IDS is empty after conversion. Proceeding without geographic filtering.")
+            return route_trips
+
+        stop_trips = set()
+        for stop_id in critical_stop_ids:
+            stop_trips.update(self.stop_trips.get(stop_id, ()))
+        return route_trips & stop_trips
+
+    def _offsets_by_service(self, week_days):
+        """ימים עם אותו סט שירותים מחושבים פעם אחת (כמו ב-weekly_parser). מחזיר (offsets_by_service, day_aliases)."""
+        return dedupe_service_days(self.service_calendar.service_offsets(
+            [(day['offset'], parse_gtfs_date(day['date_str'])) for day in week_days]
+        ))
+
+    def build_weekly_schedule(self, week_days, target_routes, stop_codes):
+        """
+        WeeklySchedule עבור סט קווים ותחנות כלשהו - באותו סדר
+        כמו gtfs_utils.extract_weekly_stop_times, בלי לקרוא את ה-Feed.
+        """
+        weekly_schedule = WeeklySchedule()
+        strings = weekly_schedule.strings
+        critical_stop_ids = self.convert_codes_to_ids(stop_codes)
+        trips = self.find_trips(target_routes, critical_stop_ids)
+        offsets_by_service, day_aliases = self._offsets_by_service(week_days)
+
+        for trip in sorted(trips, key=self.trip_rank.__getitem__):
+            first = self.trip_first[trip]
+            if first is None:
+                continue
+            offsets = offsets_by_service.get(self.trip_service[trip])
+            stop_id, departure_time = first
+            stop_info = self.stop_info.get(stop_id)
+            minutes = parse_departure_minutes(departure_time)
+            if not offsets or not stop_info or minutes < 0:
+                continue
+
+            route = strings.route(self.trip_route[trip])
+            stop = strings.stop(stop_id, stop_info)
+            for day_offset in offsets:
+                weekly_schedule[day_offset].add_minutes(route, stop, minutes)
+
+        print(f"DEBUG: Index lookup selected {len(trips)} trips for {len(target_routes)} routes and {len(stop_codes)} stop codes.")
+        return expand_service_days(weekly_schedule, day_aliases)
+
+    def build_weekly_stop_departures(self, week_days, target_routes, stop_codes):
+        """WeeklySchedule של היציאות בתחנות עצמן (כמו gtfs_utils.extract_weekly_stop_departures)."""
+        critical_stop_ids = self.convert_codes_to_ids(stop_codes)
+        if not critical_stop_ids:
+            return WeeklySchedule()
+        trips = self.find_trips(target_routes, critical_stop_ids)
+        offsets_by_service, day_aliases = self._offsets_by_service(week_days)
+
+        trip_days = {trip: (self.trip_route[trip], offsets_by_service[self.trip_service[trip]])
+                     for trip in trips if offsets_by_service.get(self.trip_service[trip])}
+        stop_rows = []
+        for stop_id in critical_stop_ids:
+            visits = self.stop_visits.get(stop_id, ())
+            stop_rows.extend((visits[i], stop_id, None, visits[i + 1]) for i in range(0, len(visits), 2))
+        return expand_service_days(extract_weekly_stop_departures(stop_rows, trip_days, self.stop_info), day_aliases)
+
+
+def build_feed_index(zip_path):
+    """מעבר יחיד על טבלאות ה-Feed ובניית FeedIndex."""
+    print(f"INFO: Building inverted feed index for {zip_path}.")
+    index = FeedIndex()
+
+    with zipfile.ZipFile(zip_path, 'r') as zfile:
+        zip_contents = list_zip_contents(zfile)
+        for required in ('stops.txt', 'routes.txt', 'trips.txt', 'stop_times.txt'):
+            if required not in zip_contents: raise Exception(f"File {required} is not in the archive!")
+
+        # 1. calendar.txt + calendar_dates.txt -> Bitmap של שירות x תאריך
+        index.service_calendar = load_service_calendar(zfile, zip_contents)
+
+        # 2. stops.txt
+        for s_id, s_code, s_name in iter_csv_columns(zfile, 'stops.txt', ('stop_id', 'stop_code', 'stop_name')):
+            index.stop_info[s_id] = {'code': s_code if s_code else s_id, 'name': s_name.strip()}
+            if s_code:
+                index.stop_code_to_ids[s_code].append(s_id)
+
+        # 3. routes.txt + trips.txt
+        route_id_to_short_name = dict(iter_csv_columns(zfile, 'routes.txt', ('route_id', 'route_short_name')))
+        trip_lookup = {}
+        for route_id, service_id, trip_id in iter_csv_columns(zfile, 'trips.txt', ('route_id', 'service_id', 'trip_id')):
+            if trip_id in trip_lookup:
+                continue
+            trip = trip_lookup[trip_id] = len(index.trip_ids)
+            route_short_name = route_id_to_short_name.get(route_id)
+            index.trip_ids.append(trip_id)
+            index.trip_route.append(route_short_name)
+            index.trip_service.append(service_id)
+            index.trip_first.append(None)
+            index.trip_rank.append(-1)
+            if route_short_name is not None:
+                index.route_trips[route_short_name].append(trip)
+
+        # 4. stop_times.txt - תחנה -> Trips (ושעת היציאה בכל שורה), ושעת המוצא של כל Trip
+        stop_times_data = iter_csv_columns(zfile, 'stop_times.txt', ('trip_id', 'departure_time', 'stop_id', 'stop_sequence', 'arrival_time'))
+        for row_number, (trip_id, departure_time, stop_id, stop_sequence, arrival_time) in enumerate(stop_times_data):
+            trip = trip_lookup.get(trip_id)
+            if trip is None:
+                continue
+            trips_at_stop = index.stop_trips[stop_id]
+            if not trips_at_stop or trips_at_stop[-1] != trip:
+                trips_at_stop.append(trip)
+            index.stop_visits[stop_id].extend((trip, stop_time_seconds(departure_time, arrival_time)))
+            if stop_sequence == '1' and index.trip_first[trip] is None:
+                index.trip_first[trip] = (stop_id, departure_time[:5])
+                index.trip_rank[trip] = row_number
+
+    print(f"DEBUG: Indexed {len(index.trip_ids)} trips over {len(index.stop_trips)} stops and {len(index.route_trips)} routes.")
+    return index
+
+
+def load_feed_index(zip_path, index_dir=INDEX_DIR, use_hash=False):
+    """טוען את האינדקס של ה-Feed מהדיסק, או בונה ושומר אותו אם ה-Feed השתנה."""
+    key = get_feed_key(zip_path, use_hash=use_hash)
+    index_path = os.path.join(index_dir, f"{key}.pickle")
+
+    if os.path.exists(index_path):
+        print(f"INFO: Using feed index {index_path}.")
+        with open(index_path, 'rb') as f:
+            index = pickle.load(f)
+        if getattr(index, 'version', None) == INDEX_VERSION:
+            return index
+        print("WARNING: Feed index version mismatch. Rebuilding.")
+
+    index = build_feed_index(zip_path)
+
+    os.makedirs(index_dir, exist_ok=True)
+    for old_name in os.listdir(index_dir):
+        os.remove(os.path.join(index_dir, old_name))
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, index_path)
+    return index
@@ -1,7 +1,6 @@
 # gtfs_parser.py
 import zipfile
 import os
-from datetime import datetime
 # ייבוא כל הפונקציות מקובץ העזר
 from gtfs_utils import (
     list_zip_contents, 
@@ -9,18 +8,45 @@ from gtfs_utils import (
     map_service_ids_for_today,
     map_stop_info,
     convert_codes_to_ids,
-    find_relevant_trips_by_stops,
+    scan_stop_times,
     map_trips_for_target_routes,
     extract_stop_times,
     write_final_schedule,
-    CRITICAL_STOP_CODES # ייבוא קבועים קריטיים
+    get_default_profile,
 )
+from pipeline_stats import PipelineStats
+from parallel_stop_times import STOP_TIMES_FILE
+from schedule_table import measure_schedule_memory
+from table_loader import side_tables, CALENDAR_FILES, TRIP_FILES
+from stop_grid import resolve_profile_locations
 
-def generate_schedule(zip_path, output_path, day_info=None):
+
+def _load_service_trips(zfile, zip_contents, today_date_str, profile, stats):
+    """
+    הטבלאות הקטנות (רץ ב-Thread נפרד בזמן הסריקה של stop_times, ראו table_loader.py):
+    ה-Service IDs הפעילים היום והנסיעות של הקווים הממוקדים, לפני הסינון הגיאוגרפי.
+    """
+    with stats.stage('calendar_mapping', today_date_str, files=CALENDAR_FILES) as record:
+        active_service_ids = map_service_ids_for_today(zfile, today_date_str, zip_contents)
+        record['rows_kept'] = len(active_service_ids)
+
+    if not active_service_ids:
+        raise Exception(f"No active service IDs found. No service is scheduled for this day/time frame.")
+
+    with stats.stage('trip_mapping', today_date_str, files=TRIP_FILES) as record:
+        candidate_trips_to_route = map_trips_for_target_routes(zfile, active_service_ids, None, zip_contents, profile)
+        record['rows_kept'] = len(candidate_trips_to_route)
+    return candidate_trips_to_route
+
+
+def generate_schedule(zip_path, output_path, day_info=None, stats=None):
     """
     פונקציית Wrapper המשלבת את כל שלבי הפארסינג.
     מקבלת day_info כאובייקט כדי לתמוך בשימוש חוזר לימים שונים.
+    אם לא סופק stats, דוח המדידות נכתב ליד קובץ הפלט.
     """
+    write_report = stats is None
+    stats = stats if stats is not None else PipelineStats(label='daily')
     # אם day_info לא סופק (שימוש רגיל), מביאה את נתוני היום הנוכחי
     if day_info is None:
         today_date_str, current_day_index = get_current_day_info()
@@ -30,42 +56,64 @@ def generate_schedule(zip_path, output_path, day_info=None):
         
     try:
         print(f"DEBUG: Processing for date {today_date_str}. Day index: {current_day_index} (0=Sun).")        
-        # --- הגדרות קבועות (כדי שיהיו גלובליות לכל הפונקציות) ---
-        # הפונקציה convert_codes_to_ids משנה את המשתנה הגלובלי CRITICAL_STOP_IDS בתוך gtfs_utils
+        # --- הגדרות הקונפיג (config.ini הראשי) כ-Profile, כולל מקומות מ-[LOCATIONS] שנפתרים לקודי תחנות ---
+        # הפונקציה convert_codes_to_ids שומרת את ה-Stop IDs ב-profile
+
+        profile = get_default_profile()
+        with stats.stage('location_resolution', today_date_str) as record:
+            resolve_profile_locations(profile, zip_path)
+            record['rows_kept'] = len(profile.critical_stop_codes)
 
         with zipfile.ZipFile(zip_path, 'r') as zfile:
             
             zip_contents = list_zip_contents(zfile)
             
-            # 1. מציאת ה-Service IDs הפעילים היום
-            active_service_ids = map_service_ids_for_today(zfile, current_day_index, zip_contents)
-            
-            if not active_service_ids:
-                 raise Exception(f"No active service IDs found. No service is scheduled for this day/time frame.")
+            # 1. מיפוי Stop Code ל-Stop ID
+            with stats.stage('stop_mapping', today_date_str, files=('stops.txt',)) as record:
+                stop_id_to_code, stop_code_to_ids = map_stop_info(zfile, zip_contents)
+                record['rows_kept'] = len(stop_id_to_code)
             
-            # 2. מיפוי Stop Code ל-Stop ID
-            stop_id_to_code, stop_code_to_id = map_stop_info(zfile, zip_contents)
-            
-            # 3. המרת הקבועים החיצוניים (Stop Codes) ל-Stop IDs פנימיים
-            converted_ids = convert_codes_to_ids(stop_code_to_id)
+            # 2. המרת הקבועים החיצוניים (Stop Codes) ל-Stop IDs פנימיים
+            with stats.stage('code_to_id_conversion', today_date_str) as record:
+                converted_ids = convert_codes_to_ids(stop_code_to_ids, profile)
+                record['rows_kept'] = len(converted_ids)
 
             if not converted_ids:
                 print("WARNING: No valid Stop IDs found for the critical Stop Codes. Proceeding without geographic filter.")
             
-            # 4. סינון גיאוגרפי - מציאת ה-Trips שעוברים ב-IDs הנכונים
-            relevant_trip_ids = find_relevant_trips_by_stops(zfile, zip_contents)
-            
-            # 5. מציאת הנסיעות (Trips) הרלוונטיות לאחר סינון כפול
-            target_trips_to_route = map_trips_for_target_routes(zfile, active_service_ids, relevant_trip_ids, zip_contents)
+            # 3. ה-Service IDs הפעילים היום (לפי התאריך, כולל calendar_dates.txt) והנסיעות של הקווים -
+            #    ב-Thread נפרד, במקביל למעבר על stop_times
+            with side_tables(zip_path, _load_service_trips, today_date_str, profile, stats) as service_trips:
+                # 4. מעבר יחיד על stop_times: סינון גיאוגרפי + איסוף שעות המוצא
+                with stats.stage('stop_filtering', today_date_str, files=(STOP_TIMES_FILE,)) as record:
+                    relevant_trip_ids, first_departures = scan_stop_times(zfile, zip_contents, profile)
+                    record['rows_kept'] = len(first_departures)
+
+                with stats.stage('side_tables_wait', today_date_str) as record:
+                    candidate_trips_to_route = service_trips.result()
+                    record['rows_kept'] = len(candidate_trips_to_route)
+
+            # 5. הנסיעות (Trips) הרלוונטיות לאחר סינון כפול
+            target_trips_to_route = {trip_id: route for trip_id, route in candidate_trips_to_route.items()
+                                     if relevant_trip_ids is None or trip_id in relevant_trip_ids}
+            print(f"DEBUG: Identified {len(target_trips_to_route)} relevant trips after filtering by stops and routes.")
             
             if not target_trips_to_route:
                 raise Exception(f"No relevant trips found for target routes today. Check that the routes are active and pass through the critical stops.")
             
-            # 6. משיכת שעות המוצא
-            final_schedule = extract_stop_times(zfile, target_trips_to_route, stop_id_to_code, zip_contents)
+            # 6. שיוך שעות המוצא לנסיעות שנבחרו
+            with stats.stage('stop_times_extraction', today_date_str) as record:
+                final_schedule = extract_stop_times(first_departures, target_trips_to_route, stop_id_to_code)
+                record['rows_scanned'] = len(first_departures)
+                record['rows_kept'] = final_schedule.departure_count()
+                record['schedule_memory'] = measure_schedule_memory([final_schedule])
             
             # 7. שמירת הפלט (כאן נמצא תיקון ה-strip לפורמט)
-            write_final_schedule(final_schedule, output_path)
+            with stats.stage('writing', today_date_str):
+                write_final_schedule(final_schedule, output_path)
+
+        if write_report:
+            stats.write_report(output_path)
 
     except Exception as e:
         print(f"CRITICAL PARSING ERROR in generate_schedule: {e}")
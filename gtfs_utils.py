@@ -2,47 +2,129 @@
 import csv
 import io
 import os
+import struct
+import zipfile
+import threading
 import configparser
+from contextlib import contextmanager
 from collections import defaultdict
 from datetime import datetime
 
+try:
+    from isal import isal_zlib as fast_zlib
+except ImportError:  # isal אינו חובה - בלעדיו הקבצים נפרסים דרך zipfile (zlib הרגיל)
+    try:
+        from zlib_ng import zlib_ng as fast_zlib
+    except ImportError:
+        fast_zlib = None
+
+from service_calendar import ServiceCalendar, parse_gtfs_date
+from schedule_table import DaySchedule, WeeklySchedule, parse_gtfs_time, parse_departure_minutes, format_minutes
+
 # ----------------------------------------------------
 # I. טעינת קונפיגורציה (העדכון העיקרי)
 # ----------------------------------------------------
 
 CONFIG_FILE = 'config.ini'
 
-def load_config_data():
-    """קורא את הקווים וקודי התחנות מקובץ התצורה ומעדכן את המשתנים הגלובליים."""
+
+class Profile:
+    """
+    מצב מפורש של פרופיל אחד (קבוצת נוסעים): הקווים, קודי התחנות וה-Stop IDs שמופו מהם.
+    מחליף את המשתנים הגלובליים כאשר מייצרים כמה לוחות זמנים באותו תהליך.
+    locations: [(name, lat, lon, radius_m)] מ-[LOCATIONS] - נפתרים לקודי תחנות בזמן הבנייה (stop_grid.py).
+    stop_pairs: [(origin_code, destination_code)] מ-[PAIRS] - נסיעות ישירות מתחנה לתחנה (trip_patterns.py).
+    """
+
+    def __init__(self, name, target_routes, critical_stop_codes, critical_stop_ids=None, locations=None, stop_pairs=None):
+        self.name = name
+        self.target_routes = list(target_routes)
+        self.critical_stop_codes = set(critical_stop_codes)
+        self.critical_stop_ids = set(critical_stop_ids or ())
+        self.locations = list(locations or ())
+        self.stop_pairs = list(stop_pairs or ())
+
+    def __repr__(self):
+        return f"Profile({self.name!r}, routes={len(self.target_routes)}, stop_codes={len(self.critical_stop_codes)})"
+
+
+def read_config_sections(config, lines_section='LINES', codes_section='STOP_CODES'):
+    """קורא את רשימת הקווים וסט קודי התחנות מסקשנים של ConfigParser (ריקים אם הסקשן חסר)."""
+    # קריאת קווים
+    lines_list = []
+    if lines_section in config:
+        # קורא את כל המפתחות (ה-Keys, שהם מספרי הקווים) בסקשן 'LINES'
+        lines_list = [key.strip() for key in config[lines_section].keys() if key.strip()]
+        
+    # קריאת קודי תחנות
+    stop_codes_set = set()
+    if codes_section in config:
+        # קורא את כל המפתחות (ה-Keys, שהם קודי התחנות) בסקשן 'STOP_CODES'
+        stop_codes_set = {key.strip() for key in config[codes_section].keys() if key.strip()}
+
+    return lines_list, stop_codes_set
+
+
+def read_config_locations(config, locations_section='LOCATIONS'):
+    """
+    קורא מקומות מסקשן של ConfigParser, בפורמט: name = lat, lon, radius_m
+    מחזיר [(name, lat, lon, radius_m)] (ריק אם הסקשן חסר). שורה לא תקינה מדולגת.
+    """
+    locations = []
+    if locations_section not in config:
+        return locations
+
+    for name, value in config[locations_section].items():
+        try:
+            lat, lon, radius_m = (float(part) for part in value.split(','))
+        except ValueError:
+            print(f"ERROR: Invalid location {name} = {value!r} in [{locations_section}] (expected: lat, lon, radius_m). Skipping.")
+            continue
+        locations.append((name.strip(), lat, lon, radius_m))
+    return locations
+
+
+def read_config_pairs(config, pairs_section='PAIRS'):
+    """
+    קורא זוגות מוצא-יעד מסקשן של ConfigParser, בפורמט: origin_code = destination_code[, destination_code...]
+    מחזיר [(origin_code, destination_code)] לפי הסדר בקובץ (ריק אם הסקשן חסר).
+    """
+    pairs = []
+    if pairs_section not in config:
+        return pairs
+
+    for origin_code, value in config[pairs_section].items():
+        for destination_code in value.split(','):
+            if origin_code.strip() and destination_code.strip():
+                pairs.append((origin_code.strip(), destination_code.strip()))
+    return pairs
+
+
+def load_config_data(config_path=CONFIG_FILE):
+    """קורא את הקווים וקודי התחנות מקובץ התצורה (ברירת מחדל: config.ini) ומעדכן את המשתנים הגלובליים."""
     
     config = configparser.ConfigParser()
     
-    if not os.path.exists(CONFIG_FILE):
-        print(f"CRITICAL ERROR: Configuration file not found: {CONFIG_FILE}. Using default hardcoded lists.")
+    if not os.path.exists(config_path):
+        print(f"CRITICAL ERROR: Configuration file not found: {config_path}. Using default hardcoded lists.")
         return # ישתמש ב-CRITICAL_STOP_CODES ו-TARGET_ROUTES כפי שהם מוגדרים למטה
 
     try:
         # קריאת הקובץ
-        config.read(CONFIG_FILE, encoding='utf-8')
+        config.read(config_path, encoding='utf-8')
     except Exception as e:
-        print(f"CRITICAL ERROR: Failed to read config file {CONFIG_FILE}: {e}. Using default hardcoded lists.")
+        print(f"CRITICAL ERROR: Failed to read config file {config_path}: {e}. Using default hardcoded lists.")
         return
 
-    # קריאת קווים
-    lines_list = []
-    if 'LINES' in config:
-        # קורא את כל המפתחות (ה-Keys, שהם מספרי הקווים) בסקשן 'LINES'
-        lines_list = [key.strip() for key in config['LINES'].keys() if key.strip()]
-        
-    # קריאת קודי תחנות
-    stop_codes_set = set()
-    if 'STOP_CODES' in config:
-        # קורא את כל המפתחות (ה-Keys, שהם קודי התחנות) בסקשן 'STOP_CODES'
-        stop_codes_set = {key.strip() for key in config['STOP_CODES'].keys() if key.strip()}
+    lines_list, stop_codes_set = read_config_sections(config)
+    locations = read_config_locations(config)
+    stop_pairs = read_config_pairs(config)
     
     # עדכון המשתנים הגלובליים
     global TARGET_ROUTES
     global CRITICAL_STOP_CODES
+    global CRITICAL_LOCATIONS
+    global STOP_PAIRS
     
     if lines_list:
         TARGET_ROUTES = lines_list
@@ -53,9 +135,20 @@ def load_config_data():
     if stop_codes_set:
         CRITICAL_STOP_CODES = stop_codes_set
         print(f"INFO: CRITICAL_STOP_CODES loaded from config: {CRITICAL_STOP_CODES}")
+    elif locations:
+        # התחנות יגיעו מהמקומות (בזמן הבנייה), ולא מרשימת ברירת המחדל
+        CRITICAL_STOP_CODES = set()
     else:
         print("WARNING: 'STOP_CODES' section is empty or missing in config. Using hardcoded CRITICAL_STOP_CODES.")
 
+    if locations:
+        CRITICAL_LOCATIONS = locations
+        print(f"INFO: CRITICAL_LOCATIONS loaded from config: {[name for name, *_ in CRITICAL_LOCATIONS]}")
+
+    if stop_pairs:
+        STOP_PAIRS = stop_pairs
+        print(f"INFO: STOP_PAIRS loaded from config: {STOP_PAIRS}")
+
 
 # --- הגדרות קבועות (ערכי ברירת מחדל אם הקונפיג נכשל/ריק) ---
 TARGET_ROUTES = ['20', '20א', '22', '60', '60א', '71', '71א', '631', '632', '634', '63', '163', '160', '127']
@@ -66,11 +159,145 @@ CRITICAL_STOP_CODES = {'43334', '43496', '40662'}
 # Stop IDs שימולאו לאחר המיפוי ההפוך:
 CRITICAL_STOP_IDS = set() 
 
+# מקומות (name, lat, lon, radius_m) מ-[LOCATIONS], שכל התחנות ברדיוס שלהם מצטרפות ל-CRITICAL_STOP_CODES
+CRITICAL_LOCATIONS = []
+
+# זוגות (קוד תחנת מוצא, קוד תחנת יעד) מ-[PAIRS] - נסיעות ישירות ביניהן נכתבות ליד לוח הזמנים
+STOP_PAIRS = []
+
 # *** הרצת פונקציית הטעינה מיד לאחר הגדרת ברירות המחדל ***
 load_config_data()
+
+
+def get_default_profile():
+    """פרופיל שנבנה מהמשתנים הגלובליים (config.ini הראשי)."""
+    return Profile('default', TARGET_ROUTES, CRITICAL_STOP_CODES, CRITICAL_STOP_IDS, CRITICAL_LOCATIONS, STOP_PAIRS)
+
+
+def load_profiles(path):
+    """
+    טוען כמה פרופילים, ללא שינוי המשתנים הגלובליים:
+    - תיקייה: כל קובץ *.ini הוא פרופיל (שם הפרופיל = שם הקובץ), עם [LINES], [STOP_CODES], [LOCATIONS] ו-[PAIRS].
+    - קובץ יחיד: כל קבוצת סקשנים [LINES:name] / [STOP_CODES:name] / [LOCATIONS:name] / [PAIRS:name] היא פרופיל בשם name.
+    פרופיל שחסר בו אחד הסקשנים מקבל את ברירת המחדל הגלובלית עבורו (פרופיל עם מקומות לא צריך קודי תחנות).
+    """
+    profiles = []
+
+    if os.path.isdir(path):
+        sources = [(os.path.splitext(file_name)[0], os.path.join(path, file_name), 'LINES', 'STOP_CODES', 'LOCATIONS', 'PAIRS')
+                   for file_name in sorted(os.listdir(path)) if file_name.endswith('.ini')]
+    else:
+        config = configparser.ConfigParser()
+        config.read(path, encoding='utf-8')
+        names = sorted({section.split(':', 1)[1].strip() for section in config.sections() if ':' in section})
+        sources = [(name, path, f"LINES:{name}", f"STOP_CODES:{name}", f"LOCATIONS:{name}", f"PAIRS:{name}")
+                   for name in names]
+
+    for name, config_path, lines_section, codes_section, locations_section, pairs_section in sources:
+        config = configparser.ConfigParser()
+        try:
+            config.read(config_path, encoding='utf-8')
+        except Exception as e:
+            print(f"ERROR: Failed to read profile {name} from {config_path}: {e}. Skipping.")
+            continue
+
+        lines_list, stop_codes_set = read_config_sections(config, lines_section, codes_section)
+        locations = read_config_locations(config, locations_section)
+        if not lines_list:
+            print(f"WARNING: Profile {name} has no lines. Using default TARGET_ROUTES.")
+        if not stop_codes_set and not locations:
+            print(f"WARNING: Profile {name} has no stop codes. Using default CRITICAL_STOP_CODES.")
+            stop_codes_set = CRITICAL_STOP_CODES
+        profiles.append(Profile(name, lines_list or TARGET_ROUTES, stop_codes_set, locations=locations,
+                                stop_pairs=read_config_pairs(config, pairs_section)))
+
+    print(f"INFO: Loaded {len(profiles)} profiles from {path}: {[profile.name for profile in profiles]}")
+    return profiles
 # ----------------------------------------------------
 
 
+# מונה השורות שנקראו מכל קובץ (משמש את pipeline_stats למדידת השלבים).
+# קבצים נקראים גם מ-Thread נפרד (table_loader.side_tables), ולכן כל גישה למונה עוברת דרך הנעילה.
+ROWS_READ = defaultdict(int)
+_ROWS_READ_LOCK = threading.Lock()
+
+
+def count_rows_read(file_name, rows_read):
+    with _ROWS_READ_LOCK:
+        ROWS_READ[file_name] += rows_read
+
+
+def get_rows_read(files=None):
+    """סך כל השורות שנקראו עד כה מכל הקבצים (או רק מ-files)."""
+    with _ROWS_READ_LOCK:
+        if files is None:
+            return sum(ROWS_READ.values())
+        return sum(ROWS_READ.get(file_name, 0) for file_name in files)
+
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s22xHH')
+INFLATE_CHUNK = 1024 * 1024
+
+
+class _InflateReader(io.RawIOBase):
+    """
+    פריסת Deflate של קובץ אחד מה-ZIP בעזרת fast_zlib, מתוך File Handle פרטי.
+    בסוף הקובץ נבדק ה-CRC-32, כמו ב-zipfile.
+    """
+
+    def __init__(self, raw, info):
+        super().__init__()
+        self._raw = raw
+        self._info = info
+        self._compressed_left = info.compress_size
+        self._decompressor = fast_zlib.decompressobj(-15)
+        self._crc = 0
+        self._pending = memoryview(b'')
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._eof:
+            chunk = self._raw.read(min(INFLATE_CHUNK, self._compressed_left))
+            self._compressed_left -= len(chunk)
+            data = self._decompressor.decompress(chunk) if chunk else self._decompressor.flush()
+            self._eof = not chunk
+            self._crc = fast_zlib.crc32(data, self._crc)
+            self._pending = memoryview(data)
+            if self._eof and self._crc != self._info.CRC:
+                raise Exception(f"Bad CRC-32 for file {self._info.filename!r} in the archive.")
+
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+@contextmanager
+def open_zip_member(zfile, file_name):
+    """
+    פותח קובץ מתוך ה-ZIP לקריאה בינארית. אם isal/zlib-ng מותקנים והקובץ דחוס ב-Deflate,
+    הפריסה נעשית בעזרתם (מהיר פי 2 ויותר) דרך File Handle משלו - בלי לשנות את zipfile עצמו,
+    כך ששאר הקוד בתהליך (ו-Threads אחרים) לא מושפעים.
+    """
+    info = zfile.getinfo(file_name)
+    if fast_zlib is None or not zfile.filename or info.compress_type != zipfile.ZIP_DEFLATED or info.flag_bits & 0x1:
+        with zfile.open(info) as f:
+            yield f
+        return
+
+    with open(zfile.filename, 'rb') as raw:
+        raw.seek(info.header_offset)
+        signature, name_length, extra_length = ZIP_LOCAL_HEADER.unpack(raw.read(ZIP_LOCAL_HEADER.size))
+        if signature != b'PK\x03\x04':
+            raise Exception(f"Bad local file header for {file_name} in the archive.")
+        raw.seek(name_length + extra_length, io.SEEK_CUR)
+        with io.BufferedReader(_InflateReader(raw, info), INFLATE_CHUNK) as f:
+            yield f
+
+
 def clean_header(header):
     """מנקה BOM, רווחים לבנים ורווחים מובילים/נגררים משמות עמודות."""
     if not header: return []
@@ -101,13 +328,46 @@ def debug_print_file_contents(zfile, file_name):
 
 
 def get_csv_dict_reader(zfile, file_name, cleaned_header):
-    """מחזיר רשימה של שורות (כמילונים) באמצעות הכותרת הנקייה שהכנו."""
+    """מחזיר את השורות (כמילונים) באמצעות הכותרת הנקייה שהכנו, אחת-אחת ולא כרשימה בזיכרון."""
     with zfile.open(file_name) as f:
         text_wrapper = io.TextIOWrapper(f, encoding='utf-8')
         # מדלגים על שורת הכותרת בקובץ המקורי (כי כבר השתמשנו בה)
         next(text_wrapper)
         reader = csv.DictReader(text_wrapper, fieldnames=cleaned_header)
-        return list(reader)
+        yield from reader
+
+
+def iter_csv_columns(zfile, file_name, columns):
+    """
+    קורא קובץ CSV מתוך ה-ZIP בזרימה (שורה אחר שורה) ומחזיר tuple של העמודות המבוקשות בלבד.
+    הכותרת נקראת ומנוקה באותה פתיחה, ומיקומי העמודות מחושבים פעם אחת.
+    """
+    with open_zip_member(zfile, file_name) as f:
+        reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8'))
+        header = clean_header(next(reader, None))
+        if not header:
+            raise Exception(f"{file_name} appears to be empty or missing header.")
+        print(f"DEBUG: Cleaned Header for {file_name}: {header}")
+
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise Exception(f"Header check failed for {file_name}. Missing columns: {missing}")
+
+        indices = [header.index(column) for column in columns]
+        width = max(indices) + 1
+
+        rows_read = 0
+        try:
+            for row in reader:
+                if not row:
+                    continue
+                rows_read += 1
+                # שורה קצרה מהכותרת (עמודות אחרונות ריקות) - משלימים במחרוזות ריקות
+                if len(row) < width:
+                    row += [''] * (width - len(row))
+                yield tuple([row[i] for i in indices])
+        finally:
+            count_rows_read(file_name, rows_read)
 
 
 def list_zip_contents(zfile):
@@ -130,51 +390,124 @@ def get_current_day_info():
     return date_str, day_index
 
 
-def map_service_ids_for_today(zfile, current_day_index, zip_contents):
-    """קריאת calendar.txt והחזרת סט של service_ids הפעילים היום."""
-    active_service_ids = set()
+DAY_NAMES = ('sunday', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday')
+# אזור הזמן של ה-Feed של משרד התחבורה (אם agency.txt חסר)
+DEFAULT_TIMEZONE = 'Asia/Jerusalem'
+
+
+def read_agency_timezone(zfile, zip_contents):
+    """
+    agency_timezone מ-agency.txt (לפי המפרט כל הסוכנויות ב-Feed חולקות אותו).
+    זמני stop_times נמדדים ממנו, ולא מאזור הזמן של המחשב שמריץ את הקוד.
+    """
+    agency_file = 'agency.txt'
+    if agency_file not in zip_contents:
+        print(f"WARNING: {agency_file} is not in the archive. Using timezone {DEFAULT_TIMEZONE}.")
+        return DEFAULT_TIMEZONE
+    for (agency_timezone,) in iter_csv_columns(zfile, agency_file, ('agency_timezone',)):
+        if agency_timezone.strip():
+            return agency_timezone.strip()
+    print(f"WARNING: No agency_timezone in {agency_file}. Using timezone {DEFAULT_TIMEZONE}.")
+    return DEFAULT_TIMEZONE
+
+
+def load_service_calendar(zfile, zip_contents):
+    """
+    קריאת calendar.txt ו-calendar_dates.txt פעם אחת ובניית ServiceCalendar
+    (כולל start_date/end_date וחריגים של חגים). לפחות אחד מהקבצים חייב להיות קיים.
+    """
     calendar_file = 'calendar.txt'
-    
-    if calendar_file not in zip_contents: raise Exception(f"File {calendar_file} is not in the archive!")
-    header = debug_print_file_contents(zfile, calendar_file)
-    if not header or 'service_id' not in header:
-        raise Exception(f"Header check failed for {calendar_file}. 'service_id' column is missing.")
-        
-    day_map = {0: 'sunday', 1: 'monday', 2: 'tuesday', 3: 'wednesday', 4: 'thursday', 5: 'friday', 6: 'saturday'}
-    current_day_column = day_map.get(current_day_index)
-    
-    print(f"INFO: Processing {calendar_file} to map active service IDs based on column '{current_day_column}'.")
-    calendar_data = get_csv_dict_reader(zfile, calendar_file, header)
-    
-    for row in calendar_data:
-        if row.get(current_day_column) == '1':
-            active_service_ids.add(row['service_id'])
-            
-    print(f"DEBUG: Found {len(active_service_ids)} active service IDs.")
+    calendar_dates_file = 'calendar_dates.txt'
+
+    if calendar_file not in zip_contents and calendar_dates_file not in zip_contents:
+        raise Exception(f"Neither {calendar_file} nor {calendar_dates_file} is in the archive!")
+
+    calendar_rows = []
+    if calendar_file in zip_contents:
+        print(f"INFO: Processing {calendar_file} (weekdays and validity dates).")
+        calendar_rows = iter_csv_columns(zfile, calendar_file, ('service_id', *DAY_NAMES, 'start_date', 'end_date'))
+
+    calendar_dates_rows = []
+    if calendar_dates_file in zip_contents:
+        print(f"INFO: Processing {calendar_dates_file} (added/removed service dates).")
+        calendar_dates_rows = iter_csv_columns(zfile, calendar_dates_file, ('service_id', 'date', 'exception_type'))
+    else:
+        print(f"WARNING: {calendar_dates_file} is not in the archive. Using {calendar_file} only.")
+
+    return ServiceCalendar.from_rows(calendar_rows, calendar_dates_rows)
+
+
+def map_service_ids_for_today(zfile, today_date_str, zip_contents):
+    """החזרת סט של service_ids הפעילים בתאריך (YYYYMMDD), לפי calendar.txt ו-calendar_dates.txt."""
+    service_calendar = load_service_calendar(zfile, zip_contents)
+    active_service_ids = service_calendar.active_service_ids(parse_gtfs_date(today_date_str))
+
+    print(f"DEBUG: Found {len(active_service_ids)} active service IDs for {today_date_str}.")
     return active_service_ids
 
 
+def map_service_ids_for_days(zfile, week_days, zip_contents):
+    """
+    קריאת לוח השירות פעם אחת עבור כל ימי החלון.
+    week_days: רשימה של (day_offset, date_str).
+    מחזיר מיפוי service_id -> tuple של ה-offsets שבהם השירות פעיל.
+    """
+    service_calendar = load_service_calendar(zfile, zip_contents)
+    service_offsets = service_calendar.service_offsets(
+        [(day_offset, parse_gtfs_date(date_str)) for day_offset, date_str in week_days]
+    )
+
+    print(f"DEBUG: Found {len(service_offsets)} service IDs active during the window.")
+    return service_offsets
+
+
+def dedupe_service_days(service_offsets):
+    """
+    ימים עם אותו סט של service_ids פעילים מקבלים בדיוק אותו לוח זמנים, ולכן מחשבים רק את הראשון בכל קבוצה.
+    מחזיר (service_offsets מצומצם לימים הקנוניים, day_aliases: offset -> ה-offset הקנוני שלו).
+    """
+    services_by_day = defaultdict(set)
+    for service_id, offsets in service_offsets.items():
+        for day_offset in offsets:
+            services_by_day[day_offset].add(service_id)
+
+    canonical_by_services = {}
+    day_aliases = {}
+    for day_offset in sorted(services_by_day):
+        day_aliases[day_offset] = canonical_by_services.setdefault(frozenset(services_by_day[day_offset]), day_offset)
+
+    # שירות שפעיל ביום כפול פעיל גם ביום הקנוני שלו, ולכן אף שירות לא מתרוקן
+    canonical_days = set(day_aliases.values())
+    reduced_offsets = {service_id: tuple(day_offset for day_offset in offsets if day_offset in canonical_days)
+                       for service_id, offsets in service_offsets.items()}
+
+    print(f"DEBUG: {len(day_aliases)} active days share {len(canonical_days)} distinct service sets.")
+    return reduced_offsets, day_aliases
+
+
+def expand_service_days(weekly_schedule, day_aliases):
+    """משכפל (לפי הפניה) את הלוח של כל יום קנוני לימים שזהים לו. מחזיר את weekly_schedule."""
+    for day_offset, canonical_offset in day_aliases.items():
+        if day_offset != canonical_offset and canonical_offset in weekly_schedule:
+            weekly_schedule[day_offset] = weekly_schedule[canonical_offset]
+    return weekly_schedule
+
+
 def map_stop_info(zfile, zip_contents):
     """
     *** מעודכן: מייצר מפות דו-כיווניות, כולל stop_name. ***
     1. stop_id -> {stop_code, stop_name} (לצורך פלט)
-    2. stop_code -> stop_id (לצורך סינון גיאוגרפי)
+    2. stop_code -> [stop_id, ...] (לצורך סינון גיאוגרפי; לאותו קוד עשויים להיות כמה Stop IDs)
     """
     stop_id_to_info = {} # מחזיק את המידע המלא (קוד ושם)
-    stop_code_to_id = {}
+    stop_code_to_ids = defaultdict(list)
     stops_file = 'stops.txt'
     
-    stops_header = debug_print_file_contents(zfile, stops_file)
-    if not stops_header or 'stop_id' not in stops_header or 'stop_code' not in stops_header or 'stop_name' not in stops_header:
-        raise Exception(f"Required columns missing in {stops_file}. Cannot process stops.")
-
     print(f"INFO: Mapping stop IDs, codes, and names from {stops_file}.")
-    stops_data = get_csv_dict_reader(zfile, stops_file, stops_header)
+    stops_data = iter_csv_columns(zfile, stops_file, ('stop_id', 'stop_code', 'stop_name'))
     
-    for row in stops_data:
-        s_id = row['stop_id']
-        s_code = row['stop_code']
-        s_name = row['stop_name'].strip() # ניקוי שם התחנה
+    for s_id, s_code, s_name in stops_data:
+        s_name = s_name.strip() # ניקוי שם התחנה
         
         # 1. מפה רגילה (עבור הפלט): stop_id -> {stop_code, stop_name}
         # אם אין stop_code, נשתמש ב-stop_id
@@ -183,22 +516,30 @@ def map_stop_info(zfile, zip_contents):
 
         # 2. מפה הפוכה (עבור הסינון)
         if s_code:
-            stop_code_to_id[s_code] = s_id
+            stop_code_to_ids[s_code].append(s_id)
         
-    print(f"DEBUG: Mapped {len(stop_id_to_info)} stops. Found {len(stop_code_to_id)} unique stop codes.")
-    return stop_id_to_info, stop_code_to_id
+    print(f"DEBUG: Mapped {len(stop_id_to_info)} stops. Found {len(stop_code_to_ids)} unique stop codes.")
+    return stop_id_to_info, dict(stop_code_to_ids)
 
-def convert_codes_to_ids(stop_code_to_id):
-    """ממיר את CRITICAL_STOP_CODES ל-CRITICAL_STOP_IDS האמיתיים."""
+def convert_codes_to_ids(stop_code_to_ids, profile=None):
+    """
+    ממיר את CRITICAL_STOP_CODES ל-CRITICAL_STOP_IDS האמיתיים (כל ה-Stop IDs של כל קוד).
+    אם התקבל profile, הקודים נלקחים ממנו והתוצאה נשמרת בו (ללא שינוי הגלובליים).
+    """
     converted_ids = set()
+    stop_codes = profile.critical_stop_codes if profile is not None else CRITICAL_STOP_CODES
     
-    for code in CRITICAL_STOP_CODES:
-        s_id = stop_code_to_id.get(code)
-        if s_id:
-            converted_ids.add(s_id)
+    for code in stop_codes:
+        stop_ids = stop_code_to_ids.get(code)
+        if stop_ids:
+            converted_ids.update(stop_ids)
         else:
             print(f"WARNING: Critical Stop Code {code} not found in stops.txt. Ignoring.")
             
+    if profile is not None:
+        profile.critical_stop_ids = converted_ids
+        return converted_ids
+
     # עדכון המשתנה הגלובלי בתוך קובץ העזר
     global CRITICAL_STOP_IDS
     CRITICAL_STOP_IDS = converted_ids
@@ -206,56 +547,81 @@ def convert_codes_to_ids(stop_code_to_id):
     return converted_ids
 
 
-def find_relevant_trips_by_stops(zfile, zip_contents):
-    """ממפה רק Trips שעוברים באחת מה-CRITICAL_STOP_IDS."""
+def scan_stop_times(zfile, zip_contents, profile=None, stop_rows=None):
+    """
+    מעבר יחיד (ומאוחד) על stop_times.txt:
+    1. ממפה Trips שעוברים באחת מה-CRITICAL_STOP_IDS (סינון גיאוגרפי).
+    2. אוסף את שעת המוצא (stop_sequence=1) של כל Trip.
+    3. אם הועברה רשימה ב-stop_rows, מוסיף אליה את השורות בתחנות הקריטיות עצמן
+       כ-(trip_id, stop_id, stop_sequence, seconds) - ראו stop_time_seconds.
+    הסינון לפי קו ושירות נעשה אחר כך, על התוצאות שנאספו, בלי לקרוא שוב את הקובץ.
+    מחזיר (relevant_trip_ids או None, first_departures) כאשר first_departures היא רשימה
+    של (trip_id, stop_id, departure_time) לפי סדר השורות בקובץ.
+    """
     relevant_trip_ids = set()
+    first_departures = []
     stop_times_file = 'stop_times.txt'
     
-    # משתמשים ב-CRITICAL_STOP_IDS הגלובלי שהוגדר ע"י convert_codes_to_ids
-    if not CRITICAL_STOP_IDS:
+    # משתמשים ב-CRITICAL_STOP_IDS (של הפרופיל או הגלובלי) שהוגדר ע"י convert_codes_to_ids
+    critical_stop_ids = profile.critical_stop_ids if profile is not None else CRITICAL_STOP_IDS
+    if not critical_stop_ids:
         print("WARNING: CRITICAL_STOP_IDS is empty after conversion. Proceeding without geographic filtering.")
-        return None 
         
     if stop_times_file not in zip_contents: raise Exception(f"File {stop_times_file} is not in the archive!")
-    stop_times_header = debug_print_file_contents(zfile, stop_times_file)
     
-    print(f"INFO: Filtering trips by critical stop IDs: {CRITICAL_STOP_IDS}")
-    stop_times_data = get_csv_dict_reader(zfile, stop_times_file, stop_times_header)
-
-    for row in stop_times_data:
-        if row['stop_id'] in CRITICAL_STOP_IDS:
-            relevant_trip_ids.add(row['trip_id'])
+    print(f"INFO: Scanning {stop_times_file} once for critical stop IDs {critical_stop_ids} and departure times (stop_sequence=1).")
+    stop_times_data = iter_csv_columns(zfile, stop_times_file, ('trip_id', 'departure_time', 'stop_id', 'stop_sequence', 'arrival_time'))
+
+    for trip_id, departure_time, stop_id, stop_sequence, arrival_time in stop_times_data:
+        if stop_id in critical_stop_ids:
+            relevant_trip_ids.add(trip_id)
+            if stop_rows is not None:
+                stop_rows.append((trip_id, stop_id, stop_sequence, stop_time_seconds(departure_time, arrival_time)))
+
+        # אנחנו מעוניינים רק בזמן היציאה של תחנת המוצא (של ה-Trip), שזה בדרך כלל stop_sequence=1
+        if stop_sequence == '1':
+            first_departures.append((trip_id, stop_id, departure_time[:5]))
             
     print(f"DEBUG: Identified {len(relevant_trip_ids)} trips that pass through the critical stops (using mapped IDs).")
-    return relevant_trip_ids
+    print(f"DEBUG: Collected {len(first_departures)} first-stop departures.")
+
+    if not critical_stop_ids:
+        return None, first_departures
+    return relevant_trip_ids, first_departures
+
+
+def stop_time_seconds(departure_time, arrival_time):
+    """
+    שעת היציאה של שורת stop_times בשניות מחצות (-1 אם אין זמן תקין).
+    בתחנות שאינן נקודות תזמון departure_time עשוי להיות ריק (או פגום) - משתמשים ב-arrival_time.
+    """
+    seconds = parse_gtfs_time(departure_time)
+    return seconds if seconds >= 0 else parse_gtfs_time(arrival_time)
 
 
-def map_trips_for_target_routes(zfile, active_service_ids, relevant_trip_ids, zip_contents):
+def map_trips_for_target_routes(zfile, active_service_ids, relevant_trip_ids, zip_contents, profile=None):
     """ממפה נסיעות (trips) לקווים הממוקדים הפעילים היום והרלוונטיים גיאוגרפית."""
+    target_routes = set(profile.target_routes if profile is not None else TARGET_ROUTES)
     route_id_to_short_name = {}
     target_trips_to_route = {} 
 
     # 1. routes.txt
     routes_file = 'routes.txt'
-    routes_header = debug_print_file_contents(zfile, routes_file)
     print(f"INFO: Mapping route IDs from {routes_file}.")
-    routes_data = get_csv_dict_reader(zfile, routes_file, routes_header)
-    for row in routes_data:
-        route_id_to_short_name[row['route_id']] = row['route_short_name']
+    routes_data = iter_csv_columns(zfile, routes_file, ('route_id', 'route_short_name'))
+    for route_id, route_short_name in routes_data:
+        route_id_to_short_name[route_id] = route_short_name
 
     # 2. trips.txt
     trips_file = 'trips.txt'
-    trips_header = debug_print_file_contents(zfile, trips_file)
 
     print(f"INFO: Mapping trips for target routes active today from {trips_file}.")
-    trips_data = get_csv_dict_reader(zfile, trips_file, trips_header)
-    for row in trips_data:
-        route_short_name = route_id_to_short_name.get(row['route_id'])
-        service_id = row['service_id']
-        trip_id = row['trip_id']
+    trips_data = iter_csv_columns(zfile, trips_file, ('route_id', 'service_id', 'trip_id'))
+    for route_id, service_id, trip_id in trips_data:
+        route_short_name = route_id_to_short_name.get(route_id)
         
         # סינון לפי קו ופעילות יום
-        if route_short_name in TARGET_ROUTES and service_id in active_service_ids:
+        if route_short_name in target_routes and service_id in active_service_ids:
             
             # סינון גיאוגרפי
             if relevant_trip_ids is None or trip_id in relevant_trip_ids:
@@ -265,47 +631,155 @@ def map_trips_for_target_routes(zfile, active_service_ids, relevant_trip_ids, zi
     return target_trips_to_route
 
 
-def extract_stop_times(zfile, target_trips_to_route, stop_id_to_info, zip_contents):
+def map_trip_days(zfile, service_offsets, relevant_trip_ids, zip_contents, profile=None):
     """
-    *** מעודכן: מוצא את שעות המוצא ומשייך ל-Route Short Name ול-{Stop Code, Stop Name}. ***
+    הגרסה השבועית של map_trips_for_target_routes: מעבר יחיד על routes.txt ו-trips.txt.
+    מחזיר trip_id -> (route_short_name, offsets) עבור כל הימים בחלון בבת אחת.
     """
-    # המבנה של final_schedule:
-    # { 'RouteName': { 'StopID': { 'code': 'XXX', 'name': 'YYY', 'times': [...] } } }
-    final_schedule = defaultdict(lambda: {}) 
-    all_target_trips = set(target_trips_to_route.keys())
-    stop_times_file = 'stop_times.txt'
-    stop_times_header = debug_print_file_contents(zfile, stop_times_file)
+    target_routes = set(profile.target_routes if profile is not None else TARGET_ROUTES)
+    route_id_to_short_name = {}
+    trip_days = {}
+
+    # 1. routes.txt
+    routes_file = 'routes.txt'
+    print(f"INFO: Mapping route IDs from {routes_file}.")
+    routes_data = iter_csv_columns(zfile, routes_file, ('route_id', 'route_short_name'))
+    for route_id, route_short_name in routes_data:
+        route_id_to_short_name[route_id] = route_short_name
+
+    # 2. trips.txt
+    trips_file = 'trips.txt'
+
+    print(f"INFO: Mapping trips for target routes active during the window from {trips_file}.")
+    trips_data = iter_csv_columns(zfile, trips_file, ('route_id', 'service_id', 'trip_id'))
+    for route_id, service_id, trip_id in trips_data:
+        route_short_name = route_id_to_short_name.get(route_id)
+        offsets = service_offsets.get(service_id)
+
+        # סינון לפי קו ופעילות באחד מימי החלון
+        if offsets and route_short_name in target_routes:
+
+            # סינון גיאוגרפי
+            if relevant_trip_ids is None or trip_id in relevant_trip_ids:
+                trip_days[trip_id] = (route_short_name, offsets)
+
+    print(f"DEBUG: Identified {len(trip_days)} relevant trips for the window after filtering by stops and routes.")
+    return trip_days
+
+
+def extract_stop_times(first_departures, target_trips_to_route, stop_id_to_info):
+    """
+    *** מעודכן: משייך את שעות המוצא (שנאספו ב-scan_stop_times) ל-Route Short Name ול-{Stop Code, Stop Name}. ***
+    מחזיר DaySchedule (ראו schedule_table.py).
+    """
+    final_schedule = DaySchedule()
+    skipped = 0
     
-    print(f"INFO: Extracting departure times (stop_sequence=1) for {len(all_target_trips)} trips.")
-    stop_times_data = get_csv_dict_reader(zfile, stop_times_file, stop_times_header)
+    print(f"INFO: Extracting departure times (stop_sequence=1) for {len(target_trips_to_route)} trips.")
 
-    for row in stop_times_data:
-        trip_id = row['trip_id']
+    for trip_id, stop_id, departure_time in first_departures:
+        route_short_name = target_trips_to_route.get(trip_id)
         
-        if trip_id in all_target_trips:
-            # אנחנו מעוניינים רק בזמן היציאה של תחנת המוצא (של ה-Trip), שזה בדרך כלל stop_sequence=1
-            if row['stop_sequence'] == '1': 
-                
-                route_short_name = target_trips_to_route[trip_id]
-                departure_time = row['departure_time'][:5]
-                stop_id = row['stop_id']
-                
-                # משיכת המידע המלא על התחנה
-                stop_info = stop_id_to_info.get(stop_id)
-                
-                if stop_info:
-                    # שימוש ב-Stop ID כמפתח פנימי למניעת כפילויות של Stop Code
-                    if stop_id not in final_schedule[route_short_name]:
-                        final_schedule[route_short_name][stop_id] = {
-                            'code': stop_info['code'],
-                            'name': stop_info['name'],
-                            'times': []
-                        }
-                    
-                    final_schedule[route_short_name][stop_id]['times'].append(departure_time)
-                
+        if route_short_name is not None:
+            # משיכת המידע המלא על התחנה
+            stop_info = stop_id_to_info.get(stop_id)
+            
+            if stop_info and not final_schedule.add(route_short_name, stop_id, stop_info, departure_time):
+                skipped += 1
+
+    if skipped:
+        print(f"WARNING: Skipped {skipped} departures with an empty or invalid departure_time.")
     return final_schedule
 
+def extract_weekly_stop_times(first_departures, trip_days, stop_id_to_info):
+    """
+    הגרסה השבועית של extract_stop_times.
+    כל שעת מוצא משויכת לכל offset שבו השירות של ה-Trip פעיל.
+    מחזיר WeeklySchedule ({ day_offset: DaySchedule }).
+    """
+    weekly_schedule = WeeklySchedule()
+    strings = weekly_schedule.strings
+    skipped = 0
+
+    print(f"INFO: Extracting departure times (stop_sequence=1) for {len(trip_days)} trips across the window.")
+
+    for trip_id, stop_id, departure_time in first_departures:
+        trip_info = trip_days.get(trip_id)
+
+        if trip_info:
+            route_short_name, offsets = trip_info
+            stop_info = stop_id_to_info.get(stop_id)
+
+            if stop_info:
+                minutes = parse_departure_minutes(departure_time)
+                if minutes < 0:
+                    skipped += 1
+                    continue
+                route = strings.route(route_short_name)
+                stop = strings.stop(stop_id, stop_info)
+                for day_offset in offsets:
+                    weekly_schedule[day_offset].add_minutes(route, stop, minutes)
+
+    if skipped:
+        print(f"WARNING: Skipped {skipped} departures with an empty or invalid departure_time.")
+    return weekly_schedule
+
+
+def extract_weekly_stop_departures(stop_rows, trip_days, stop_id_to_info):
+    """
+    כמו extract_weekly_stop_times, אבל לכל שורה בתחנות הקריטיות עצמן (ולא רק בתחנת המוצא של ה-Trip).
+    stop_rows: (trip_key, stop_id, stop_sequence, seconds), ו-trip_days: trip_key -> (קו, offsets).
+    השורות מתווספות לפי (קו, קוד תחנה, stop_id) ולא לפי סדר הקובץ, כך שכל המנועים
+    (zip, cache, index) כותבים בדיוק את אותו פלט. מחזיר WeeklySchedule.
+    """
+    weekly_schedule = WeeklySchedule()
+    strings = weekly_schedule.strings
+    entries = []
+
+    for trip_key, stop_id, _, seconds in stop_rows:
+        trip_info = trip_days.get(trip_key)
+        stop_info = stop_id_to_info.get(stop_id)
+        if trip_info and stop_info and seconds >= 0:
+            entries.append((trip_info[0], stop_info['code'], stop_id, seconds // 60, trip_info[1]))
+
+    print(f"INFO: Extracting departure times at the critical stops for {len(entries)} stop visits across the window.")
+    entries.sort(key=lambda entry: entry[:3])
+    for route_short_name, _, stop_id, minutes, offsets in entries:
+        route = strings.route(route_short_name)
+        stop = strings.stop(stop_id, stop_id_to_info[stop_id])
+        for day_offset in offsets:
+            weekly_schedule[day_offset].add_minutes(route, stop, minutes)
+    return weekly_schedule
+
+
+def route_sort_key(route_short_name):
+    """סדר הקווים בפלט: לפי הספרות שבשם (60א אחרי 9), ושם בלי ספרות לפי עצמו."""
+    return int(''.join(filter(str.isdigit, route_short_name))) if any(c.isdigit() for c in route_short_name) else route_short_name
+
+
+def format_schedule_lines(final_schedule):
+    """
+    מחזיר את שורות הפלט (ללא ירידת שורה) בפורמט: [Route_Short_Name]|[Stop_Code]|[Stop_Name]:[Times]
+    final_schedule: DaySchedule.
+    """
+    # מיון הקווים לפני כתיבה (כדי לשמור על סדר נעים יותר)
+    sorted_routes = sorted(final_schedule.iter_rows(), key=lambda row: route_sort_key(row[0]))
+
+    for route_id, stops in sorted_routes:
+        cleaned_route_id = route_id.strip() 
+
+        for stop_code, stop_name, times in stops:
+            
+            cleaned_stop_code = stop_code.strip() 
+            cleaned_stop_name = stop_name.strip() # ודא ששם התחנה נקי מרווחים
+            
+            # מיון הזמנים (דקות) לפני הפיצול
+            times_str = ','.join(map(format_minutes, sorted(times)))
+            
+            # הפורמט החדש: RouteID|StopCode|StopName:Times
+            yield f"{cleaned_route_id}|{cleaned_stop_code}|{cleaned_stop_name}:{times_str}"
+
+
 def write_final_schedule(final_schedule, output_path):
     """
     *** מעודכן: כתיבת הפלט בפורמט: [Route_Short_Name]|[Stop_Code]|[Stop_Name]:[Times] ***
@@ -313,23 +787,7 @@ def write_final_schedule(final_schedule, output_path):
     print(f"INFO: Writing schedule to {output_path}. Existing file will be overwritten.")
     
     with open(output_path, 'w', encoding='utf-8') as outfile:
-        # מיון הקווים לפני כתיבה (כדי לשמור על סדר נעים יותר)
-        sorted_routes = sorted(final_schedule.keys(), key=lambda x: int(''.join(filter(str.isdigit, x))) if any(c.isdigit() for c in x) else x)
-
-        for route_id in sorted_routes:
-            schedule_by_id = final_schedule[route_id]
-            cleaned_route_id = route_id.strip() 
-
-            for stop_id, info in schedule_by_id.items():
-                
-                cleaned_stop_code = info['code'].strip() 
-                cleaned_stop_name = info['name'].strip() # ודא ששם התחנה נקי מרווחים
-                
-                # מיון הזמנים לפני הפיצול
-                sorted_times = sorted(info['times'])
-                times_str = ','.join(sorted_times)
-                
-                # הפורמט החדש: RouteID|StopCode|StopName:Times
-                outfile.write(f"{cleaned_route_id}|{cleaned_stop_code}|{cleaned_stop_name}:{times_str}\n")
+        for line in format_schedule_lines(final_schedule):
+            outfile.write(f"{line}\n")
                     
-    print(f"SUCCESS: Schedule generated and written for {len(final_schedule)} routes.")
+    print(f"SUCCESS: Schedule generated and written for {final_schedule.route_count()} routes.")
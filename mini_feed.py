@@ -0,0 +1,243 @@
+# mini_feed.py
+import os
+import io
+import csv
+import shutil
+import zipfile
+import tempfile
+import argparse
+
+import gtfs_utils
+from gtfs_utils import clean_header, list_zip_contents, get_default_profile, load_profiles
+from stop_grid import StopGrid, resolve_profile_locations
+
+# ----------------------------------------------------
+# חילוץ "מיני-Feed": מעבר יחיד על ה-ZIP הארצי וכתיבת ZIP של GTFS תקין וקטן בהרבה,
+# שמכיל רק את מה שנגיש מהקונפיג: נסיעות של הקווים ב-[LINES] שעוצרות באחת התחנות
+# ב-[STOP_CODES] / [LOCATIONS] (או בתחנה ברדיוס --radius מהן), יחד עם כל ה-stop_times, התחנות, הקווים,
+# השירותים וה-shapes שלהן. שאר הפונקציות (gtfs_utils, המנועים) עובדות על הקובץ בלי שינוי.
+# ----------------------------------------------------
+
+DEFAULT_OUTPUT = 'mini_gtfs.zip'
+
+# טבלה -> העמודות שמפנות לישויות שנשמרות ('trips', 'stops', 'routes', 'services', 'shapes').
+# שורה נשמרת רק אם כל ההפניות שלה (שאינן ריקות) נשמרות. טבלה שאינה כאן מועתקת כמו שהיא.
+TABLE_REFERENCES = {
+    'stops.txt': {'stop_id': 'stops'},
+    'routes.txt': {'route_id': 'routes'},
+    'calendar.txt': {'service_id': 'services'},
+    'calendar_dates.txt': {'service_id': 'services'},
+    'shapes.txt': {'shape_id': 'shapes'},
+    'frequencies.txt': {'trip_id': 'trips'},
+    'transfers.txt': {'from_stop_id': 'stops', 'to_stop_id': 'stops'},
+    'fare_rules.txt': {'route_id': 'routes'},
+}
+
+
+def _iter_rows(zfile, file_name):
+    """שורות מלאות של קובץ CSV בתוך ה-ZIP: קודם הכותרת הנקייה, ואחריה כל השורות (פתיחה אחת)."""
+    with gtfs_utils.open_zip_member(zfile, file_name) as f:
+        reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8'))
+        header = clean_header(next(reader, None))
+        if not header:
+            raise Exception(f"{file_name} appears to be empty or missing header.")
+        yield header
+
+        rows_read = 0
+        try:
+            for row in reader:
+                if not row:
+                    continue
+                rows_read += 1
+                if len(row) < len(header):
+                    row += [''] * (len(header) - len(row))
+                yield row
+        finally:
+            gtfs_utils.count_rows_read(file_name, rows_read)
+
+
+def _column(header, file_name, column):
+    if column not in header:
+        raise Exception(f"Header check failed for {file_name}. Missing columns: ['{column}']")
+    return header.index(column)
+
+
+class _MemberWriter:
+    """כתיבת CSV כקובץ בתוך ה-ZIP החדש, עם ספירת שורות."""
+
+    def __init__(self, out_zip, file_name, header):
+        self.file_name = file_name
+        self._raw = out_zip.open(file_name, 'w')
+        self._text = io.TextIOWrapper(self._raw, encoding='utf-8', newline='')
+        self._writer = csv.writer(self._text, lineterminator='\n')
+        self._writer.writerow(header)
+        self.rows = 0
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self.rows += 1
+
+    def close(self):
+        self._text.close()
+
+
+def find_region_stop_ids(stop_rows, stop_codes, radius_m=0):
+    """
+    stop_rows: (stop_id, stop_code, stop_lat, stop_lon).
+    מחזיר את ה-Stop IDs של הקודים שבקונפיג, ועם radius_m גם כל תחנה במרחק radius_m מאחת מהן
+    (שאילתת רדיוס על StopGrid לכל תחנה בקונפיג, במקום מעבר על כל התחנות).
+    """
+    region = set()
+    found_codes = set()
+    for stop_id, stop_code, _, _ in stop_rows:
+        if stop_code in stop_codes:
+            region.add(stop_id)
+            found_codes.add(stop_code)
+
+    for stop_code in sorted(set(stop_codes) - found_codes):
+        print(f"WARNING: Critical Stop Code {stop_code} not found in stops.txt. Ignoring.")
+
+    if radius_m > 0 and region:
+        grid = StopGrid.from_rows((stop_id, stop_code, '', lat, lon) for stop_id, stop_code, lat, lon in stop_rows)
+        for i, stop_code in enumerate(grid.stop_codes):
+            if stop_code in stop_codes:
+                region.update(grid.stop_ids[j] for _, j in grid.within(grid.lats[i], grid.lons[i], radius_m))
+    return region
+
+
+def extract_mini_feed(zip_path, output_path=DEFAULT_OUTPUT, profiles=None, radius_m=0):
+    """
+    כותב ל-output_path ZIP של GTFS שמכיל רק את הנסיעות של הקווים שבפרופילים שעוצרות באזור.
+    profiles: רשימת Profile (ברירת מחדל: config.ini) - האזור והקווים הם האיחוד של כולם.
+    מחזיר סיכום (כמה שורות נשמרו מכל קובץ).
+    """
+    profiles = profiles if profiles else [get_default_profile()]
+    for profile in profiles:
+        resolve_profile_locations(profile, zip_path)
+    target_routes = {route for profile in profiles for route in profile.target_routes}
+    stop_codes = {code for profile in profiles for code in profile.critical_stop_codes}
+
+    with zipfile.ZipFile(zip_path, 'r') as zfile:
+        zip_contents = list_zip_contents(zfile)
+        for required in ('stops.txt', 'routes.txt', 'trips.txt', 'stop_times.txt'):
+            if required not in zip_contents: raise Exception(f"File {required} is not in the archive!")
+
+        # 1. stops.txt - האזור (תחנות הקונפיג + הרדיוס) ותחנות האב
+        rows = _iter_rows(zfile, 'stops.txt')
+        header = next(rows)
+        id_idx = _column(header, 'stops.txt', 'stop_id')
+        code_idx = _column(header, 'stops.txt', 'stop_code')
+        lat_idx = header.index('stop_lat') if 'stop_lat' in header else None
+        lon_idx = header.index('stop_lon') if 'stop_lon' in header else None
+        parent_idx = header.index('parent_station') if 'parent_station' in header else None
+        stop_rows = []
+        parent_of = {}
+        for row in rows:
+            stop_rows.append((row[id_idx], row[code_idx],
+                              row[lat_idx] if lat_idx is not None else '', row[lon_idx] if lon_idx is not None else ''))
+            if parent_idx is not None and row[parent_idx]:
+                parent_of[row[id_idx]] = row[parent_idx]
+        region_stop_ids = find_region_stop_ids(stop_rows, stop_codes, radius_m)
+        del stop_rows
+        print(f"INFO: Region has {len(region_stop_ids)} stops ({len(stop_codes)} stop codes, radius {radius_m}m).")
+
+        # 2. routes.txt - ה-route_id של הקווים שבקונפיג
+        rows = _iter_rows(zfile, 'routes.txt')
+        header = next(rows)
+        route_idx = _column(header, 'routes.txt', 'route_id')
+        name_idx = _column(header, 'routes.txt', 'route_short_name')
+        target_route_ids = {row[route_idx] for row in rows if row[name_idx] in target_routes}
+
+        # 3. trips.txt - הנסיעות המועמדות (של הקווים שבקונפיג) נשמרות בזיכרון במלואן
+        rows = _iter_rows(zfile, 'trips.txt')
+        trips_header = next(rows)
+        trip_route_idx = _column(trips_header, 'trips.txt', 'route_id')
+        trip_idx = _column(trips_header, 'trips.txt', 'trip_id')
+        candidate_trips = {row[trip_idx]: row for row in rows if row[trip_route_idx] in target_route_ids}
+        print(f"INFO: {len(candidate_trips)} candidate trips on {len(target_route_ids)} target route IDs.")
+
+        with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as buffer, \
+                zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as out_zip:
+            # 4. stop_times.txt - מעבר יחיד: השורות של הנסיעות המועמדות נשמרות לקובץ זמני,
+            #    ונסיעה נשמרת אם היא עוצרת באזור
+            rows = _iter_rows(zfile, 'stop_times.txt')
+            stop_times_header = next(rows)
+            st_trip_idx = _column(stop_times_header, 'stop_times.txt', 'trip_id')
+            st_stop_idx = _column(stop_times_header, 'stop_times.txt', 'stop_id')
+            buffer_writer = csv.writer(buffer, lineterminator='\n')
+            kept_trip_ids = set()
+            for row in rows:
+                trip_id = row[st_trip_idx]
+                if trip_id in candidate_trips:
+                    buffer_writer.writerow(row)
+                    if row[st_stop_idx] in region_stop_ids:
+                        kept_trip_ids.add(trip_id)
+
+            buffer.seek(0)
+            used_stop_ids = set(region_stop_ids)
+            writer = _MemberWriter(out_zip, 'stop_times.txt', stop_times_header)
+            for row in csv.reader(buffer):
+                if row[st_trip_idx] in kept_trip_ids:
+                    writer.write(row)
+                    used_stop_ids.add(row[st_stop_idx])
+            writer.close()
+            summary = {'stop_times.txt': writer.rows}
+
+            writer = _MemberWriter(out_zip, 'trips.txt', trips_header)
+            service_idx = trips_header.index('service_id') if 'service_id' in trips_header else None
+            shape_idx = trips_header.index('shape_id') if 'shape_id' in trips_header else None
+            keep = {'trips': kept_trip_ids, 'routes': set(), 'services': set(), 'shapes': set()}
+            for trip_id, row in candidate_trips.items():
+                if trip_id in kept_trip_ids:
+                    writer.write(row)
+                    keep['routes'].add(row[trip_route_idx])
+                    if service_idx is not None:
+                        keep['services'].add(row[service_idx])
+                    if shape_idx is not None and row[shape_idx]:
+                        keep['shapes'].add(row[shape_idx])
+            writer.close()
+            summary['trips.txt'] = writer.rows
+
+            # תחנות אב (parent_station) של התחנות שנשמרו, כדי שההפניות ב-stops.txt יישארו תקינות
+            for stop_id in list(used_stop_ids):
+                while stop_id in parent_of and parent_of[stop_id] not in used_stop_ids:
+                    stop_id = parent_of[stop_id]
+                    used_stop_ids.add(stop_id)
+            keep['stops'] = used_stop_ids
+
+            # 5. שאר הקבצים: סינון לפי ההפניות, או העתקה כמו שהם
+            for file_name in zip_contents:
+                if file_name in ('stop_times.txt', 'trips.txt'):
+                    continue
+                references = TABLE_REFERENCES.get(file_name)
+                if references is None:
+                    with zfile.open(file_name) as source, out_zip.open(file_name, 'w') as target:
+                        shutil.copyfileobj(source, target, 1024 * 1024)
+                    continue
+
+                rows = _iter_rows(zfile, file_name)
+                header = next(rows)
+                checks = [(header.index(column), keep[entity]) for column, entity in references.items() if column in header]
+                writer = _MemberWriter(out_zip, file_name, header)
+                for row in rows:
+                    if all(not row[i] or row[i] in kept for i, kept in checks):
+                        writer.write(row)
+                writer.close()
+                summary[file_name] = writer.rows
+
+    print(f"SUCCESS: Mini feed written to {output_path} ({os.path.getsize(zip_path) / 1e6:.1f} MB -> "
+          f"{os.path.getsize(output_path) / 1e6:.1f} MB, {len(kept_trip_ids)} trips).")
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extract a small GTFS zip with only the trips reachable from the config.")
+    parser.add_argument('--zip', default='gtfs.zip')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--profiles', help="Profiles directory/file (see batch_parser.py). Default: config.ini.")
+    parser.add_argument('--radius', type=float, default=0, help="Also keep trips stopping within this many meters of a configured stop.")
+    args = parser.parse_args()
+
+    result = extract_mini_feed(args.zip, args.output, load_profiles(args.profiles) if args.profiles else None, args.radius)
+    for file_name, rows in result.items():
+        print(f"DEBUG: {file_name}: {rows} rows kept.")
@@ -0,0 +1,143 @@
+# parallel_stop_times.py
+import os
+import csv
+import io
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import gtfs_utils
+from gtfs_utils import clean_header
+
+# ----------------------------------------------------
+# סריקה מקבילית של stop_times.txt: הקובץ נפרס פעם אחת לדיסק, מחולק לטווחי בתים
+# שמתחילים ונגמרים בסוף שורה, וכל טווח נסרק ב-Process נפרד.
+# ----------------------------------------------------
+
+STOP_TIMES_FILE = 'stop_times.txt'
+STOP_TIMES_COLUMNS = ('trip_id', 'departure_time', 'stop_id', 'stop_sequence', 'arrival_time')
+
+# מצב ה-Worker (נטען פעם אחת לכל Process ב-initializer, ולא לכל טווח)
+_worker_state = {}
+
+
+def extract_member(zfile, file_name, target_dir):
+    """פורס קובץ אחד מתוך ה-ZIP לתיקייה (פעם אחת) ומחזיר את הנתיב שלו."""
+    target_path = os.path.join(target_dir, file_name)
+    with gtfs_utils.open_zip_member(zfile, file_name) as source, open(target_path, 'wb') as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    return target_path
+
+
+def split_byte_ranges(path, chunks):
+    """
+    מחזיר (header_bytes, [(start, end), ...]) - טווחי בתים שמתחילים אחרי שורת הכותרת
+    ושכל אחד מהם נגמר בסוף שורה.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        data_start = f.tell()
+        chunk_size = max(1, (file_size - data_start) // max(1, chunks))
+
+        boundaries = [data_start]
+        while boundaries[-1] < file_size:
+            f.seek(min(boundaries[-1] + chunk_size, file_size))
+            f.readline() # מתקדמים עד סוף השורה הנוכחית
+            boundaries.append(min(f.tell(), file_size))
+
+    return header_line, list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _init_worker(path, indices, critical_stop_ids, candidate_trip_ids):
+    _worker_state['path'] = path
+    _worker_state['indices'] = indices
+    _worker_state['critical_stop_ids'] = critical_stop_ids
+    _worker_state['candidate_trip_ids'] = candidate_trip_ids
+
+
+def _scan_range(byte_range):
+    """
+    סורק טווח בתים אחד ומחזיר (trips שעוברים בתחנות הקריטיות, שעות מוצא לפי סדר השורות,
+    השורות בתחנות הקריטיות עצמן, מספר שורות).
+    """
+    start, end = byte_range
+    trip_idx, departure_idx, stop_idx, sequence_idx, arrival_idx = _worker_state['indices']
+    critical_stop_ids = _worker_state['critical_stop_ids']
+    candidate_trip_ids = _worker_state['candidate_trip_ids']
+    width = max(_worker_state['indices']) + 1
+
+    with open(_worker_state['path'], 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+
+    relevant_trip_ids = set()
+    first_departures = []
+    stop_rows = []
+    rows_read = 0
+    for row in csv.reader(io.StringIO(text)):
+        if not row:
+            continue
+        rows_read += 1
+        if len(row) < width:
+            row += [''] * (width - len(row))
+        trip_id = row[trip_idx]
+        if candidate_trip_ids is not None and trip_id not in candidate_trip_ids:
+            continue
+        stop_id = row[stop_idx]
+        if stop_id in critical_stop_ids:
+            relevant_trip_ids.add(trip_id)
+            stop_rows.append((trip_id, stop_id, row[sequence_idx], gtfs_utils.stop_time_seconds(row[departure_idx], row[arrival_idx])))
+        if row[sequence_idx] == '1':
+            first_departures.append((trip_id, stop_id, row[departure_idx][:5]))
+
+    return relevant_trip_ids, first_departures, stop_rows, rows_read
+
+
+def parallel_scan_stop_times(zfile, zip_contents, workers, profile=None, candidate_trip_ids=None, stop_rows=None):
+    """
+    הגרסה המקבילית של gtfs_utils.scan_stop_times - אותו פלט ובאותו סדר (כולל stop_rows).
+    candidate_trip_ids: אם סופק, ה-Workers מחזירים רק נתונים של Trips אלה (מקטין את המיזוג).
+    אפשר להעביר גם פונקציה שמחזירה אותם - היא נקראת רק אחרי הפריסה של הקובץ לדיסק,
+    כדי שהטבלאות הקטנות ייטענו במקביל לפריסה (ראו table_loader.py).
+    """
+    if STOP_TIMES_FILE not in zip_contents: raise Exception(f"File {STOP_TIMES_FILE} is not in the archive!")
+
+    critical_stop_ids = set(profile.critical_stop_ids if profile is not None else gtfs_utils.CRITICAL_STOP_IDS)
+    if not critical_stop_ids:
+        print("WARNING: CRITICAL_STOP_IDS is empty after conversion. Proceeding without geographic filtering.")
+
+    relevant_trip_ids = set()
+    first_departures = []
+
+    with tempfile.TemporaryDirectory(prefix='gtfs_stop_times_') as temp_dir:
+        path = extract_member(zfile, STOP_TIMES_FILE, temp_dir)
+        if callable(candidate_trip_ids):
+            candidate_trip_ids = candidate_trip_ids()
+        if candidate_trip_ids is not None:
+            candidate_trip_ids = frozenset(candidate_trip_ids)
+        header_line, byte_ranges = split_byte_ranges(path, workers * 4)
+
+        header = clean_header(next(csv.reader([header_line.decode('utf-8')]), None))
+        missing = [column for column in STOP_TIMES_COLUMNS if column not in header]
+        if missing:
+            raise Exception(f"Header check failed for {STOP_TIMES_FILE}. Missing columns: {missing}")
+        indices = tuple(header.index(column) for column in STOP_TIMES_COLUMNS)
+
+        print(f"INFO: Scanning {STOP_TIMES_FILE} in {len(byte_ranges)} byte ranges with {workers} worker processes.")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(path, indices, critical_stop_ids, candidate_trip_ids)) as executor:
+            # executor.map שומר על סדר הטווחים, ולכן גם על סדר השורות המקורי
+            for chunk_relevant, chunk_departures, chunk_stop_rows, rows_read in executor.map(_scan_range, byte_ranges):
+                relevant_trip_ids.update(chunk_relevant)
+                first_departures.extend(chunk_departures)
+                if stop_rows is not None:
+                    stop_rows.extend(chunk_stop_rows)
+                gtfs_utils.count_rows_read(STOP_TIMES_FILE, rows_read)
+
+    print(f"DEBUG: Identified {len(relevant_trip_ids)} trips that pass through the critical stops (using mapped IDs).")
+    print(f"DEBUG: Collected {len(first_departures)} first-stop departures.")
+
+    if not critical_stop_ids:
+        return None, first_departures
+    return relevant_trip_ids, first_departures
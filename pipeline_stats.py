@@ -0,0 +1,85 @@
+# pipeline_stats.py
+import os
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # resource קיים רק ב-Unix
+    resource = None
+
+import gtfs_utils
+
+# ----------------------------------------------------
+# מדידת שלבי ה-Pipeline: זמן אמת, זמן CPU, שורות שנסרקו/נשמרו ו-Peak RSS לכל שלב,
+# ודוח JSON שנכתב ליד קובץ הפלט (schedule2.txt -> schedule2.stats.json).
+# ----------------------------------------------------
+
+REPORT_SUFFIX = '.stats.json'
+
+
+def get_peak_rss_mb():
+    """Peak RSS של התהליך עד כה, ב-MB (None אם לא זמין במערכת ההפעלה)."""
+    if resource is None:
+        return None
+    # ב-Linux הערך ב-KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def get_report_path(output_path):
+    """schedule2.txt -> schedule2.stats.json"""
+    return f"{os.path.splitext(output_path)[0]}{REPORT_SUFFIX}"
+
+
+class PipelineStats:
+    """אוסף רשומה לכל שלב שנמדד עם stage(), וכותב אותן לדוח JSON."""
+
+    def __init__(self, label=''):
+        self.label = label
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.stages = []
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+    @contextmanager
+    def stage(self, name, day_offset=None, files=None):
+        """
+        מודד שלב אחד. הרשומה המוחזרת ניתנת לעדכון בתוך ה-with (למשל record['rows_kept'] = n).
+        rows_scanned מחושב אוטומטית ממונה השורות של gtfs_utils.iter_csv_columns.
+        files: סופרים רק שורות מהקבצים האלה (לשלבים שרצים במקביל לשלבים אחרים, ראו table_loader.py).
+        זמן ה-CPU נמדד ל-Thread הנוכחי בלבד.
+        """
+        record = {'stage': name, 'day_offset': day_offset, 'rows_scanned': 0, 'rows_kept': None}
+        rows_before = gtfs_utils.get_rows_read(files)
+        wall_before = time.perf_counter()
+        cpu_before = time.thread_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = round(time.perf_counter() - wall_before, 4)
+            record['cpu_s'] = round(time.thread_time() - cpu_before, 4)
+            record['rows_scanned'] += gtfs_utils.get_rows_read(files) - rows_before
+            record['peak_rss_mb'] = get_peak_rss_mb()
+            self.stages.append(record)
+            print(f"DEBUG: Stage {name}{'' if day_offset is None else f' (day {day_offset})'} took "
+                  f"{record['wall_s']}s wall / {record['cpu_s']}s CPU, scanned {record['rows_scanned']} rows.")
+
+    def to_dict(self):
+        return {
+            'label': self.label,
+            'started_at': self.started_at,
+            'total_wall_s': round(time.perf_counter() - self._start_wall, 4),
+            'total_cpu_s': round(time.process_time() - self._start_cpu, 4),
+            'peak_rss_mb': get_peak_rss_mb(),
+            'stages': self.stages,
+        }
+
+    def write_report(self, output_path):
+        """כותב את הדוח ליד קובץ הפלט ומחזיר את הנתיב שלו."""
+        report_path = get_report_path(output_path)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        print(f"INFO: Pipeline stats written to {report_path}.")
+        return report_path
@@ -0,0 +1,304 @@
+# query_service.py
+import os
+import json
+import time
+import asyncio
+import argparse
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor
+
+import gtfs_utils
+from gtfs_utils import get_default_profile
+from stop_departures import build_stop_departures, DATE_FORMAT
+from realtime_overlay import RealtimeOverlay, load_feed_message
+from weekly_parser import get_week_days
+from schedule_table import parse_gtfs_time, format_minutes
+
+# ----------------------------------------------------
+# שירות HTTP מקומי (asyncio, ללא תלויות חיצוניות) שמחזיק בזיכרון את זמני היציאה בתחנות
+# (StopDepartures) ועונה על /departures מתוך מערכים ממוינים.
+# כשמגיע gtfs.zip חדש (או שהקונפיג/התאריך השתנו) נבנה אינדקס חדש ב-Process נפרד,
+# והוא מחליף את הקודם בהשמה אחת - בקשות שכבר התחילו ממשיכות עם האינדקס הישן.
+# עם --realtime נמשכים עדכוני TripUpdates ומוחלים כשכבה מעל האינדקס (realtime_overlay).
+# ----------------------------------------------------
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+DEFAULT_DAYS = 7
+DEFAULT_POLL_SECONDS = 30
+DEFAULT_REALTIME_POLL_SECONDS = 20
+MAX_COUNT = 100
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+def _build_in_worker(zip_path, days, config_path):
+    """רץ ב-Process נפרד: קורא מחדש את קובץ הקונפיג של השירות ובונה StopDepartures."""
+    gtfs_utils.load_config_data(config_path)
+    return build_stop_departures(zip_path, get_week_days(date.today(), days), get_default_profile())
+
+
+def _format_clock(seconds):
+    """שניות מחצות של יום השירות -> 'HH:MM'"""
+    return format_minutes(seconds // 60)
+
+
+class TimetableService:
+    """האינדקס הנוכחי וה-Reload שלו. self.departures מוחלף כיחידה אחת ולעולם לא משתנה במקום."""
+
+    def __init__(self, zip_path, days=DEFAULT_DAYS, config_path=gtfs_utils.CONFIG_FILE, realtime_source=None):
+        self.zip_path = zip_path
+        self.days = days
+        self.config_path = config_path
+        self.realtime_source = realtime_source
+        self.departures = None
+        self.overlay = None
+        self.realtime_feed = None
+        self.realtime_loaded_at = None
+        self.source_key = None
+        self.loaded_at = None
+        self.reloads = 0
+        self._executor = ProcessPoolExecutor(max_workers=1)
+        self._reload_lock = asyncio.Lock()
+
+    def get_source_key(self):
+        """מזהה של הקלט: ה-ZIP, הקונפיג והתאריך (חלון הימים מתחיל היום)."""
+        key = [date.today().strftime(DATE_FORMAT)]
+        for path in (self.zip_path, self.config_path):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                key.append((stat.st_size, stat.st_mtime_ns))
+            else:
+                key.append(None)
+        return tuple(key)
+
+    async def reload_if_changed(self):
+        """בונה אינדקס חדש אם הקלט השתנה. מחזיר True אם בוצעה החלפה."""
+        async with self._reload_lock:
+            return await self._reload_if_changed()
+
+    async def _reload_if_changed(self):
+        source_key = self.get_source_key()
+        if source_key == self.source_key:
+            return False
+        if not os.path.exists(self.zip_path):
+            print(f"WARNING: {self.zip_path} not found. Keeping the current index.")
+            return False
+
+        print(f"INFO: Building timetable index from {self.zip_path} ({self.days} days).")
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            departures = await loop.run_in_executor(self._executor, _build_in_worker, self.zip_path, self.days,
+                                                    self.config_path)
+        except Exception as e:
+            print(f"ERROR: Failed to build the timetable index: {e}. Keeping the current index.")
+            return False
+
+        # החלפה אטומית: השמה אחת, בלי נעילה. עדכון זמן האמת האחרון מוחל מחדש על האינדקס החדש
+        self.overlay = self._build_overlay(departures, self.realtime_feed)
+        self.departures = departures
+        self.source_key = source_key
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+        self.reloads += 1
+        print(f"SUCCESS: Timetable index swapped in after {time.perf_counter() - started:.2f}s "
+              f"({len(departures.departures)} route/stop pairs).")
+        return True
+
+    async def watch(self, poll_seconds):
+        while True:
+            await asyncio.sleep(poll_seconds)
+            await self.reload_if_changed()
+
+    def _build_overlay(self, departures, feed):
+        if feed is None:
+            return None
+        overlay = RealtimeOverlay(departures)
+        summary = overlay.apply_feed(feed)
+        print(f"DEBUG: Applied realtime feed: {summary}")
+        return overlay
+
+    async def refresh_realtime(self):
+        """מושך את עדכון זמן האמת (ב-Thread, בלי לחסום את הלולאה) ומחיל אותו על האינדקס הנוכחי."""
+        loop = asyncio.get_running_loop()
+        try:
+            feed = await loop.run_in_executor(None, load_feed_message, self.realtime_source)
+        except Exception as e:
+            print(f"WARNING: Failed to load realtime feed from {self.realtime_source}: {e}. Keeping the previous one.")
+            return False
+
+        self.realtime_feed = feed
+        self.realtime_loaded_at = datetime.now().isoformat(timespec='seconds')
+        departures = self.departures
+        if departures is not None:
+            if self.overlay is not None and self.overlay.static is departures:
+                # אותו אינדקס: מחילים רק את השינויים (העלות לפי גודל העדכון)
+                print(f"DEBUG: Applied realtime feed: {self.overlay.apply_feed(feed)}")
+            else:
+                self.overlay = self._build_overlay(departures, feed)
+        return True
+
+    async def watch_realtime(self, poll_seconds):
+        while True:
+            await self.refresh_realtime()
+            await asyncio.sleep(poll_seconds)
+
+    def query_departures(self, params):
+        """
+        /departures?route=&stop=[&date=YYYYMMDD][&after=HH:MM][&count=N]
+        עם date: היציאות של יום השירות הזה (אחרי after). בלי date: היציאות הבאות מעכשיו (או מ-after היום).
+        מחזיר (status, body).
+        """
+        departures = self.departures
+        if departures is None:
+            return 503, {'error': 'Timetable index is still loading.'}
+
+        route = params.get('route')
+        stop_code = params.get('stop')
+        if not route or not stop_code:
+            return 400, {'error': "Both 'route' and 'stop' are required."}
+        after = parse_gtfs_time(params['after']) if 'after' in params else None
+        try:
+            count = min(int(params.get('count', 5)), MAX_COUNT)
+            if count < 1:
+                raise ValueError(params['count'])
+            if after is not None and after < 0:
+                raise ValueError(params['after'])
+        except ValueError:
+            return 400, {'error': "'count' must be a positive integer and 'after' must be HH:MM."}
+
+        body = {'route': route, 'stop': stop_code, 'stop_name': departures.stop_names.get(stop_code)}
+        # השכבה של זמן אמת רלוונטית רק אם נבנתה על האינדקס הנוכחי
+        overlay = self.overlay if self.overlay is not None and self.overlay.static is departures else None
+        date_str = params.get('date')
+        if date_str:
+            body['date'] = date_str
+            if overlay is not None:
+                pairs = overlay.departures_on(route, stop_code, date_str, after or 0, count)
+                body['departures'] = [_format_clock(realtime) for realtime, _ in pairs]
+                body['scheduled'] = [_format_clock(scheduled) for _, scheduled in pairs]
+            else:
+                seconds = departures.get_departures(route, stop_code, date_str)
+                start = bisect_left(seconds, after or 0)
+                body['departures'] = [_format_clock(s) for s in seconds[start:start + count]]
+        else:
+            # "עכשיו" ו"היום" באזור הזמן של ה-Feed, ולא של המחשב שמריץ את השירות
+            now = departures.now()
+            if after is None:
+                when = now
+            else:
+                when = datetime.combine(now.date(), datetime.min.time()) + timedelta(seconds=after)
+            if overlay is not None:
+                pairs = overlay.next_departures(route, stop_code, when, count)
+                body['departures'] = [realtime.isoformat(timespec='minutes') for realtime, _ in pairs]
+                body['scheduled'] = [scheduled.isoformat(timespec='minutes') for _, scheduled in pairs]
+            else:
+                body['departures'] = [d.isoformat(timespec='minutes') for d in departures.next_departures(route, stop_code, when, count)]
+        return 200, body
+
+    def list_stops(self):
+        """/stops - זוגות (קו, תחנה) שיש להם יציאות באינדקס."""
+        departures = self.departures
+        if departures is None:
+            return 503, {'error': 'Timetable index is still loading.'}
+        return 200, {'stops': [{'route': route, 'stop': stop_code, 'stop_name': departures.stop_names.get(stop_code)}
+                               for route, stop_code in sorted(departures.departures)]}
+
+    def health(self):
+        return 200, {
+            'loaded': self.departures is not None,
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+            'pairs': len(self.departures.departures) if self.departures is not None else 0,
+            'realtime_loaded_at': self.realtime_loaded_at,
+            'realtime_overrides': len(self.overlay.overrides) if self.overlay is not None else 0,
+        }
+
+    def dispatch(self, method, target):
+        """בקשה אחת -> (status, body). שגיאה לא צפויה מחזירה 500 ולא מפילה את החיבור."""
+        url = urlsplit(target)
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+        try:
+            if method != 'GET':
+                return 405, {'error': 'Only GET is supported.'}
+            if url.path == '/departures':
+                return self.query_departures(params)
+            if url.path == '/stops':
+                return self.list_stops()
+            if url.path == '/health':
+                return self.health()
+            return 404, {'error': f"Unknown path {url.path}."}
+        except Exception as e:
+            print(f"ERROR: {method} {target} failed: {e!r}")
+            return 500, {'error': 'Internal error while answering the request.'}
+
+    async def handle_connection(self, reader, writer):
+        """HTTP/1.1 מינימלי: GET בלבד, עם Keep-Alive."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+
+                status, body = self.dispatch(method, target)
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(zip_path, host=DEFAULT_HOST, port=DEFAULT_PORT, days=DEFAULT_DAYS, poll_seconds=DEFAULT_POLL_SECONDS,
+                realtime_source=None, realtime_poll_seconds=DEFAULT_REALTIME_POLL_SECONDS, config_path=gtfs_utils.CONFIG_FILE):
+    service = TimetableService(zip_path, days, config_path, realtime_source)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"INFO: Serving on http://{host}:{port} (departures, stops, health).")
+
+    # הבנייה הראשונה רצה ברקע - עד שהיא מסתיימת /departures מחזיר 503
+    asyncio.create_task(service.reload_if_changed())
+    asyncio.create_task(service.watch(poll_seconds))
+    if realtime_source:
+        asyncio.create_task(service.watch_realtime(realtime_poll_seconds))
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve departures at the configured stops over HTTP, with hot reload.")
+    parser.add_argument('--zip', default='gtfs.zip')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--config', default=gtfs_utils.CONFIG_FILE, help="Config file with the lines and stops to index.")
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help="Days to index, starting today.")
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL_SECONDS, help="Seconds between checks for a new feed/config.")
+    parser.add_argument('--realtime', help="GTFS-realtime TripUpdates source (.pb/.json file or http(s) URL).")
+    parser.add_argument('--realtime-poll', type=float, default=DEFAULT_REALTIME_POLL_SECONDS,
+                        help="Seconds between realtime feed fetches.")
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.zip, args.host, args.port, args.days, args.poll, args.realtime, args.realtime_poll, args.config))
@@ -0,0 +1,284 @@
+# realtime_overlay.py
+import json
+import heapq
+import argparse
+import urllib.request
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta
+
+try:
+    from google.transit import gtfs_realtime_pb2
+    from google.protobuf.json_format import MessageToDict
+except ImportError:  # gtfs-realtime-bindings אופציונלי - בלעדיו נקראים רק Snapshots בפורמט JSON
+    gtfs_realtime_pb2 = None
+
+from stop_departures import load_stop_departures, service_day_start, DEPARTURES_FILE, DATE_FORMAT
+
+# ----------------------------------------------------
+# שכבת זמן אמת מעל זמני היציאה הסטטיים (StopDepartures): עדכוני TripUpdates של GTFS-realtime
+# (עיכובים וביטולים) נשמרים כ"דלתות" לפי (trip_id, תאריך), בלי לגעת במערכים הממוינים.
+# החלת עדכון עולה לפי מספר הנסיעות שבו (StopDepartures.trips נותן לכל trip_id את התחנות שלו),
+# ושאילתה עולה לפי count + מספר הדלתות של אותו (קו, תחנה, תאריך).
+# הקלט: קובץ .pb (דורש gtfs-realtime-bindings), Snapshot בפורמט JSON (כמו MessageToDict),
+# או כתובת HTTP שמחזירה אחד מהם.
+# ----------------------------------------------------
+
+FULL_DATASET = 'FULL_DATASET'
+# TripDescriptor.ScheduleRelationship / StopTimeUpdate.ScheduleRelationship (שם או ערך מספרי)
+TRIP_CANCELED = ('CANCELED', 3)
+STOP_SKIPPED = ('SKIPPED', 1)
+
+
+def _field(message, name):
+    """שדה בהודעה בפורמט JSON: snake_case או camelCase (כמו ש-MessageToDict מייצר)."""
+    if name in message:
+        return message[name]
+    first, *rest = name.split('_')
+    return message.get(first + ''.join(part.title() for part in rest))
+
+
+def decode_feed_message(data):
+    """bytes של FeedMessage (protobuf או JSON) -> dict."""
+    if data.lstrip()[:1] == b'{':
+        return json.loads(data)
+    if gtfs_realtime_pb2 is None:
+        raise Exception("Binary GTFS-realtime feed requires gtfs-realtime-bindings. Install it or use a JSON snapshot.")
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(data)
+    return MessageToDict(feed)
+
+
+def load_feed_message(source, timeout=30):
+    """source: נתיב לקובץ או כתובת http(s)."""
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            data = response.read()
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    return decode_feed_message(data)
+
+
+def _update_seconds(stop_time_event, scheduled_seconds, day_start):
+    """
+    זמן בפועל (שניות מתחילת יום השירות) מ-StopTimeEvent: time מוחלט גובר על delay.
+    day_start: ה-timestamp של תחילת יום השירות (stop_departures.service_day_start).
+    """
+    if not stop_time_event:
+        return None
+    event_time = _field(stop_time_event, 'time')
+    if event_time is not None:
+        return int(event_time) - day_start
+    delay = _field(stop_time_event, 'delay')
+    if delay is not None:
+        return scheduled_seconds + int(delay)
+    return None
+
+
+def resolve_stop_delays(trip_stops, trip_update, day_start):
+    """
+    trip_stops: [(stop_code, stop_id, stop_sequence, seconds), ...] מ-StopDepartures.trips.
+    מחזיר [(stop_code, scheduled, realtime)], realtime=None לתחנה שמדלגים עליה.
+    כמו במפרט: delay של StopTimeUpdate חל גם על התחנות שאחריו, עד העדכון הבא.
+    תחנות שאין עליהן מידע (ואין delay ברמת ה-Trip) לא מוחזרות.
+    """
+    updates = _field(trip_update, 'stop_time_update') or []
+    by_sequence = {}
+    by_stop_id = {}
+    for update in updates:
+        sequence = _field(update, 'stop_sequence')
+        if sequence is not None:
+            by_sequence[int(sequence)] = update
+        elif _field(update, 'stop_id'):
+            by_stop_id[_field(update, 'stop_id')] = update
+    propagating = sorted(by_sequence.items())
+    propagating_sequences = [sequence for sequence, _ in propagating]
+    trip_delay = _field(trip_update, 'delay')
+
+    results = []
+    for stop_code, stop_id, stop_sequence, scheduled in trip_stops:
+        update = by_sequence.get(stop_sequence) or by_stop_id.get(stop_id)
+        if update is not None:
+            if _field(update, 'schedule_relationship') in STOP_SKIPPED:
+                results.append((stop_code, scheduled, None))
+                continue
+            realtime = _update_seconds(_field(update, 'departure'), scheduled, day_start)
+            if realtime is None:
+                realtime = _update_seconds(_field(update, 'arrival'), scheduled, day_start)
+            if realtime is not None:
+                results.append((stop_code, scheduled, realtime))
+                continue
+
+        # העדכון האחרון לפני התחנה (לפי stop_sequence) שיש בו delay
+        delay = None
+        for _, previous in reversed(propagating[:bisect_left(propagating_sequences, stop_sequence)]):
+            event = _field(previous, 'departure') or _field(previous, 'arrival') or {}
+            if _field(event, 'delay') is not None:
+                delay = int(_field(event, 'delay'))
+                break
+        if delay is None and trip_delay is not None:
+            delay = int(trip_delay)
+        if delay is not None:
+            results.append((stop_code, scheduled, scheduled + delay))
+    return results
+
+
+class RealtimeOverlay:
+    """
+    overrides[(route, stop_code, date_str)][(trip_id, scheduled)] = זמן בפועל בשניות, או None לביטול.
+    trip_keys[(trip_id, date_str)] = המפתחות של overrides שהנסיעה נגעה בהם (לביטול העדכון הקודם שלה).
+    """
+
+    def __init__(self, stop_departures):
+        self.static = stop_departures
+        self.overrides = {}
+        self.trip_keys = {}
+        self.feed_timestamp = None
+
+    def _clear_trip(self, trip_key):
+        trip_id = trip_key[0]
+        for key in self.trip_keys.pop(trip_key, ()):
+            by_trip = self.overrides[key]
+            for entry in [entry for entry in by_trip if entry[0] == trip_id]:
+                del by_trip[entry]
+            if not by_trip:
+                del self.overrides[key]
+
+    def apply_trip_update(self, trip_id, date_str, trip_update):
+        """מחיל TripUpdate אחד (במקום העדכון הקודם של אותה נסיעה). מחזיר כמה יציאות השתנו."""
+        trip_key = (trip_id, date_str)
+        self._clear_trip(trip_key)
+        route, dates, trip_stops = self.static.trips[trip_id]
+        if date_str not in dates:
+            return 0
+
+        trip = _field(trip_update, 'trip') or {}
+        if _field(trip, 'schedule_relationship') in TRIP_CANCELED:
+            changes = [(stop_code, scheduled, None) for stop_code, _, _, scheduled in trip_stops]
+        else:
+            day_start = service_day_start(date_str, self.static.timezone)
+            changes = resolve_stop_delays(trip_stops, trip_update, day_start)
+
+        keys = set()
+        for stop_code, scheduled, realtime in changes:
+            key = (route, stop_code, date_str)
+            self.overrides.setdefault(key, {})[(trip_id, scheduled)] = realtime
+            keys.add(key)
+        if keys:
+            self.trip_keys[trip_key] = keys
+        return len(changes)
+
+    def apply_feed(self, feed, default_date=None):
+        """
+        מחיל FeedMessage (dict). בלי start_date משתמשים ב-default_date (ברירת מחדל: היום באזור הזמן של ה-Feed).
+        ב-FULL_DATASET נסיעות שהיו בעדכון הקודם ואינן בזה חוזרות ללוח הסטטי.
+        מחזיר סיכום.
+        """
+        default_date = default_date or self.static.now().strftime(DATE_FORMAT)
+        header = _field(feed, 'header') or {}
+        summary = {'trip_updates': 0, 'applied': 0, 'unknown_trips': 0, 'changed_departures': 0, 'reverted': 0}
+
+        seen = set()
+        for entity in _field(feed, 'entity') or []:
+            trip_update = _field(entity, 'trip_update')
+            if not trip_update:
+                continue
+            summary['trip_updates'] += 1
+            trip = _field(trip_update, 'trip') or {}
+            trip_id = _field(trip, 'trip_id')
+            if trip_id not in self.static.trips:
+                # נסיעה שלא עוצרת בתחנות שבקונפיג (או נסיעה שנוספה ואינה בלוח הסטטי)
+                summary['unknown_trips'] += 1
+                continue
+            trip_key = (trip_id, _field(trip, 'start_date') or default_date)
+            seen.add(trip_key)
+            if _field(entity, 'is_deleted'):
+                self._clear_trip(trip_key)
+                continue
+            summary['changed_departures'] += self.apply_trip_update(trip_key[0], trip_key[1], trip_update)
+            summary['applied'] += 1
+
+        if (_field(header, 'incrementality') or FULL_DATASET) == FULL_DATASET:
+            for trip_key in [trip_key for trip_key in self.trip_keys if trip_key not in seen]:
+                self._clear_trip(trip_key)
+                summary['reverted'] += 1
+
+        self.feed_timestamp = _field(header, 'timestamp')
+        return summary
+
+    def departures_on(self, route, stop_code, date_str, after=0, count=3):
+        """
+        count היציאות של יום שירות אחד מ-after (שניות) ואילך, לפי הזמן בפועל.
+        מחזיר [(realtime, scheduled)] בשניות.
+        """
+        if count < 1:
+            return []
+        seconds = self.static.get_departures(route, stop_code, date_str)
+        start = bisect_left(seconds, after)
+        by_trip = self.overrides.get((route, stop_code, date_str))
+        if not by_trip:
+            return [(s, s) for s in seconds[start:start + count]]
+
+        # יציאות עם עדכון מוצאות מהמערך הסטטי ונכנסות לפי הזמן בפועל (ביטולים לא נכנסים)
+        removed = Counter(scheduled for _, scheduled in by_trip)
+        moved = sorted((realtime, scheduled) for (_, scheduled), realtime in by_trip.items()
+                       if realtime is not None and realtime >= after)
+
+        def static_departures():
+            for s in seconds[start:]:
+                if removed[s]:
+                    removed[s] -= 1
+                    continue
+                yield s, s
+
+        results = []
+        for departure in heapq.merge(static_departures(), moved):
+            results.append(departure)
+            if len(results) >= count:
+                break
+        return results
+
+    def next_departures(self, route, stop_code, when, count=3):
+        """כמו StopDepartures.next_departures, אבל לפי הזמן בפועל. מחזיר [(realtime, scheduled)] כ-datetime."""
+        by_date = self.static.departures.get((route, stop_code))
+        if not by_date:
+            return []
+
+        when_ts = self.static.timestamp(when)
+        first_service_day = (self.static.local_time(when_ts).date() - timedelta(days=1)).strftime(DATE_FORMAT)
+        candidates = []
+        # בלי עצירה מוקדמת כמו ב-StopDepartures: עיכוב שלילי (הקדמה) יכול להקדים יציאה
+        # של יום שירות מאוחר יותר לפני המועמדים שכבר נמצאו
+        for date_str in sorted(by_date):
+            if date_str < first_service_day:
+                continue
+            day_start = service_day_start(date_str, self.static.timezone)
+            after = int(when_ts - day_start)
+            candidates.extend((day_start + realtime, day_start + scheduled)
+                              for realtime, scheduled in self.departures_on(route, stop_code, date_str, after, count))
+        candidates.sort()
+
+        return [(self.static.local_time(realtime), self.static.local_time(scheduled)) for realtime, scheduled in candidates[:count]]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply a GTFS-realtime TripUpdates snapshot onto the stop departures.")
+    parser.add_argument('source', help="TripUpdates feed: .pb/.json file or http(s) URL.")
+    parser.add_argument('--departures', default=DEPARTURES_FILE, help="Output of stop_departures.py.")
+    parser.add_argument('--route', help="Query: route short name.")
+    parser.add_argument('--stop', help="Query: stop code.")
+    parser.add_argument('--at', help="Query time as 'YYYY-MM-DD HH:MM' (default: now).")
+    parser.add_argument('--count', type=int, default=3)
+    args = parser.parse_args()
+
+    overlay = RealtimeOverlay(load_stop_departures(args.departures))
+    summary = overlay.apply_feed(load_feed_message(args.source))
+    print(f"INFO: Applied realtime feed: {summary}")
+
+    if args.route and args.stop:
+        when = datetime.strptime(args.at, '%Y-%m-%d %H:%M') if args.at else overlay.static.now()
+        for realtime, scheduled in overlay.next_departures(args.route, args.stop, when, args.count):
+            delay_minutes = round((realtime - scheduled).total_seconds() / 60)
+            print(f"{args.route} @ {args.stop}: {realtime.strftime('%Y-%m-%d %H:%M')} "
+                  f"(scheduled {scheduled.strftime('%H:%M')}, {delay_minutes:+d} min)")
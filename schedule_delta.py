@@ -0,0 +1,227 @@
+# schedule_delta.py
+import os
+import json
+import hashlib
+import argparse
+from collections import Counter
+from difflib import SequenceMatcher
+
+from schedule_format import split_schedule_line
+
+# ----------------------------------------------------
+# פרסום שינויים (Delta) של schedule2.txt: במקום שכל לקוח יוריד את כל הקובץ בכל יום,
+# הבנייה משווה את הפלט החדש לקודם ומפרסמת לצדו Patch קטן (schedule2.patch.json)
+# ו-Manifest עם ה-Hash של הקובץ המלא ושל ה-Patch (schedule2.manifest.json).
+#
+# היום בשורה הוא offset מיום הבנייה (0 = היום), ולכן אחרי יום אחד כל השורות "זזות".
+# ה-Patch בונה כל יום בפלט החדש מיום מקור בפלט הקודם (היום עם הכי הרבה שורות זהות -
+# בדרך כלל אותו תאריך, או אותו יום בשבוע), כאשר שורה מזוהה לפי route|stop|name והזמנים שלה:
+#
+#   {"format": "bustimes-patch", "version": 1,
+#    "from": {"sha256": ...}, "to": {"sha256": ...},
+#    "days": [{"day": 0, "source": 1, "ops": [[start, count], "route|code|name|:times", ...]}, ...]}
+#
+# [start, count] = העתקה של count שורות רצופות מיום המקור, ומחרוזת = שורה חדשה.
+# השורות נשמרות בלי ה-day ("|:" במקומו), והוא מוכנס אחרי ה-'|' האחרון (שם תחנה לא מכיל '|', אבל יכול להתחיל ב-':')
+# לפי "day" של היום החדש.
+# הימים והשורות מופיעים בסדר של הקובץ החדש, כך ש-Patch + הקובץ הקודם = הקובץ החדש, בית אחר בית.
+# ----------------------------------------------------
+
+PATCH_FORMAT = 'bustimes-patch'
+PATCH_VERSION = 1
+MANIFEST_FORMAT = 'bustimes-manifest'
+MANIFEST_VERSION = 1
+PATCH_SUFFIX = '.patch.json'
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+def get_patch_path(output_path):
+    """schedule2.txt -> schedule2.patch.json"""
+    return f"{os.path.splitext(output_path)[0]}{PATCH_SUFFIX}"
+
+
+def get_manifest_path(output_path):
+    """schedule2.txt -> schedule2.manifest.json"""
+    return f"{os.path.splitext(output_path)[0]}{MANIFEST_SUFFIX}"
+
+
+def content_hash(text):
+    """SHA-256 (hex) של הטקסט בקידוד UTF-8 - אותו Hash שהלקוח מחשב."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def read_schedule_text(path):
+    """התוכן המדויק של קובץ הלוח (בלי המרת ירידות שורה), או None אם הקובץ לא קיים."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+def split_schedule_days(text):
+    """
+    טקסט בפורמט RouteID|StopCode|StopName|DayOffset:times -> { day: ['RouteID|StopCode|StopName|:times', ...] }
+    (השורות בלי ה-day, לפי הסדר בקובץ; הימים לפי סדר ההופעה).
+    """
+    days = {}
+    for line in text.split('\n') if text else ():
+        route_id, stop_code, stop_name, day_offset, times_part = split_schedule_line(line)
+        days.setdefault(day_offset, []).append(f"{route_id}|{stop_code}|{stop_name}|:{times_part}")
+    return days
+
+
+def _with_day(entry, day):
+    """'RouteID|StopCode|StopName|:times' -> 'RouteID|StopCode|StopName|day:times'"""
+    head, tail = entry.rsplit('|', 1)
+    return f"{head}|{day}{tail}"
+
+
+def _day_ops(source_entries, entries):
+    """רצף הפעולות שבונה את entries מ-source_entries: העתקות של קטעים זהים ושורות חדשות."""
+    ops = []
+    matcher = SequenceMatcher(None, source_entries, entries, autojunk=False)
+    for tag, source_start, source_end, start, end in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([source_start, source_end - source_start])
+        elif tag in ('replace', 'insert'):
+            ops.extend(entries[start:end])
+    return ops
+
+
+def build_schedule_patch(old_text, new_text):
+    """ה-Patch (dict) שהופך את old_text ל-new_text."""
+    old_days = split_schedule_days(old_text)
+    old_counts = {day: Counter(entries) for day, entries in old_days.items()}
+
+    days = []
+    for day, entries in split_schedule_days(new_text).items():
+        # יום המקור: היום הקודם עם הכי הרבה שורות זהות (בתיקו - ה-offset הנמוך)
+        counts = Counter(entries)
+        source = max(sorted(old_counts), key=lambda old_day: sum((old_counts[old_day] & counts).values()), default=None)
+        ops = _day_ops(old_days[source], entries) if source is not None else list(entries)
+        days.append({'day': day, 'source': source, 'ops': ops})
+
+    return {
+        'format': PATCH_FORMAT,
+        'version': PATCH_VERSION,
+        'from': {'sha256': content_hash(old_text)},
+        'to': {'sha256': content_hash(new_text)},
+        'days': days,
+    }
+
+
+def apply_schedule_patch(old_text, patch):
+    """
+    המימוש המחייב של הלקוח: Patch + הקובץ הקודם -> הקובץ החדש.
+    זורק Exception אם ה-Patch לא שייך לקובץ הקודם, או אם התוצאה לא תואמת את ה-Hash שב-Patch.
+    """
+    if patch.get('format') != PATCH_FORMAT:
+        raise Exception(f"Not a {PATCH_FORMAT} file (format: {patch.get('format')}).")
+    if patch.get('version') != PATCH_VERSION:
+        raise Exception(f"Unsupported {PATCH_FORMAT} version {patch.get('version')}. Expected {PATCH_VERSION}.")
+    if content_hash(old_text) != patch['from']['sha256']:
+        raise Exception("The patch does not apply to this schedule (base sha256 mismatch).")
+
+    old_days = split_schedule_days(old_text)
+    lines = []
+    for day_patch in patch['days']:
+        source_entries = old_days.get(day_patch['source'], [])
+        day = day_patch['day']
+        for op in day_patch['ops']:
+            if isinstance(op, str):
+                lines.append(_with_day(op, day))
+            else:
+                start, count = op
+                lines.extend(_with_day(entry, day) for entry in source_entries[start:start + count])
+
+    new_text = '\n'.join(lines)
+    if content_hash(new_text) != patch['to']['sha256']:
+        raise Exception("Patched schedule does not match the target sha256.")
+    return new_text
+
+
+def _write_json(path, data):
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(payload)
+    return len(payload)
+
+
+def publish_schedule_delta(output_path, previous_text, build_date):
+    """
+    כותב ליד output_path את ה-Manifest, ואת ה-Patch מ-previous_text (הפלט של הבנייה הקודמת, או None).
+    לפני הכתיבה ה-Patch מוחל על הקובץ הקודם ונבדק מול הקובץ החדש.
+    מחזיר את ה-Manifest (dict).
+    """
+    new_text = read_schedule_text(output_path)
+    if new_text is None:
+        raise Exception(f"Cannot publish a delta: {output_path} was not written.")
+
+    manifest = {
+        'format': MANIFEST_FORMAT,
+        'version': MANIFEST_VERSION,
+        'date': build_date,
+        'snapshot': {'path': os.path.basename(output_path), 'sha256': content_hash(new_text),
+                     'bytes': len(new_text.encode('utf-8'))},
+        'patch': None,
+    }
+
+    patch_path = get_patch_path(output_path)
+    manifest_path = get_manifest_path(output_path)
+    previous_patch = None
+    if previous_text == new_text and os.path.exists(manifest_path) and os.path.exists(patch_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            previous_patch = json.load(f).get('patch')
+
+    if previous_patch and previous_patch.get('to_sha256') == manifest['snapshot']['sha256']:
+        # בנייה חוזרת עם אותו פלט: ה-Patch מהבנייה שלפניה עדיין נכון ללקוחות שלא התעדכנו
+        manifest['patch'] = previous_patch
+    elif previous_text is not None and previous_text != new_text:
+        patch = build_schedule_patch(previous_text, new_text)
+        # ההוכחה: המימוש של הלקוח משחזר בדיוק את הקובץ החדש
+        if apply_schedule_patch(previous_text, patch) != new_text:
+            raise Exception("Schedule patch failed the round-trip check.")
+        patch_bytes = _write_json(patch_path, patch)
+        literal_lines = sum(isinstance(op, str) for day_patch in patch['days'] for op in day_patch['ops'])
+        manifest['patch'] = {'path': os.path.basename(patch_path), 'from_sha256': patch['from']['sha256'],
+                             'to_sha256': patch['to']['sha256'], 'bytes': patch_bytes, 'new_lines': literal_lines}
+        print(f"SUCCESS: Wrote {patch_path} ({patch_bytes} bytes, {literal_lines} new lines; "
+              f"full schedule is {manifest['snapshot']['bytes']} bytes).")
+    elif os.path.exists(patch_path):
+        # Patch ישן לא מתאים לקובץ הנוכחי - הלקוחות יורידו את הקובץ המלא
+        os.remove(patch_path)
+
+    _write_json(manifest_path, manifest)
+    print(f"SUCCESS: Wrote {manifest_path}.")
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or apply a schedule2.txt patch (reference implementation of the client).")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    diff_parser = subparsers.add_parser('diff', help="Write the patch from OLD to NEW.")
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new')
+    diff_parser.add_argument('--output', required=True)
+    apply_parser = subparsers.add_parser('apply', help="Apply PATCH to OLD.")
+    apply_parser.add_argument('old')
+    apply_parser.add_argument('patch')
+    apply_parser.add_argument('--output', help="Write the patched schedule here (default: stdout).")
+    apply_parser.add_argument('--check', metavar='NEW', help="Compare the patched schedule with this file.")
+    args = parser.parse_args()
+
+    if args.command == 'diff':
+        size = _write_json(args.output, build_schedule_patch(read_schedule_text(args.old), read_schedule_text(args.new)))
+        print(f"SUCCESS: Wrote {args.output} ({size} bytes).")
+    else:
+        with open(args.patch, encoding='utf-8') as f:
+            patched = apply_schedule_patch(read_schedule_text(args.old), json.load(f))
+        if args.check:
+            if patched != read_schedule_text(args.check):
+                raise SystemExit(f"ERROR: {args.old} + {args.patch} does not match {args.check}.")
+            print(f"SUCCESS: {args.old} + {args.patch} matches {args.check}.")
+        elif args.output:
+            with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                f.write(patched)
+        else:
+            print(patched)
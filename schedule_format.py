@@ -0,0 +1,186 @@
+# schedule_format.py
+import os
+import json
+import gzip
+import argparse
+
+from schedule_table import parse_departure_minutes, format_minutes
+
+try:
+    import brotli
+except ImportError:  # brotli אופציונלי - בלעדיו נכתבת רק גרסת ה-gzip
+    brotli = None
+
+# ----------------------------------------------------
+# פורמט פלט קומפקטי לצד schedule2.txt: טבלת מחרוזות אחת לקווים, קודי תחנות ושמות תחנות,
+# וזמנים כדקות מחצות בקידוד דלתא. נכתב כ-JSON (schedule2.json) ובנוסף בגרסאות דחוסות
+# מראש (.json.gz, ו-.json.br אם brotli מותקן).
+#
+# מבנה (גרסה 2):
+#   {"format": "bustimes-schedule", "version": 2,
+#    "strings": [...],
+#    "patterns": [[first_minute, delta, delta, ...], ...],
+#    "rows": [[route, stop_code, stop_name, day_offset, pattern], ...]}
+# route/stop_code/stop_name הם אינדקסים ל-strings, ו-pattern הוא אינדקס ל-patterns:
+# רשימת זמנים שחוזרת בכמה ימים (למשל ראשון-חמישי) או בכמה תחנות נשמרת פעם אחת בלבד.
+# סדר השורות זהה לסדר ב-schedule2.txt.
+# גרסה 1 (עדיין נקראת): "rows": [[route, stop_code, stop_name, day_offset, first_minute, delta, ...], ...]
+# ----------------------------------------------------
+
+FORMAT_NAME = 'bustimes-schedule'
+FORMAT_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+COMPACT_SUFFIX = '.json'
+
+
+def get_compact_path(output_path):
+    """schedule2.txt -> schedule2.json"""
+    return f"{os.path.splitext(output_path)[0]}{COMPACT_SUFFIX}"
+
+
+def split_schedule_line(line):
+    """
+    'RouteID|StopCode|StopName|DayOffset:times' -> (route_id, stop_code, stop_name, day_offset, times_part).
+    שם התחנה עלול להכיל ':' (וגם להתחיל בו), ולכן מפצלים קודם לפי '|'. כל קורא של הפורמט עובר כאן.
+    """
+    route_id, stop_code, rest = line.split('|', 2)
+    stop_name, day_part = rest.rsplit('|', 1)
+    day_offset, times_part = day_part.split(':', 1)
+    return route_id, stop_code, stop_name, int(day_offset), times_part
+
+
+def _encode_times(times_part):
+    """'HH:MM,HH:MM,...' -> [דקה ראשונה, דלתא, דלתא, ...]"""
+    deltas = []
+    previous = 0
+    for time_str in times_part.split(','):
+        minutes = parse_departure_minutes(time_str)
+        # רק זמן שהפענוח מחזיר בדיוק כמו שהוא (HH:MM) - אחרת ההלוך-חזור לא יהיה זהה
+        if minutes < 0 or format_minutes(minutes) != time_str:
+            raise Exception(f"Invalid departure time '{time_str}'. Expected HH:MM.")
+        deltas.append(minutes - previous)
+        previous = minutes
+    return deltas
+
+
+def encode_schedule_lines(lines, version=FORMAT_VERSION):
+    """
+    מקודד שורות בפורמט RouteID|StopCode|StopName|DayOffset:times למבנה הקומפקטי (dict).
+    הזמנים נשמרים בסדר שבו הופיעו בשורה, כך שהפענוח מחזיר בדיוק את אותן שורות.
+    כל רשימת זמנים ייחודית נשמרת פעם אחת כ-pattern, והשורות מפנות אליה.
+    version=1: הזמנים בתוך כל שורה, בלי patterns (לקוחות ישנים ובדיקות).
+    """
+    if version not in SUPPORTED_VERSIONS:
+        raise Exception(f"Unsupported {FORMAT_NAME} version {version}. Expected one of {SUPPORTED_VERSIONS}.")
+    strings = []
+    string_ids = {}
+    patterns = []
+    pattern_ids = {}
+
+    def intern(value):
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = string_ids[value] = len(strings)
+            strings.append(value)
+        return string_id
+
+    rows = []
+    for line in lines:
+        route_id, stop_code, stop_name, day_offset, times_part = split_schedule_line(line)
+        row = [intern(route_id), intern(stop_code), intern(stop_name), day_offset]
+
+        if version == 1:
+            rows.append(row + _encode_times(times_part))
+            continue
+        pattern_id = pattern_ids.get(times_part)
+        if pattern_id is None:
+            pattern_id = pattern_ids[times_part] = len(patterns)
+            patterns.append(_encode_times(times_part))
+        rows.append(row + [pattern_id])
+
+    if version == 1:
+        return {'format': FORMAT_NAME, 'version': 1, 'strings': strings, 'rows': rows}
+    return {'format': FORMAT_NAME, 'version': version, 'strings': strings, 'patterns': patterns, 'rows': rows}
+
+
+def _decode_times(deltas):
+    times = []
+    minutes = 0
+    for delta in deltas:
+        minutes += delta
+        times.append(format_minutes(minutes))
+    return ','.join(times)
+
+
+def decode_schedule(compact):
+    """הפעולה ההפוכה: מבנה קומפקטי (dict, או JSON כ-str/bytes) -> רשימת שורות בפורמט הטקסט."""
+    if isinstance(compact, (bytes, str)):
+        compact = json.loads(compact)
+
+    if compact.get('format') != FORMAT_NAME:
+        raise Exception(f"Not a {FORMAT_NAME} file (format: {compact.get('format')}).")
+    version = compact.get('version')
+    if version not in SUPPORTED_VERSIONS:
+        raise Exception(f"Unsupported {FORMAT_NAME} version {version}. Expected one of {SUPPORTED_VERSIONS}.")
+
+    strings = compact['strings']
+    if version == 1:
+        times_of = lambda row: _decode_times(row[4:])
+    else:
+        # כל pattern מפוענח פעם אחת
+        pattern_times = [_decode_times(deltas) for deltas in compact['patterns']]
+        times_of = lambda row: pattern_times[row[4]]
+
+    return [f"{strings[row[0]]}|{strings[row[1]]}|{strings[row[2]]}|{row[3]}:{times_of(row)}" for row in compact['rows']]
+
+
+def load_compact_schedule(path):
+    """קורא קובץ קומפקטי (.json / .json.gz / .json.br) ומחזיר את שורות הטקסט."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.endswith('.gz'):
+        data = gzip.decompress(data)
+    elif path.endswith('.br'):
+        if brotli is None:
+            raise Exception(f"Cannot read {path}: the brotli package is not installed.")
+        data = brotli.decompress(data)
+    return decode_schedule(data)
+
+
+def write_compact_schedule(lines, output_path):
+    """
+    כותב את השורות בפורמט הקומפקטי ליד קובץ הטקסט (schedule2.txt -> schedule2.json),
+    ואת הגרסאות הדחוסות מראש. מחזיר את רשימת הקבצים שנכתבו.
+    """
+    compact_path = get_compact_path(output_path)
+    data = json.dumps(encode_schedule_lines(lines), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    # mtime=0: אותו תוכן -> אותם בתים, כדי שלא ייווצר Commit בלי שינוי אמיתי
+    variants = [(compact_path, data), (f"{compact_path}.gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((f"{compact_path}.br", brotli.compress(data, quality=11)))
+    else:
+        print("WARNING: brotli is not installed. Skipping the .br variant.")
+
+    for path, payload in variants:
+        with open(path, 'wb') as f:
+            f.write(payload)
+        print(f"SUCCESS: Wrote {path} ({len(payload)} bytes).")
+    return [path for path, _ in variants]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Decode a compact schedule file back to the text format.")
+    parser.add_argument('compact_file', help="schedule2.json / .json.gz / .json.br")
+    parser.add_argument('--check', metavar='TEXT_FILE', help="Compare the decoded lines with this schedule2.txt.")
+    args = parser.parse_args()
+
+    decoded_lines = load_compact_schedule(args.compact_file)
+    if args.check:
+        with open(args.check, encoding='utf-8') as f:
+            expected_lines = f.read().split('\n')
+        if decoded_lines != expected_lines:
+            raise SystemExit(f"ERROR: {args.compact_file} does not match {args.check}.")
+        print(f"SUCCESS: {args.compact_file} matches {args.check} ({len(decoded_lines)} lines).")
+    else:
+        print('\n'.join(decoded_lines))
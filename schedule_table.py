@@ -0,0 +1,155 @@
+# schedule_table.py
+import sys
+from array import array
+
+# ----------------------------------------------------
+# ייצוג קומפקטי בזיכרון של לוח הזמנים (במקום dict של dict של {'code', 'name', 'times': [str, ...]}):
+# קווים ותחנות ממוספרים פעם אחת (ScheduleStrings, משותף לכל ימי החלון),
+# ולכל (קו, תחנה) ביום יש array('H') של דקות מחצות - 2 בתים ליציאה במקום מחרוזת.
+# סדר הפלט נשמר: קווים לפי gtfs_utils.format_schedule_lines, ותחנות לפי ההופעה הראשונה בקו.
+# ----------------------------------------------------
+
+# array('H') = uint16: עד 65535 דקות, הרבה מעבר ל-48:00 של יום שירות
+TIME_TYPECODE = 'H'
+
+
+def parse_gtfs_time(time_str):
+    """
+    'HH:MM' / 'H:MM:SS' (גם מעבר ל-24:00, כמו ב-GTFS) -> שניות מחצות. מחזיר -1 עבור זמן ריק או לא תקין.
+    הפענוח היחיד של זמנים בפרויקט: שורה פגומה ב-stop_times מדולגת ולא מפילה את הבנייה.
+    """
+    hours, _, rest = time_str.strip().partition(':')
+    minutes, _, seconds = rest.partition(':')
+    if not hours.isdigit() or len(minutes) != 2 or not minutes.isdigit() or (seconds and not seconds.isdigit()):
+        return -1
+    return int(hours) * 3600 + int(minutes) * 60 + (int(seconds) if seconds else 0)
+
+
+def parse_departure_minutes(time_str):
+    """כמו parse_gtfs_time, בדקות (השניות נחתכות). מחזיר -1 עבור זמן ריק או לא תקין."""
+    seconds = parse_gtfs_time(time_str)
+    return seconds // 60 if seconds >= 0 else -1
+
+
+def format_minutes(minutes):
+    """דקות מחצות -> 'HH:MM'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class ScheduleStrings:
+    """מספור של שמות קווים ושל תחנות (stop_id -> קוד ושם), לפי סדר ההופעה הראשונה."""
+
+    __slots__ = ('route_names', 'route_index', 'stop_codes', 'stop_names', 'stop_index')
+
+    def __init__(self):
+        self.route_names = []
+        self.route_index = {}
+        self.stop_codes = []
+        self.stop_names = []
+        self.stop_index = {}
+
+    def route(self, route_short_name):
+        route = self.route_index.get(route_short_name)
+        if route is None:
+            route = self.route_index[route_short_name] = len(self.route_names)
+            self.route_names.append(route_short_name)
+        return route
+
+    def stop(self, stop_id, stop_info):
+        stop = self.stop_index.get(stop_id)
+        if stop is None:
+            stop = self.stop_index[stop_id] = len(self.stop_codes)
+            self.stop_codes.append(stop_info['code'])
+            self.stop_names.append(stop_info['name'])
+        return stop
+
+    def memory_bytes(self):
+        containers = (self.route_names, self.route_index, self.stop_codes, self.stop_names, self.stop_index)
+        # כל מחרוזת נספרת פעם אחת, גם אם היא מופיעה בכמה רשימות
+        values = {id(value): value for value in (*self.route_names, *self.stop_codes, *self.stop_names, *self.stop_index)}
+        return (sys.getsizeof(self) + sum(sys.getsizeof(container) for container in containers)
+                + sum(sys.getsizeof(value) for value in values.values()))
+
+
+class DaySchedule:
+    """
+    לוח הזמנים של יום אחד: times[(route, stop)] = array('H') של דקות, לפי סדר ההוספה.
+    route/stop הם המספרים מ-ScheduleStrings (שמשותף לכל הימים).
+    """
+
+    __slots__ = ('strings', 'times')
+
+    def __init__(self, strings=None):
+        self.strings = strings if strings is not None else ScheduleStrings()
+        self.times = {}
+
+    def add(self, route_short_name, stop_id, stop_info, departure_time):
+        """מוסיף יציאה אחת (departure_time כמחרוזת HH:MM). מחזיר False אם הזמן לא תקין."""
+        minutes = parse_departure_minutes(departure_time)
+        if minutes < 0:
+            return False
+        self.add_minutes(self.strings.route(route_short_name), self.strings.stop(stop_id, stop_info), minutes)
+        return True
+
+    def add_minutes(self, route, stop, minutes):
+        times = self.times.get((route, stop))
+        if times is None:
+            times = self.times[(route, stop)] = array(TIME_TYPECODE)
+        times.append(minutes)
+
+    def __bool__(self):
+        return bool(self.times)
+
+    def route_count(self):
+        return len({route for route, _ in self.times})
+
+    def departure_count(self):
+        return sum(len(times) for times in self.times.values())
+
+    def iter_rows(self):
+        """
+        (route_short_name, [(stop_code, stop_name, times), ...]) לכל קו, בסדר ההוספה.
+        times הוא ה-array עצמו (לא ממוין).
+        """
+        stops_by_route = {}
+        for (route, stop), times in self.times.items():
+            stops_by_route.setdefault(route, []).append((self.strings.stop_codes[stop], self.strings.stop_names[stop], times))
+        for route, stops in stops_by_route.items():
+            yield self.strings.route_names[route], stops
+
+    def memory_bytes(self):
+        """הזיכרון של היום הזה בלבד (בלי ScheduleStrings המשותף)."""
+        return (sys.getsizeof(self) + sys.getsizeof(self.times)
+                + sum(sys.getsizeof(key) + sys.getsizeof(times) for key, times in self.times.items()))
+
+
+class WeeklySchedule(dict):
+    """{ day_offset: DaySchedule } - יום חדש נוצר בגישה הראשונה, וכל הימים חולקים ScheduleStrings אחד."""
+
+    __slots__ = ('strings',)
+
+    def __init__(self):
+        super().__init__()
+        self.strings = ScheduleStrings()
+
+    def __missing__(self, day_offset):
+        day_schedule = self[day_offset] = DaySchedule(self.strings)
+        return day_schedule
+
+
+def measure_schedule_memory(schedules):
+    """
+    schedules: DaySchedule-ים (ימים כפולים מ-expand_service_days מפנים לאותו אובייקט ונספרים פעם אחת).
+    מחזיר {'memory_bytes', 'departures', 'bytes_per_departure'} - הזיכרון של המבנה כולו (כולל המחרוזות),
+    ביחס ליציאות שנשמרו בפועל.
+    """
+    unique_days = {id(day_schedule): day_schedule for day_schedule in schedules}.values()
+    unique_strings = {id(day_schedule.strings): day_schedule.strings for day_schedule in unique_days}.values()
+    memory_bytes = sum(day_schedule.memory_bytes() for day_schedule in unique_days)
+    memory_bytes += sum(strings.memory_bytes() for strings in unique_strings)
+    departures = sum(day_schedule.departure_count() for day_schedule in unique_days)
+    return {
+        'memory_bytes': memory_bytes,
+        'departures': departures,
+        'bytes_per_departure': round(memory_bytes / departures, 1) if departures else None,
+    }
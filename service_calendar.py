@@ -0,0 +1,139 @@
+# service_calendar.py
+from datetime import datetime
+
+# ----------------------------------------------------
+# לוח השירות של ה-Feed לפי תאריך: calendar.txt (ימי שבוע בין start_date ל-end_date)
+# ו-calendar_dates.txt (הוספה/ביטול בתאריך מסוים, למשל חגים).
+# נבנה פעם אחת כ-Bitmap של שירות x תאריך על כל חלון התוקף של ה-Feed:
+# לכל תאריך מספר שלם שבו ביט s דולק אם השירות ה-s פעיל, כך שבדיקה לתאריך היא O(1).
+# ----------------------------------------------------
+
+DATE_FORMAT = '%Y%m%d'
+# calendar_dates.txt: exception_type
+SERVICE_ADDED = '1'
+SERVICE_REMOVED = '2'
+
+
+def parse_gtfs_date(date_str):
+    """'YYYYMMDD' -> date"""
+    return datetime.strptime(date_str.strip(), DATE_FORMAT).date()
+
+
+def gtfs_day_index(day):
+    """אינדקס היום בשבוע לפי GTFS (0=ראשון, 6=שבת)."""
+    return (day.weekday() + 1) % 7
+
+
+class ServiceCalendar:
+    """
+    date_masks[i] = הביטים של השירותים הפעילים בתאריך start_date + i.
+    service_ids[s] = ה-service_id של ביט s.
+    """
+
+    def __init__(self, start_date, service_ids, date_masks):
+        self.start_date = start_date
+        self.service_ids = service_ids
+        self.date_masks = date_masks
+        self._service_index = {service_id: s for s, service_id in enumerate(service_ids)}
+
+    @classmethod
+    def from_rows(cls, calendar_rows, calendar_dates_rows):
+        """
+        calendar_rows: (service_id, sunday, ..., saturday, start_date, end_date)
+        calendar_dates_rows: (service_id, date, exception_type)
+        """
+        weekly = []
+        for service_id, *day_flags, start_str, end_str in calendar_rows:
+            if not start_str or not end_str:
+                print(f"WARNING: Service {service_id} has no start_date/end_date in calendar.txt. Ignoring.")
+                continue
+            weekly.append((service_id, day_flags, parse_gtfs_date(start_str), parse_gtfs_date(end_str)))
+        exceptions = [(service_id, parse_gtfs_date(date_str), exception_type)
+                      for service_id, date_str, exception_type in calendar_dates_rows if date_str]
+
+        # חלון התוקף: מהתאריך המוקדם ביותר ועד המאוחר ביותר בשני הקבצים
+        all_dates = [day for _, _, start, end in weekly for day in (start, end)] + [day for _, day, _ in exceptions]
+        if not all_dates:
+            return cls(None, [], [])
+        start_date = min(all_dates)
+        date_masks = [0] * ((max(all_dates) - start_date).days + 1)
+
+        service_ids = []
+        service_bits = {}
+
+        def get_bit(service_id):
+            bit = service_bits.get(service_id)
+            if bit is None:
+                bit = service_bits[service_id] = 1 << len(service_ids)
+                service_ids.append(service_id)
+            return bit
+
+        for service_id, day_flags, start, end in weekly:
+            bit = get_bit(service_id)
+            first = (start - start_date).days
+            last = (end - start_date).days
+            for day_index, flag in enumerate(day_flags):
+                if flag != '1':
+                    continue
+                # המופע הראשון של יום השבוע הזה בטווח, ומשם בקפיצות של שבוע
+                first_match = first + (day_index - gtfs_day_index(start)) % 7
+                for i in range(first_match, last + 1, 7):
+                    date_masks[i] |= bit
+
+        # calendar_dates גובר על calendar
+        for service_id, day, exception_type in exceptions:
+            bit = get_bit(service_id)
+            i = (day - start_date).days
+            if exception_type == SERVICE_ADDED:
+                date_masks[i] |= bit
+            elif exception_type == SERVICE_REMOVED:
+                date_masks[i] &= ~bit
+
+        print(f"DEBUG: Built service calendar for {len(service_ids)} services over {len(date_masks)} days "
+              f"({start_date.strftime(DATE_FORMAT)} - {max(all_dates).strftime(DATE_FORMAT)}).")
+        return cls(start_date, service_ids, date_masks)
+
+    def active_mask(self, day):
+        """הביטים של השירותים הפעילים בתאריך (0 מחוץ לחלון התוקף)."""
+        if self.start_date is None:
+            return 0
+        i = (day - self.start_date).days
+        return self.date_masks[i] if 0 <= i < len(self.date_masks) else 0
+
+    def _service_indices(self, mask):
+        while mask:
+            low_bit = mask & -mask
+            yield low_bit.bit_length() - 1
+            mask ^= low_bit
+
+    def active_service_ids(self, day):
+        """סט ה-service_ids הפעילים בתאריך."""
+        return {self.service_ids[s] for s in self._service_indices(self.active_mask(day))}
+
+    def is_active(self, service_id, day):
+        s = self._service_index.get(service_id)
+        return s is not None and bool(self.active_mask(day) >> s & 1)
+
+    def service_offsets(self, days):
+        """
+        days: רשימה של (day_offset, date).
+        מחזיר service_id -> tuple של ה-offsets שבהם השירות פעיל (כמו gtfs_utils.map_service_ids_for_days).
+        """
+        offsets_by_index = {}
+        for day_offset, day in days:
+            for s in self._service_indices(self.active_mask(day)):
+                offsets_by_index.setdefault(s, []).append(day_offset)
+        return {self.service_ids[s]: tuple(offsets) for s, offsets in sorted(offsets_by_index.items())}
+
+    def to_dict(self):
+        """ייצוג JSON (ל-Cache): המסכות נשמרות כמחרוזות hex."""
+        return {
+            'start_date': self.start_date.strftime(DATE_FORMAT) if self.start_date else None,
+            'service_ids': self.service_ids,
+            'date_masks': [format(mask, 'x') for mask in self.date_masks],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        start_date = parse_gtfs_date(data['start_date']) if data['start_date'] else None
+        return cls(start_date, data['service_ids'], [int(mask, 16) for mask in data['date_masks']])
@@ -0,0 +1,238 @@
+# stop_departures.py
+import json
+import zipfile
+import argparse
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from gtfs_utils import (
+    list_zip_contents,
+    read_agency_timezone,
+    map_service_ids_for_days,
+    map_stop_info,
+    convert_codes_to_ids,
+    scan_stop_times,
+    map_trip_days,
+    get_default_profile,
+    DEFAULT_TIMEZONE,
+)
+from pipeline_stats import PipelineStats
+from stop_grid import resolve_profile_locations
+
+# ----------------------------------------------------
+# זמני היציאה בתחנות שבקונפיג עצמן (ולא בתחנת המוצא של הקו):
+# לכל (קו, קוד תחנה, תאריך) מערך ממוין של שניות מתחילת יום השירות.
+# זמנים אחרי חצות (25:10) נשמרים כמו שהם (90600), ולכן המיון נכון.
+# תחילת יום השירות היא "צהריים פחות 12 שעות" באזור הזמן של הסוכנות (agency.txt), כמו במפרט GTFS.
+# השאילתה "N היציאות הבאות" היא חיפוש בינארי, בלי לסרוק שוב את ה-Feed.
+# בנוסף נשמר לכל trip_id היכן הוא מופיע, כדי שעדכוני זמן אמת (realtime_overlay) יעלו
+# לפי גודל העדכון ולא לפי גודל ה-Feed.
+# הבנייה השבועית (weekly_parser) מפרסמת את אותן יציאות גם כ-schedule2.stops.txt, מאותה סריקה מאוחדת.
+# ----------------------------------------------------
+
+DEPARTURES_FILE = 'departures.json'
+STOPS_SUFFIX = '.stops.txt'
+DEPARTURES_VERSION = 3
+SUPPORTED_VERSIONS = (1, 2, 3)
+DATE_FORMAT = '%Y%m%d'
+
+
+def get_stops_path(schedule_path):
+    """schedule2.txt -> schedule2.stops.txt (ליד קובץ הלוח)"""
+    base = schedule_path[:-4] if schedule_path.endswith('.txt') else schedule_path
+    return f"{base}{STOPS_SUFFIX}"
+
+
+def service_day_start(date_str, timezone=DEFAULT_TIMEZONE):
+    """
+    ה-Unix timestamp שממנו נמדדים זמני GTFS של יום השירות (גם מעבר ל-24:00):
+    צהריים פחות 12 שעות באזור הזמן של הסוכנות. ביום של מעבר שעון זה לא חצות.
+    """
+    noon = datetime.strptime(date_str, DATE_FORMAT).replace(hour=12, tzinfo=ZoneInfo(timezone))
+    return int(noon.timestamp()) - 12 * 3600
+
+
+class StopDepartures:
+    """
+    departures[(route, stop_code)][date_str] = array('i') ממוין של שניות.
+    stop_names[stop_code] = שם התחנה.
+    trips[trip_id] = (route, dates, [(stop_code, stop_id, stop_sequence, seconds), ...]) - רק תחנות מהקונפיג.
+    timezone = agency_timezone של ה-Feed. datetime בלי tzinfo (בקלט ובפלט) הוא שעון קיר באזור הזמן הזה.
+    """
+
+    def __init__(self):
+        self.departures = {}
+        self.stop_names = {}
+        self.trips = {}
+        self.timezone = DEFAULT_TIMEZONE
+
+    def now(self):
+        """השעה עכשיו באזור הזמן של ה-Feed (ללא tzinfo)."""
+        return datetime.now(ZoneInfo(self.timezone)).replace(tzinfo=None)
+
+    def timestamp(self, when):
+        """datetime -> Unix timestamp (בלי tzinfo: שעון קיר באזור הזמן של ה-Feed)."""
+        return (when if when.tzinfo is not None else when.replace(tzinfo=ZoneInfo(self.timezone))).timestamp()
+
+    def local_time(self, timestamp):
+        """Unix timestamp -> שעון קיר באזור הזמן של ה-Feed (ללא tzinfo)."""
+        return datetime.fromtimestamp(timestamp, ZoneInfo(self.timezone)).replace(tzinfo=None)
+
+    def add(self, route, stop_code, date_str, seconds):
+        by_date = self.departures.setdefault((route, stop_code), {})
+        by_date.setdefault(date_str, array('i')).append(seconds)
+
+    def finalize(self):
+        """ממיין את כל המערכים (פעם אחת, אחרי האיסוף)."""
+        for by_date in self.departures.values():
+            for date_str, seconds in by_date.items():
+                by_date[date_str] = array('i', sorted(seconds))
+        return self
+
+    def get_departures(self, route, stop_code, date_str):
+        """המערך הממוין של יום שירות אחד (ריק אם אין יציאות)."""
+        return self.departures.get((route, stop_code), {}).get(date_str, array('i'))
+
+    def next_departures(self, route, stop_code, when, count=3):
+        """
+        count היציאות הבאות מ-when (datetime) ואילך, כרשימה של datetime.
+        כולל נסיעות של יום השירות הקודם שיוצאות אחרי חצות (למשל 25:10 של אתמול).
+        """
+        if count < 1:
+            return []
+        by_date = self.departures.get((route, stop_code))
+        if not by_date:
+            return []
+
+        when_ts = self.timestamp(when)
+        first_service_day = (self.local_time(when_ts).date() - timedelta(days=1)).strftime(DATE_FORMAT)
+        candidates = []
+        for date_str in sorted(by_date):
+            if date_str < first_service_day:
+                continue
+            day_start = service_day_start(date_str, self.timezone)
+            # כל היציאות של יום שירות מאוחר יותר מגיעות אחרי המועמדים שכבר נמצאו
+            if len(candidates) >= count and day_start >= candidates[count - 1]:
+                break
+            seconds = by_date[date_str]
+            start = bisect_left(seconds, int(when_ts - day_start))
+            candidates.extend(day_start + s for s in seconds[start:start + count])
+            candidates.sort()
+
+        return [self.local_time(timestamp) for timestamp in candidates[:count]]
+
+    def to_dict(self):
+        rows = [[route, stop_code, date_str, list(seconds)]
+                for (route, stop_code), by_date in sorted(self.departures.items())
+                for date_str, seconds in sorted(by_date.items())]
+        trips = {trip_id: [route, list(dates), [list(stop) for stop in stops]]
+                 for trip_id, (route, dates, stops) in self.trips.items()}
+        return {'version': DEPARTURES_VERSION, 'timezone': self.timezone, 'stop_names': self.stop_names,
+                'departures': rows, 'trips': trips}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') not in SUPPORTED_VERSIONS:
+            raise Exception(f"Unsupported departures version {data.get('version')}. Expected one of {SUPPORTED_VERSIONS}.")
+        stop_departures = cls()
+        # גרסאות 1-2 נשמרו בלי אזור זמן (ה-Feed של משרד התחבורה)
+        stop_departures.timezone = data.get('timezone', DEFAULT_TIMEZONE)
+        stop_departures.stop_names = data['stop_names']
+        for route, stop_code, date_str, seconds in data['departures']:
+            stop_departures.departures.setdefault((route, stop_code), {})[date_str] = array('i', seconds)
+        # גרסה 1 נשמרה בלי trips (אין אפשרות להחיל עליה עדכוני זמן אמת)
+        for trip_id, (route, dates, stops) in data.get('trips', {}).items():
+            stop_departures.trips[trip_id] = (route, tuple(dates), [tuple(stop) for stop in stops])
+        return stop_departures
+
+
+def build_stop_departures(zip_path, days, profile=None, stats=None):
+    """
+    מעבר יחיד על stop_times.txt (gtfs_utils.scan_stop_times): כל שורה של Trip בקווים שבקונפיג שעוצרת באחת התחנות שבקונפיג.
+    days: רשימת הימים מ-weekly_parser.get_week_days (כל יום עם offset ו-date_str).
+    מחזיר StopDepartures.
+    """
+    profile = resolve_profile_locations(profile if profile is not None else get_default_profile(), zip_path)
+    stats = stats if stats is not None else PipelineStats()
+    stop_departures = StopDepartures()
+    date_by_offset = {day['offset']: day['date_str'] for day in days}
+
+    with zipfile.ZipFile(zip_path, 'r') as zfile:
+        zip_contents = list_zip_contents(zfile)
+        stop_departures.timezone = read_agency_timezone(zfile, zip_contents)
+
+        with stats.stage('calendar_mapping') as record:
+            service_offsets = map_service_ids_for_days(zfile, [(day['offset'], day['date_str']) for day in days], zip_contents)
+            record['rows_kept'] = len(service_offsets)
+
+        with stats.stage('stop_mapping') as record:
+            stop_id_to_info, stop_code_to_ids = map_stop_info(zfile, zip_contents)
+            critical_stop_ids = convert_codes_to_ids(stop_code_to_ids, profile)
+            record['rows_kept'] = len(critical_stop_ids)
+        if not critical_stop_ids:
+            print("WARNING: No valid Stop IDs found for the critical Stop Codes. No stop departures to collect.")
+            return stop_departures
+
+        # trip_id -> (קו, הימים שבהם הנסיעה פעילה), לקווים שבקונפיג בלבד
+        with stats.stage('trip_mapping') as record:
+            trip_days = map_trip_days(zfile, service_offsets, None, zip_contents, profile)
+            record['rows_kept'] = len(trip_days)
+
+        with stats.stage('stop_departures') as record:
+            stop_rows = []
+            scan_stop_times(zfile, zip_contents, profile, stop_rows)
+
+            kept = 0
+            for trip_id, stop_id, stop_sequence, seconds in stop_rows:
+                trip_info = trip_days.get(trip_id)
+                if trip_info is None or seconds < 0:
+                    continue
+
+                route_short_name, offsets = trip_info
+                stop_info = stop_id_to_info[stop_id]
+                stop_departures.stop_names[stop_info['code']] = stop_info['name']
+                dates = tuple(date_by_offset[day_offset] for day_offset in offsets)
+                for date_str in dates:
+                    stop_departures.add(route_short_name, stop_info['code'], date_str, seconds)
+
+                trip_stops = stop_departures.trips.setdefault(trip_id, (route_short_name, dates, []))[2]
+                trip_stops.append((stop_info['code'], stop_id, int(stop_sequence) if stop_sequence.isdigit() else -1, seconds))
+                kept += 1
+            record['rows_kept'] = kept
+
+    print(f"DEBUG: Collected departures for {len(stop_departures.departures)} (route, stop) pairs.")
+    return stop_departures.finalize()
+
+
+def write_stop_departures(stop_departures, output_path=DEPARTURES_FILE):
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(stop_departures.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+    print(f"SUCCESS: Stop departures written to {output_path}.")
+
+
+def load_stop_departures(path=DEPARTURES_FILE):
+    with open(path, encoding='utf-8') as f:
+        return StopDepartures.from_dict(json.load(f))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Collect departures at the configured stops and query the next ones.")
+    parser.add_argument('--zip', default='gtfs.zip')
+    parser.add_argument('--days', type=int, default=7, help="Number of days to collect, starting today (default: 7).")
+    parser.add_argument('--output', default=DEPARTURES_FILE)
+    parser.add_argument('--route', help="Query: route short name.")
+    parser.add_argument('--stop', help="Query: stop code.")
+    parser.add_argument('--at', help="Query time as 'YYYY-MM-DD HH:MM' (default: now).")
+    parser.add_argument('--count', type=int, default=3)
+    args = parser.parse_args()
+
+    from weekly_parser import get_week_days
+    result = build_stop_departures(args.zip, get_week_days(date.today(), args.days))
+    write_stop_departures(result, args.output)
+
+    if args.route and args.stop:
+        when = datetime.strptime(args.at, '%Y-%m-%d %H:%M') if args.at else result.now()
+        for departure in result.next_departures(args.route, args.stop, when, args.count):
+            print(f"{args.route} @ {args.stop}: {departure.strftime('%Y-%m-%d %H:%M')}")
@@ -0,0 +1,212 @@
+# stop_grid.py
+import math
+import time
+import heapq
+import zipfile
+import argparse
+from array import array
+
+from gtfs_utils import iter_csv_columns, list_zip_contents
+from gtfs_cache import get_feed_key
+
+# ----------------------------------------------------
+# אינדקס מרחבי (Grid) על התחנות ב-stops.txt: התחנות מחולקות לתאים של בערך 250x250 מטר
+# (במעלות, כך שאין צורך בהטלה), ושאילתת רדיוס / k התחנות הקרובות בודקת רק את התאים הסמוכים.
+# המרחק הסופי מחושב ב-Haversine. נבנה פעם אחת לכל Feed (ונשמר בזיכרון התהליך).
+# בנוסף: פתרון של [LOCATIONS] בקונפיג (שם = lat, lon, radius) לקודי תחנות בזמן הבנייה.
+# ----------------------------------------------------
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+DEFAULT_CELL_M = 250
+DEFAULT_NEAREST = 5
+
+# Grid לכל Feed (לפי get_feed_key), כדי שכמה פרופילים באותו תהליך לא יקראו שוב את stops.txt
+_grids = {}
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """מרחק (Haversine) במטרים בין שתי נקודות."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class StopGrid:
+    """
+    lats[i], lons[i], stop_ids[i], stop_codes[i], stop_names[i] - תחנה i.
+    cells[(row, col)] = array('i') של אינדקסי התחנות בתא (row = lat // cell_lat, col = lon // cell_lon).
+    """
+
+    def __init__(self, cell_m=DEFAULT_CELL_M):
+        self.cell_m = cell_m
+        self.stop_ids = []
+        self.stop_codes = []
+        self.stop_names = []
+        self.lats = array('d')
+        self.lons = array('d')
+        self.cells = {}
+        self.cell_lat = cell_m / METERS_PER_DEGREE
+        self.cell_lon = self.cell_lat
+        self.max_abs_lat = 0.0
+        # (min_row, max_row, min_col, max_col) של התאים שיש בהם תחנות - הגבול לחיפוש בטבעות
+        self.extent = None
+
+    @classmethod
+    def from_rows(cls, rows, cell_m=DEFAULT_CELL_M):
+        """rows: (stop_id, stop_code, stop_name, stop_lat, stop_lon). תחנות בלי קואורדינטות לא נכנסות."""
+        grid = cls(cell_m)
+        for stop_id, stop_code, stop_name, lat, lon in rows:
+            try:
+                lat, lon = float(lat), float(lon)
+            except ValueError:
+                continue
+            grid.stop_ids.append(stop_id)
+            grid.stop_codes.append(stop_code)
+            grid.stop_names.append(stop_name.strip())
+            grid.lats.append(lat)
+            grid.lons.append(lon)
+
+        if grid.lats:
+            # רוחב התא במעלות אורך לפי קו הרוחב הממוצע, כך שהתאים בערך ריבועיים
+            mean_lat = sum(grid.lats) / len(grid.lats)
+            grid.cell_lon = grid.cell_lat / max(math.cos(math.radians(mean_lat)), 0.01)
+            grid.max_abs_lat = max(abs(min(grid.lats)), abs(max(grid.lats)))
+        for i, (lat, lon) in enumerate(zip(grid.lats, grid.lons)):
+            grid.cells.setdefault(grid._cell(lat, lon), array('i')).append(i)
+        if grid.cells:
+            rows = [row for row, _ in grid.cells]
+            cols = [col for _, col in grid.cells]
+            grid.extent = (min(rows), max(rows), min(cols), max(cols))
+
+        print(f"DEBUG: Built stop grid with {len(grid.stop_ids)} stops in {len(grid.cells)} cells of ~{cell_m}m.")
+        return grid
+
+    def _cell(self, lat, lon):
+        return int(lat // self.cell_lat), int(lon // self.cell_lon)
+
+    def stop(self, i):
+        return {'stop_id': self.stop_ids[i], 'code': self.stop_codes[i], 'name': self.stop_names[i],
+                'lat': self.lats[i], 'lon': self.lons[i]}
+
+    def _distances(self, lat, lon, cells):
+        lats = self.lats
+        lons = self.lons
+        for cell in cells:
+            for i in self.cells.get(cell, ()):
+                yield distance_m(lat, lon, lats[i], lons[i]), i
+
+    def within(self, lat, lon, radius_m):
+        """כל התחנות במרחק radius_m מהנקודה: [(distance_m, i)] ממוין לפי מרחק."""
+        delta_lat = radius_m / METERS_PER_DEGREE
+        # מעלת אורך היא הקצרה ביותר בקו הרוחב הרחוק מהמשווה בתוך הטווח
+        far_lat = min(abs(lat) + delta_lat, 89.0)
+        delta_lon = radius_m / (METERS_PER_DEGREE * math.cos(math.radians(far_lat)))
+        first_row, first_col = self._cell(lat - delta_lat, lon - delta_lon)
+        last_row, last_col = self._cell(lat + delta_lat, lon + delta_lon)
+
+        cells = ((row, col) for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1))
+        return sorted(item for item in self._distances(lat, lon, cells) if item[0] <= radius_m)
+
+    def _ring_cells(self, center_row, center_col, ring):
+        """ההיקף של הריבוע בגודל ring סביב התא המרכזי - רק התאים שבתוך ה-extent."""
+        min_row, max_row, min_col, max_col = self.extent
+        top, bottom = center_row - ring, center_row + ring
+        left, right = center_col - ring, center_col + ring
+        cols = range(max(left, min_col), min(right, max_col) + 1)
+        rows = range(max(top + 1, min_row), min(bottom - 1, max_row) + 1)
+
+        cells = [(top, col) for col in cols] if min_row <= top <= max_row else []
+        if ring and min_row <= bottom <= max_row:
+            cells += [(bottom, col) for col in cols]
+        if min_col <= left <= max_col:
+            cells += [(row, left) for row in rows]
+        if ring and min_col <= right <= max_col:
+            cells += [(row, right) for row in rows]
+        return cells
+
+    def nearest(self, lat, lon, k=DEFAULT_NEAREST):
+        """k התחנות הקרובות לנקודה: [(distance_m, i)] ממוין לפי מרחק. חיפוש בטבעות של תאים סביב הנקודה."""
+        if not self.cells:
+            return []
+        center_row, center_col = self._cell(lat, lon)
+        min_row, max_row, min_col, max_col = self.extent
+        # נקודה מחוץ ל-extent (למשל lat/lon שגוי): הטבעות הראשונות ריקות, ומתחילים בראשונה שנוגעת בו
+        first_ring = max(min_row - center_row, center_row - max_row, min_col - center_col, center_col - max_col, 0)
+        max_ring = max(abs(center_row - min_row), abs(center_row - max_row),
+                       abs(center_col - min_col), abs(center_col - max_col))
+        # הצלע הקצרה של תא: כל תחנה בטבעת ring+1 רחוקה לפחות ring * min_side
+        min_side = METERS_PER_DEGREE * min(self.cell_lat, self.cell_lon * math.cos(math.radians(max(self.max_abs_lat, abs(lat)))))
+
+        best = []  # max-heap של (-distance, i) בגודל k
+        for ring in range(first_ring, max_ring + 1):
+            for distance, i in self._distances(lat, lon, self._ring_cells(center_row, center_col, ring)):
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, i))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, i))
+            if len(best) >= k and -best[0][0] <= ring * min_side:
+                break
+        return sorted((-neg_distance, i) for neg_distance, i in best)
+
+
+def load_stop_grid(zip_path, cell_m=DEFAULT_CELL_M):
+    """Grid של stops.txt מתוך ה-ZIP (נבנה פעם אחת לכל Feed בתהליך)."""
+    key = (get_feed_key(zip_path), cell_m)
+    grid = _grids.get(key)
+    if grid is None:
+        with zipfile.ZipFile(zip_path, 'r') as zfile:
+            zip_contents = list_zip_contents(zfile)
+            if 'stops.txt' not in zip_contents: raise Exception(f"File stops.txt is not in the archive!")
+            rows = iter_csv_columns(zfile, 'stops.txt', ('stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon'))
+            grid = _grids[key] = StopGrid.from_rows(rows, cell_m)
+    return grid
+
+
+def resolve_location_codes(grid, locations):
+    """
+    locations: [(name, lat, lon, radius_m)] מ-[LOCATIONS] בקונפיג.
+    מחזיר את קודי התחנות (stop_code) בכל הרדיוסים.
+    """
+    stop_codes = set()
+    for name, lat, lon, radius_m in locations:
+        found = [grid.stop_codes[i] for _, i in grid.within(lat, lon, radius_m) if grid.stop_codes[i]]
+        if not found:
+            print(f"WARNING: Location {name} ({lat}, {lon}, {radius_m}m) has no stops with a stop_code. Ignoring.")
+        else:
+            print(f"INFO: Location {name} resolved to {len(found)} stop codes within {radius_m}m.")
+        stop_codes.update(found)
+    return stop_codes
+
+
+def resolve_profile_locations(profile, zip_path):
+    """מוסיף ל-profile.critical_stop_codes את התחנות של ה-[LOCATIONS] שלו (אם יש). מחזיר את ה-profile."""
+    if profile.locations:
+        profile.critical_stop_codes |= resolve_location_codes(load_stop_grid(zip_path), profile.locations)
+    return profile
+
+
+def _parse_point(value):
+    lat, lon = (float(part) for part in value.split(','))
+    return lat, lon
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Nearest-stop and radius queries over stops.txt.")
+    parser.add_argument('point', type=_parse_point, help="Query point as 'lat,lon'.")
+    parser.add_argument('--zip', default='gtfs.zip')
+    parser.add_argument('--radius', type=float, help="Return all stops within this many meters (default: k nearest).")
+    parser.add_argument('-k', type=int, default=DEFAULT_NEAREST, help="Number of nearest stops.")
+    args = parser.parse_args()
+
+    stop_grid = load_stop_grid(args.zip)
+    lat, lon = args.point
+    started = time.perf_counter()
+    results = stop_grid.within(lat, lon, args.radius) if args.radius else stop_grid.nearest(lat, lon, args.k)
+    elapsed_us = (time.perf_counter() - started) * 1e6
+
+    for distance, i in results:
+        stop = stop_grid.stop(i)
+        print(f"{stop['code'] or '-':>8}  {distance:7.0f}m  {stop['name']} (stop_id {stop['stop_id']})")
+    print(f"DEBUG: {len(results)} stops in {elapsed_us:.0f}us.")
@@ -0,0 +1,31 @@
+# table_loader.py
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# ----------------------------------------------------
+# טעינת הטבלאות הקטנות (calendar, routes, trips) ב-Thread נפרד, בזמן שה-Thread הראשי
+# פורס וסורק את stop_times.txt - כך שהנתיב הקריטי הוא רק הסריקה של stop_times.
+# לכל Thread יש ZipFile משלו (ולא שיתוף של אותו File Handle), והפריסה של zlib משחררת את ה-GIL.
+# הפריסה המהירה (isal/zlib-ng) ומונה השורות המשותף נמצאים ב-gtfs_utils (open_zip_member, count_rows_read).
+# ----------------------------------------------------
+
+CALENDAR_FILES = ('calendar.txt', 'calendar_dates.txt')
+TRIP_FILES = ('routes.txt', 'trips.txt')
+
+
+@contextmanager
+def side_tables(zip_path, loader, *args):
+    """
+    מריץ loader(zfile, zip_contents, *args) ב-Thread נפרד ומחזיר Future לתוצאה.
+    ביציאה מה-with ממתינים לסיום ה-Thread (גם אם הקוד הראשי נכשל).
+    """
+    def run():
+        with zipfile.ZipFile(zip_path, 'r') as zfile:
+            return loader(zfile, zfile.namelist(), *args)
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gtfs-side-tables')
+    try:
+        yield executor.submit(run)
+    finally:
+        executor.shutdown(wait=True)
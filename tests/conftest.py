@@ -0,0 +1,11 @@
+# tests/conftest.py
+import os
+import sys
+
+# ----------------------------------------------------
+# המודולים של הפרויקט נמצאים בשורש ה-Repo (ולא ב-Package), ולכן מוסיפים אותו ל-sys.path.
+# gtfs_utils קורא את config.ini מהתיקייה הנוכחית בזמן ה-import - הבדיקות לא תלויות בו,
+# וכל אחת מעבירה Profile מפורש.
+# ----------------------------------------------------
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
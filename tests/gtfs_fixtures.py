@@ -0,0 +1,59 @@
+# tests/gtfs_fixtures.py
+import io
+import csv
+import zipfile
+from datetime import date, timedelta
+
+from weekly_parser import get_week_days, write_weekly_schedule
+from schedule_table import format_minutes
+
+# ----------------------------------------------------
+# Feed-ים קטנים לבדיקות: כל טבלה היא (header, rows), והקבצים נכתבים עם BOM ו-CRLF כמו ב-Feed האמיתי.
+# ----------------------------------------------------
+
+START_DATE = date(2026, 3, 1)  # יום ראשון
+
+STOPS_HEADER = ('stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon')
+ROUTES_HEADER = ('route_id', 'route_short_name')
+TRIPS_HEADER = ('route_id', 'service_id', 'trip_id')
+STOP_TIMES_HEADER = ('trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence')
+CALENDAR_HEADER = ('service_id', 'sunday', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday',
+                   'start_date', 'end_date')
+
+
+def write_feed(zip_path, tables):
+    """tables: { file_name: (header, rows) } -> gtfs.zip"""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zfile:
+        for file_name, (header, rows) in tables.items():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator='\r\n')
+            writer.writerow(['\ufeff' + header[0], *header[1:]])
+            writer.writerows(rows)
+            zfile.writestr(file_name, buffer.getvalue().encode('utf-8'))
+    return zip_path
+
+
+def every_day_calendar(service_id, start=START_DATE, days=90):
+    """שורת calendar.txt של שירות שפעיל כל יום בטווח."""
+    end = start + timedelta(days=days)
+    return (service_id, *('1' * 7), start.strftime('%Y%m%d'), end.strftime('%Y%m%d'))
+
+
+def trip_stop_times(trip_id, stops, first_minute, step=5):
+    """שורות stop_times.txt של נסיעה: stops לפי הסדר, כל step דקות מ-first_minute."""
+    rows = []
+    for sequence, stop_id in enumerate(stops, start=1):
+        time_str = f"{format_minutes(first_minute + (sequence - 1) * step)}:00"
+        rows.append((trip_id, time_str, time_str, stop_id, str(sequence)))
+    return rows
+
+
+def render_schedule(weekly_schedule, week_days, output_path):
+    """הטקסט של schedule2.txt עבור WeeklySchedule (דרך הכותב האמיתי)."""
+    write_weekly_schedule(weekly_schedule, week_days, str(output_path))
+    with open(output_path, encoding='utf-8', newline='') as f:
+        return f.read()
+
+
+def window(days=7, start=START_DATE):
+    return get_week_days(start, days)
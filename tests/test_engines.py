@@ -0,0 +1,114 @@
+# tests/test_engines.py
+from datetime import timedelta
+
+import pytest
+
+from gtfs_utils import Profile
+from gtfs_cache import load_feed_cache, is_cache_available, MAX_WINDOW_DAYS
+from gtfs_index import load_feed_index
+from weekly_parser import build_weekly_schedule_from_zip, build_weekly_schedule_from_cache, build_weekly_schedule_from_index
+from gtfs_fixtures import (
+    write_feed, every_day_calendar, trip_stop_times, render_schedule, window, START_DATE,
+    STOPS_HEADER, ROUTES_HEADER, TRIPS_HEADER, STOP_TIMES_HEADER, CALENDAR_HEADER,
+)
+
+# ----------------------------------------------------
+# כל המנועים (zip, cache, index) חייבים לייצר בדיוק את אותו schedule2.txt.
+# ----------------------------------------------------
+
+
+def build_all_engines(zip_path, week_days, profile, tmp_path):
+    """{ engine: טקסט הלוח } לכל מנוע שזמין בסביבה."""
+    outputs = {'zip': build_weekly_schedule_from_zip(zip_path, week_days, profile)}
+    outputs['index'] = build_weekly_schedule_from_index(load_feed_index(zip_path, str(tmp_path / 'index')), week_days, profile)
+    if is_cache_available():
+        outputs['cache'] = build_weekly_schedule_from_cache(load_feed_cache(zip_path, str(tmp_path / 'cache')), week_days, profile)
+    return {engine: render_schedule(weekly_schedule, week_days, tmp_path / f"{engine}.txt")
+            for engine, weekly_schedule in outputs.items()}
+
+
+@pytest.fixture
+def duplicate_code_feed(tmp_path):
+    """שתי תחנות עם אותו stop_code (100), וכל אחת מהן על נסיעה אחרת של קו 1."""
+    return write_feed(str(tmp_path / 'gtfs.zip'), {
+        'stops.txt': (STOPS_HEADER, [
+            ('S1', '100', 'רציף א', '32.1', '34.8'),
+            ('S2', '100', 'רציף ב', '32.1', '34.8'),
+            ('S3', '200', 'מסוף', '32.2', '34.9'),
+            ('S4', '300', 'אחרת', '32.3', '34.9'),
+        ]),
+        'routes.txt': (ROUTES_HEADER, [('R1', '1')]),
+        'trips.txt': (TRIPS_HEADER, [('R1', 'SV', 'T1'), ('R1', 'SV', 'T2'), ('R1', 'SV', 'T3')]),
+        'stop_times.txt': (STOP_TIMES_HEADER, [
+            *trip_stop_times('T1', ['S3', 'S1'], 7 * 60),
+            *trip_stop_times('T2', ['S3', 'S2'], 8 * 60),
+            *trip_stop_times('T3', ['S3', 'S4'], 9 * 60),
+        ]),
+        'calendar.txt': (CALENDAR_HEADER, [every_day_calendar('SV')]),
+    })
+
+
+def test_duplicate_stop_codes_select_all_stop_ids(duplicate_code_feed, tmp_path):
+    profile = Profile('test', ['1'], {'100'})
+    outputs = build_all_engines(duplicate_code_feed, window(), profile, tmp_path)
+
+    first_line = outputs['zip'].split('\n')[0]
+    # שתי הנסיעות שעוברות בקוד 100 (S1 ו-S2), ולא זו שעוברת רק ב-S4
+    assert first_line == '1|200|מסוף|0:07:00,08:00'
+    for engine, text in outputs.items():
+        assert text == outputs['zip'], engine
+
+
+def test_departures_at_configured_stops_match_across_engines(duplicate_code_feed, tmp_path):
+    profile = Profile('test', ['1'], {'100'})
+    week_days = window()
+    builders = {
+        'zip': lambda: build_weekly_schedule_from_zip(duplicate_code_feed, week_days, profile, with_stops=True),
+        'index': lambda: build_weekly_schedule_from_index(load_feed_index(duplicate_code_feed, str(tmp_path / 'index')),
+                                                          week_days, profile, with_stops=True),
+    }
+    if is_cache_available():
+        builders['cache'] = lambda: build_weekly_schedule_from_cache(load_feed_cache(duplicate_code_feed, str(tmp_path / 'cache')),
+                                                                     week_days, profile, with_stops=True)
+    outputs = {engine: render_schedule(build()[1], week_days, tmp_path / f"{engine}.stops.txt") for engine, build in builders.items()}
+
+    # היציאות בתחנה 100 עצמה (השנייה בכל נסיעה), לכל stop_id בנפרד
+    assert outputs['zip'].split('\n')[:2] == ['1|100|רציף א|0:07:05', '1|100|רציף ב|0:08:05']
+    for engine, text in outputs.items():
+        assert text == outputs['zip'], engine
+
+
+@pytest.fixture
+def long_window_feed(tmp_path):
+    """שירות יומי, ויום 18 בחלון הוא חג (calendar_dates): השירות הרגיל מבוטל ושירות החג פועל."""
+    holiday = (START_DATE + timedelta(days=18)).strftime('%Y%m%d')
+    return write_feed(str(tmp_path / 'gtfs.zip'), {
+        'stops.txt': (STOPS_HEADER, [('S1', '100', 'מרכז', '32.1', '34.8'), ('S2', '200', 'מסוף', '32.2', '34.9')]),
+        'routes.txt': (ROUTES_HEADER, [('R1', '1')]),
+        'trips.txt': (TRIPS_HEADER, [('R1', 'SV', 'T1'), ('R1', 'HOL', 'T2')]),
+        'stop_times.txt': (STOP_TIMES_HEADER, [
+            *trip_stop_times('T1', ['S1', 'S2'], 7 * 60),
+            *trip_stop_times('T2', ['S1', 'S2'], 10 * 60),
+        ]),
+        'calendar.txt': (CALENDAR_HEADER, [every_day_calendar('SV')]),
+        'calendar_dates.txt': (('service_id', 'date', 'exception_type'), [('SV', holiday, '2'), ('HOL', holiday, '1')]),
+    })
+
+
+def test_window_longer_than_16_days_matches_across_engines(long_window_feed, tmp_path):
+    week_days = window(21)
+    outputs = build_all_engines(long_window_feed, week_days, Profile('test', ['1'], {'100'}), tmp_path)
+
+    day_times = dict(line.split('|')[3].split(':', 1) for line in outputs['zip'].split('\n'))
+    # ביום 18 רק שירות החג (ביט 18 - מעבר ל-16 ביטים), ובשאר הימים רק השירות הרגיל
+    assert day_times['18'] == '10:00'
+    assert day_times['20'] == day_times['0'] == '07:00'
+    for engine, text in outputs.items():
+        assert text == outputs['zip'], engine
+
+
+@pytest.mark.skipif(not is_cache_available(), reason="numpy is not installed")
+def test_cache_rejects_window_longer_than_64_days(long_window_feed, tmp_path):
+    feed_cache = load_feed_cache(long_window_feed, str(tmp_path / 'cache'))
+    with pytest.raises(Exception, match='too long'):
+        build_weekly_schedule_from_cache(feed_cache, window(MAX_WINDOW_DAYS + 1), Profile('test', ['1'], {'100'}))
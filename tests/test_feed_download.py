@@ -0,0 +1,244 @@
+# tests/test_feed_download.py
+import io
+import os
+import sys
+import random
+import zipfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import feed_download
+
+# ----------------------------------------------------
+# הורדה מול שרת HTTP מקומי (http.server) שמתנהג כמו השרת של משרד התחבורה:
+# ETag / Last-Modified, תשובות 304 לבקשות מותנות, ו-206 לבקשות Range עם If-Range תואם.
+# ----------------------------------------------------
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIN_BYTES = 1000
+LAST_MODIFIED = 'Sun, 01 Mar 2026 03:00:00 GMT'
+
+
+def make_zip_bytes(seed=1, size=20000):
+    """ZIP תקין (מתחיל ב-PK\\x03\\x04) עם תוכן שלא נדחס, כדי שהגוף יהיה בגודל size בערך."""
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zfile:
+        zfile.writestr('stops.txt', bytes(rng.randrange(256) for _ in range(size)))
+    return buffer.getvalue()
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """מגיש את self.server.feed; כל בקשה נשמרת ב-self.server.requests (הכותרות שלה)."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        feed = self.server.feed
+        self.server.requests.append(dict(self.headers))
+        body = feed['body']
+        etag = feed.get('etag')
+        last_modified = feed.get('last_modified')
+
+        if (etag and self.headers.get('If-None-Match') == etag) or \
+                (not etag and last_modified and self.headers.get('If-Modified-Since') == last_modified):
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        status = 200
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') in (etag, last_modified):
+            start = int(range_header.split('=')[1].rstrip('-'))
+            body = body[start:]
+            status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', feed.get('content_type', 'application/zip'))
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        if last_modified:
+            self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+        # truncate_at: החיבור נסגר באמצע הגוף (כמו הורדה שנקטעה)
+        truncate_at = feed.get('truncate_at')
+        self.wfile.write(body if truncate_at is None else body[:truncate_at])
+
+
+@pytest.fixture
+def feed_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+    server.feed = {'body': make_zip_bytes(), 'etag': '"v1"', 'last_modified': LAST_MODIFIED}
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/gtfs.zip"
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'gtfs.zip'), str(tmp_path / 'gtfs.meta.json')
+
+
+def download(server, paths):
+    zip_path, meta_path = paths
+    return feed_download.download_feed(server.url, zip_path, meta_path, timeout=10, min_bytes=MIN_BYTES)
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_first_download_writes_zip_and_meta(feed_server, paths):
+    result = download(feed_server, paths)
+
+    assert result['changed'] is True
+    assert read_bytes(paths[0]) == feed_server.feed['body']
+    assert not os.path.exists(f"{paths[0]}.part")
+    meta = feed_download.load_meta(paths[1])
+    assert meta['etag'] == '"v1"'
+    assert meta['sha256'] == result['sha256'] == feed_download.file_sha256(paths[0])
+    # הבקשה הראשונה אינה מותנית
+    assert 'If-None-Match' not in feed_server.requests[0]
+
+
+def test_unchanged_feed_returns_304_by_etag(feed_server, paths):
+    first = download(feed_server, paths)
+    second = download(feed_server, paths)
+
+    assert second == {'changed': False, 'sha256': first['sha256'], 'bytes': len(feed_server.feed['body'])}
+    assert feed_server.requests[1]['If-None-Match'] == '"v1"'
+    assert feed_server.requests[1]['If-Modified-Since'] == LAST_MODIFIED
+
+
+def test_unchanged_feed_returns_304_by_last_modified(feed_server, paths):
+    feed_server.feed['etag'] = None
+    download(feed_server, paths)
+    second = download(feed_server, paths)
+
+    assert second['changed'] is False
+    assert 'If-None-Match' not in feed_server.requests[1]
+    assert feed_server.requests[1]['If-Modified-Since'] == LAST_MODIFIED
+
+
+def test_modified_local_file_is_not_sent_conditionally(feed_server, paths):
+    download(feed_server, paths)
+    with open(paths[0], 'ab') as f:
+        f.write(b'local edit')
+    result = download(feed_server, paths)
+
+    # ה-ZIP המקומי לא תואם ל-SHA-256 שנשמר, ולכן מורידים מחדש
+    assert 'If-None-Match' not in feed_server.requests[1]
+    assert read_bytes(paths[0]) == feed_server.feed['body']
+    assert result['changed'] is False
+
+
+def test_new_feed_version_is_downloaded(feed_server, paths):
+    first = download(feed_server, paths)
+    feed_server.feed.update(body=make_zip_bytes(seed=2), etag='"v2"')
+    second = download(feed_server, paths)
+
+    assert second['changed'] is True
+    assert second['sha256'] != first['sha256']
+    assert read_bytes(paths[0]) == feed_server.feed['body']
+
+
+def test_interrupted_download_resumes_with_range(feed_server, paths):
+    zip_path, meta_path = paths
+    body = feed_server.feed['body']
+    feed_server.feed['truncate_at'] = 5000
+
+    with pytest.raises(Exception, match='interrupted'):
+        download(feed_server, paths)
+    # החלק שהורד נשמר ב-.part, וה-ZIP עצמו לא נכתב
+    assert read_bytes(f"{zip_path}.part") == body[:5000]
+    assert not os.path.exists(zip_path)
+    assert feed_download.load_meta(meta_path)['partial']['etag'] == '"v1"'
+
+    feed_server.feed['truncate_at'] = None
+    result = download(feed_server, paths)
+
+    assert feed_server.requests[1]['Range'] == 'bytes=5000-'
+    assert feed_server.requests[1]['If-Range'] == '"v1"'
+    assert read_bytes(zip_path) == body
+    assert result['sha256'] == feed_download.file_sha256(zip_path)
+    assert not os.path.exists(f"{zip_path}.part")
+    assert 'partial' not in feed_download.load_meta(meta_path)
+
+
+def test_resume_restarts_when_feed_changed(feed_server, paths):
+    zip_path, _ = paths
+    feed_server.feed['truncate_at'] = 5000
+    with pytest.raises(Exception, match='interrupted'):
+        download(feed_server, paths)
+
+    # גרסה חדשה בשרת: If-Range לא תואם, והשרת מחזיר 200 עם הקובץ המלא
+    feed_server.feed.update(body=make_zip_bytes(seed=3), etag='"v2"', truncate_at=None)
+    download(feed_server, paths)
+
+    assert read_bytes(zip_path) == feed_server.feed['body']
+
+
+def test_html_error_page_is_rejected(feed_server, paths):
+    zip_path, meta_path = paths
+    download(feed_server, paths)
+    previous = read_bytes(zip_path)
+
+    feed_server.feed.update(body=b'<html><body>Service unavailable</body></html>' * 50, etag='"error"',
+                            content_type='text/html')
+    with pytest.raises(Exception, match='not a zip'):
+        download(feed_server, paths)
+
+    # ה-ZIP הקודם נשאר, וה-part נמחק (אין מה להמשיך ממנו)
+    assert read_bytes(zip_path) == previous
+    assert not os.path.exists(f"{zip_path}.part")
+    assert 'partial' not in feed_download.load_meta(meta_path)
+
+
+def test_truncated_zip_is_rejected(feed_server, paths):
+    zip_path, _ = paths
+    # השרת מצהיר על גוף קצר (ולא סוגר באמצע) - קובץ קטן מ-min_bytes נדחה
+    feed_server.feed['body'] = feed_server.feed['body'][:MIN_BYTES // 2]
+
+    with pytest.raises(Exception, match='too small'):
+        download(feed_server, paths)
+    assert not os.path.exists(zip_path)
+    assert not os.path.exists(f"{zip_path}.part")
+
+
+def test_build_key_changes_with_config_and_date(tmp_path):
+    config_path = tmp_path / 'config.ini'
+    config_path.write_text('[LINES]\n60 = 1\n', encoding='utf-8')
+    key = feed_download.get_build_key('abc', str(config_path))
+
+    assert feed_download.get_build_key('abc', str(config_path)) == key
+    assert feed_download.get_build_key('abd', str(config_path)) != key
+    config_path.write_text('[LINES]\n61 = 1\n', encoding='utf-8')
+    assert feed_download.get_build_key('abc', str(config_path)) != key
+
+
+def test_download_gtfs_skips_unchanged_build(tmp_path):
+    (tmp_path / 'gtfs.zip').write_bytes(make_zip_bytes())
+    (tmp_path / 'config.ini').write_text('[LINES]\n60 = 1\n\n[STOP_CODES]\n43334 = 1\n', encoding='utf-8')
+    (tmp_path / 'schedule2.txt').write_text('60|43334|תחנה|0:07:00', encoding='utf-8')
+    build_key = feed_download.get_build_key(feed_download.file_sha256(str(tmp_path / 'gtfs.zip')),
+                                            str(tmp_path / 'config.ini'))
+    feed_download.record_build(build_key, str(tmp_path / 'gtfs.meta.json'))
+
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, 'download_gtfs.py')], cwd=tmp_path,
+                            capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    assert 'Skipping parsing' in result.stdout
+    # אין קבצים ל-Commit, והפלט הקיים לא נגע
+    assert 'ACTION_OUTPUT_FILES_TO_COMMIT:\n' in result.stdout
+    assert (tmp_path / 'schedule2.txt').read_text(encoding='utf-8') == '60|43334|תחנה|0:07:00'
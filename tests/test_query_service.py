@@ -0,0 +1,92 @@
+# tests/test_query_service.py
+import json
+import asyncio
+from datetime import date
+
+import pytest
+
+from gtfs_utils import Profile
+from stop_departures import build_stop_departures
+from query_service import TimetableService
+from gtfs_fixtures import (
+    write_feed, every_day_calendar, trip_stop_times, window, START_DATE,
+    STOPS_HEADER, ROUTES_HEADER, TRIPS_HEADER, STOP_TIMES_HEADER, CALENDAR_HEADER,
+)
+
+# ----------------------------------------------------
+# פרמטרים לא תקינים מקבלים 400, ושגיאה לא צפויה מקבלת 500 - בלי לסגור את החיבור (Keep-Alive).
+# ה-Reload בונה את האינדקס מקובץ הקונפיג של השירות (--config), ולא מ-config.ini.
+# ----------------------------------------------------
+
+DATE_STR = START_DATE.strftime('%Y%m%d')
+
+
+def service_feed(zip_path, start=START_DATE):
+    return write_feed(zip_path, {
+        'stops.txt': (STOPS_HEADER, [('S1', '100', 'מרכז', '32.1', '34.8'), ('S2', '200', 'מסוף', '32.1', '34.8')]),
+        'routes.txt': (ROUTES_HEADER, [('R1', '1')]),
+        'trips.txt': (TRIPS_HEADER, [('R1', 'SV', 'T1'), ('R1', 'SV', 'T2')]),
+        'stop_times.txt': (STOP_TIMES_HEADER, [*trip_stop_times('T1', ['S1', 'S2'], 7 * 60),
+                                               *trip_stop_times('T2', ['S1', 'S2'], 8 * 60)]),
+        'calendar.txt': (CALENDAR_HEADER, [every_day_calendar('SV', start)]),
+    })
+
+
+@pytest.fixture
+def service(tmp_path):
+    zip_path = service_feed(str(tmp_path / 'gtfs.zip'))
+    service = TimetableService(zip_path)
+    service.departures = build_stop_departures(zip_path, window(2), Profile('test', ['1'], {'100'}))
+    return service
+
+
+@pytest.mark.parametrize('count', ['0', '-1', 'x'])
+def test_count_must_be_positive(service, count):
+    for date_param in (f"&date={DATE_STR}", ''):
+        status, body = service.dispatch('GET', f"/departures?route=1&stop=100&count={count}{date_param}")
+        assert status == 400, body
+
+
+def test_departures_for_a_day(service):
+    status, body = service.dispatch('GET', f"/departures?route=1&stop=100&date={DATE_STR}&count=1")
+    assert status == 200
+    assert body['departures'] == ['07:00']
+
+
+def test_unexpected_error_answers_500_and_keeps_the_connection(service, monkeypatch):
+    def broken_query(params):
+        raise IndexError('list index out of range')
+    monkeypatch.setattr(service, 'query_departures', broken_query)
+
+    async def two_requests():
+        server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            responses = []
+            for target in ('/departures?route=1&stop=100', '/health'):
+                writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('latin-1'))
+                status_line = await reader.readline()
+                headers = {}
+                while (line := await reader.readline()) != b'\r\n':
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = json.loads(await reader.readexactly(int(headers['content-length'])))
+                responses.append((status_line.split()[1], body))
+            writer.close()
+            return responses
+
+    (error_status, error_body), (health_status, health_body) = asyncio.run(two_requests())
+    assert error_status == b'500' and 'error' in error_body
+    assert health_status == b'200' and health_body['loaded']
+
+
+def test_reload_reads_the_service_config(tmp_path):
+    zip_path = service_feed(str(tmp_path / 'gtfs.zip'), start=date.today())
+    config_path = tmp_path / 'service.ini'
+    config_path.write_text('[LINES]\n1 = 1\n\n[STOP_CODES]\n100 = 1\n', encoding='utf-8')
+    service = TimetableService(zip_path, 2, str(config_path))
+
+    assert asyncio.run(service.reload_if_changed())
+    assert list(service.departures.departures) == [('1', '100')]
+    service._executor.shutdown()
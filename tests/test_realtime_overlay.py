@@ -0,0 +1,115 @@
+# tests/test_realtime_overlay.py
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from gtfs_utils import Profile
+from stop_departures import build_stop_departures, service_day_start
+from realtime_overlay import RealtimeOverlay, load_feed_message
+from gtfs_fixtures import (
+    write_feed, every_day_calendar, trip_stop_times, window,
+    STOPS_HEADER, ROUTES_HEADER, TRIPS_HEADER, STOP_TIMES_HEADER, CALENDAR_HEADER,
+)
+
+# ----------------------------------------------------
+# עדכוני TripUpdates (Snapshots בפורמט JSON ב-tests/snapshots) מעל זמני היציאה הסטטיים:
+# עיכוב שממשיך לתחנות הבאות, תחנה שמדלגים עליה, נסיעה שבוטלה, וחזרה ללוח ב-FULL_DATASET.
+# ----------------------------------------------------
+
+SNAPSHOTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots')
+DAY_0 = '20260301'
+DAY_1 = '20260302'
+
+
+def at(hours, minutes):
+    return hours * 3600 + minutes * 60
+
+
+@pytest.fixture
+def overlay(tmp_path):
+    """קו 1 דרך 100 -> 200 -> 300 (5 דקות בין תחנות), כל יום: 07:00, 08:00, 09:00, 23:55 ו-00:05."""
+    zip_path = write_feed(str(tmp_path / 'gtfs.zip'), {
+        'agency.txt': (('agency_id', 'agency_name', 'agency_timezone'), [('1', 'סוכנות', 'Asia/Jerusalem')]),
+        'stops.txt': (STOPS_HEADER, [('S1', '100', 'מרכז', '32.1', '34.8'), ('S2', '200', 'אמצע', '32.1', '34.8'),
+                                     ('S3', '300', 'מסוף', '32.1', '34.8')]),
+        'routes.txt': (ROUTES_HEADER, [('R1', '1')]),
+        'trips.txt': (TRIPS_HEADER, [('R1', 'SV', f"T{n}") for n in range(1, 6)]),
+        'stop_times.txt': (STOP_TIMES_HEADER, [
+            *trip_stop_times('T1', ['S1', 'S2', 'S3'], 7 * 60),
+            *trip_stop_times('T2', ['S1', 'S2', 'S3'], 8 * 60),
+            *trip_stop_times('T3', ['S1', 'S2', 'S3'], 9 * 60),
+            *trip_stop_times('T4', ['S1', 'S2', 'S3'], 23 * 60 + 55),
+            *trip_stop_times('T5', ['S1', 'S2', 'S3'], 5),
+        ]),
+        'calendar.txt': (CALENDAR_HEADER, [every_day_calendar('SV')]),
+    })
+    stop_departures = build_stop_departures(zip_path, window(2), Profile('test', ['1'], {'100', '200', '300'}))
+    overlay = RealtimeOverlay(stop_departures)
+    overlay.apply_feed(load_feed_message(os.path.join(SNAPSHOTS_DIR, 'trip_updates.json')))
+    return overlay
+
+
+def test_delay_propagates_to_later_stops(overlay):
+    # delay של 5 דקות בתחנה הראשונה חל גם על התחנות שאחריה
+    assert overlay.departures_on('1', '100', DAY_0, at(7, 0), 1) == [(at(7, 5), at(7, 0))]
+    assert overlay.departures_on('1', '200', DAY_0, at(7, 0), 1) == [(at(7, 10), at(7, 5))]
+    assert overlay.departures_on('1', '300', DAY_0, at(7, 0), 1) == [(at(7, 15), at(7, 10))]
+    # רק ביום השירות של העדכון
+    assert overlay.departures_on('1', '100', DAY_1, at(7, 0), 1) == [(at(7, 0), at(7, 0))]
+
+
+def test_skipped_stop_is_removed_only_there(overlay):
+    assert overlay.departures_on('1', '100', DAY_0, at(8, 0), 1) == [(at(8, 0), at(8, 0))]
+    # 08:05 (דילוג) ו-09:05 (ביטול) יוצאים, והבאה היא 24:00
+    assert overlay.departures_on('1', '200', DAY_0, at(8, 0), 1) == [(at(24, 0), at(24, 0))]
+
+
+def test_canceled_trip_is_removed_at_every_stop(overlay):
+    for stop_code, scheduled in (('100', at(9, 0)), ('200', at(9, 5)), ('300', at(9, 10))):
+        departures = overlay.departures_on('1', stop_code, DAY_0, at(8, 30), 3)
+        assert scheduled not in [s for _, s in departures], stop_code
+
+
+def test_absolute_time_is_measured_in_agency_timezone(overlay):
+    # time מוחלט של 23:58 שעון ישראל, בלי קשר לאזור הזמן של המחשב
+    assert overlay.departures_on('1', '100', DAY_0, at(23, 0), 1) == [(at(23, 58), at(23, 55))]
+
+
+def test_negative_delay_from_next_service_day(overlay):
+    # 00:05 של מחר הוקדם ב-15 דקות ל-23:50 היום - לפני 23:58 של היום
+    departures = overlay.next_departures('1', '100', datetime(2026, 3, 1, 23, 30), 2)
+    assert departures == [
+        (datetime(2026, 3, 1, 23, 50), datetime(2026, 3, 2, 0, 5)),
+        (datetime(2026, 3, 1, 23, 58), datetime(2026, 3, 1, 23, 55)),
+    ]
+
+
+def test_full_dataset_refresh_reverts_missing_trips(overlay):
+    summary = overlay.apply_feed(load_feed_message(os.path.join(SNAPSHOTS_DIR, 'trip_updates_refresh.json')))
+
+    assert summary['applied'] == 1 and summary['reverted'] == 4
+    assert overlay.departures_on('1', '200', DAY_0, at(7, 0), 1) == [(at(7, 6), at(7, 5))]
+    assert overlay.departures_on('1', '200', DAY_0, at(8, 0), 2) == [(at(8, 5), at(8, 5)), (at(9, 5), at(9, 5))]
+    assert overlay.departures_on('1', '100', DAY_0, at(23, 0), 1) == [(at(23, 55), at(23, 55))]
+
+
+def test_service_day_starts_at_noon_minus_12h():
+    noon = datetime(2026, 3, 27, 12, tzinfo=ZoneInfo('Asia/Jerusalem'))
+    # ביום המעבר לשעון קיץ "חצות" של GTFS הוא 23:00 של הערב הקודם
+    assert service_day_start('20260327') == int(noon.timestamp()) - 12 * 3600
+    assert service_day_start('20260327') == int(datetime(2026, 3, 27, tzinfo=ZoneInfo('Asia/Jerusalem')).timestamp()) - 3600
+
+
+def test_static_next_departures_with_no_count(overlay):
+    static = overlay.static
+    assert static.next_departures('1', '100', datetime(2026, 3, 1, 8, 30), 0) == []
+    assert static.next_departures('1', '100', datetime(2026, 3, 1, 8, 30), -1) == []
+    assert static.next_departures('1', '100', datetime(2026, 3, 1, 8, 30), 1) == [datetime(2026, 3, 1, 9, 0)]
+
+
+def test_overlay_with_no_count(overlay):
+    # ביום עם עדכונים: בלי הבדיקה נכנסת יציאה אחת לפני בדיקת count
+    assert overlay.departures_on('1', '100', DAY_0, at(7, 0), 0) == []
+    assert overlay.next_departures('1', '100', datetime(2026, 3, 1, 6, 0), 0) == []
@@ -0,0 +1,117 @@
+# tests/test_schedule_delta.py
+import os
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from schedule_delta import (
+    build_schedule_patch, apply_schedule_patch, publish_schedule_delta,
+    split_schedule_days, content_hash, get_patch_path, get_manifest_path,
+)
+
+# ----------------------------------------------------
+# Patch + הקובץ הקודם = הקובץ החדש, בית אחר בית: גם כשהימים זזים (יום אחרי הבנייה הקודמת),
+# מקובץ ריק, ועם שם תחנה שמתחיל ב-':'. וה-Manifest: שימוש חוזר ב-Patch, ונפילה להורדה מלאה.
+# ----------------------------------------------------
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OLD_TEXT = '\n'.join([
+    '1|100|מרכז|0:07:00,08:00',
+    '1|200|:רציף 3|0:07:05,08:05',
+    '1|100|מרכז|1:07:00,09:00',
+    '1|200|:רציף 3|1:07:05,09:05',
+    '2|100|מרכז|2:10:00',
+])
+# יום אחרי: יום 1 הקודם הוא יום 0, ויום 2 הקודם הוא יום 1 (עם שינוי), ויום 2 חדש
+NEW_TEXT = '\n'.join([
+    '1|100|מרכז|0:07:00,09:00',
+    '1|200|:רציף 3|0:07:05,09:05',
+    '2|100|מרכז|1:10:00,11:00',
+    '1|100|מרכז|2:07:00',
+    '1|200|:רציף 3|2:07:05',
+])
+
+
+def test_patch_round_trip_when_days_shift():
+    patch = build_schedule_patch(OLD_TEXT, NEW_TEXT)
+
+    assert apply_schedule_patch(OLD_TEXT, patch) == NEW_TEXT
+    # יום 0 החדש מועתק כולו מיום 1 הקודם
+    assert patch['days'][0] == {'day': 0, 'source': 1, 'ops': [[0, 2]]}
+
+
+def test_stop_name_starting_with_colon_keeps_its_day():
+    assert split_schedule_days(OLD_TEXT)[0][1] == '1|200|:רציף 3|:07:05,08:05'
+    patch = build_schedule_patch(OLD_TEXT, NEW_TEXT)
+    assert apply_schedule_patch(OLD_TEXT, patch).split('\n')[1] == '1|200|:רציף 3|0:07:05,09:05'
+
+
+def test_patch_from_empty_schedule():
+    patch = build_schedule_patch('', NEW_TEXT)
+
+    assert patch['from']['sha256'] == content_hash('')
+    assert all(isinstance(op, str) for day_patch in patch['days'] for op in day_patch['ops'])
+    assert apply_schedule_patch('', patch) == NEW_TEXT
+
+
+def test_patch_rejects_a_different_base_and_a_wrong_target():
+    patch = build_schedule_patch(OLD_TEXT, NEW_TEXT)
+    with pytest.raises(Exception, match='base sha256 mismatch'):
+        apply_schedule_patch(NEW_TEXT, patch)
+
+    patch['to']['sha256'] = content_hash('something else')
+    with pytest.raises(Exception, match='target sha256'):
+        apply_schedule_patch(OLD_TEXT, patch)
+
+
+def write_schedule(path, text):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+
+def test_publish_writes_patch_and_reuses_it_on_same_output(tmp_path):
+    output_path = str(tmp_path / 'schedule2.txt')
+    write_schedule(output_path, NEW_TEXT)
+
+    manifest = publish_schedule_delta(output_path, OLD_TEXT, '20260302')
+    assert manifest['snapshot']['sha256'] == content_hash(NEW_TEXT)
+    assert manifest['patch']['from_sha256'] == content_hash(OLD_TEXT)
+    with open(get_patch_path(output_path), encoding='utf-8') as f:
+        assert apply_schedule_patch(OLD_TEXT, json.load(f)) == NEW_TEXT
+
+    # בנייה חוזרת עם אותו פלט: הלקוחות שעדיין מחזיקים את OLD_TEXT ממשיכים לקבל את ה-Patch
+    rerun = publish_schedule_delta(output_path, NEW_TEXT, '20260302')
+    assert rerun['patch'] == manifest['patch']
+    assert os.path.exists(get_patch_path(output_path))
+
+
+def test_publish_drops_a_patch_that_does_not_reach_the_snapshot(tmp_path):
+    output_path = str(tmp_path / 'schedule2.txt')
+    write_schedule(output_path, NEW_TEXT)
+    publish_schedule_delta(output_path, OLD_TEXT, '20260302')
+
+    # ה-Manifest הקודם מצביע על Patch ל-NEW_TEXT, אבל הפלט עכשיו אחר (ואין פלט קודם להשוות אליו)
+    write_schedule(output_path, OLD_TEXT)
+    manifest = publish_schedule_delta(output_path, OLD_TEXT, '20260303')
+    assert manifest['patch'] is None
+    assert not os.path.exists(get_patch_path(output_path))
+    with open(get_manifest_path(output_path), encoding='utf-8') as f:
+        assert json.load(f)['patch'] is None
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="node is not installed")
+def test_client_patch_matches_python():
+    """applySchedulePatch של data_fetch.js נותן את אותו טקסט כמו apply_schedule_patch."""
+    with open(os.path.join(REPO_DIR, 'data_fetch.js'), encoding='utf-8') as f:
+        source = f.read()
+    start = source.index('function applySchedulePatch(')
+    function_source = source[start:source.index('\n}\n', start) + 2]
+    script = (f"{function_source}\nconst input = JSON.parse(require('fs').readFileSync(0, 'utf-8'));\n"
+              "process.stdout.write(applySchedulePatch(input.old, input.patch));\n")
+    payload = json.dumps({'old': OLD_TEXT, 'patch': build_schedule_patch(OLD_TEXT, NEW_TEXT)})
+
+    result = subprocess.run(['node', '-e', script], input=payload.encode('utf-8'), capture_output=True, check=True)
+    assert result.stdout.decode('utf-8') == NEW_TEXT
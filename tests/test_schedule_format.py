@@ -0,0 +1,86 @@
+# tests/test_schedule_format.py
+import os
+import json
+
+import pytest
+
+from gtfs_utils import Profile
+from weekly_parser import build_weekly_schedule_from_zip
+from schedule_format import encode_schedule_lines, decode_schedule, write_compact_schedule, load_compact_schedule
+from gtfs_fixtures import (
+    write_feed, every_day_calendar, trip_stop_times, render_schedule, window,
+    STOPS_HEADER, ROUTES_HEADER, TRIPS_HEADER, STOP_TIMES_HEADER, CALENDAR_HEADER,
+)
+
+# ----------------------------------------------------
+# הלוך-חזור של הפורמט הקומפקטי: schedule2.txt -> JSON (גרסה 1 או 2) -> אותו טקסט, בית אחר בית.
+# ----------------------------------------------------
+
+REPO_SCHEDULE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'schedule2.txt')
+
+
+@pytest.fixture
+def weekly_text(tmp_path):
+    """schedule2.txt של שבוע שבו כל הימים זהים (הימים מאוחדים), עם זמן אחרי חצות ושמות בעברית."""
+    zip_path = write_feed(str(tmp_path / 'gtfs.zip'), {
+        'stops.txt': (STOPS_HEADER, [
+            ('S1', '100', 'מרכז/רציף 3', '32.1', '34.8'),
+            ('S2', '200', 'תחנה ב', '32.1', '34.8'),
+        ]),
+        'routes.txt': (ROUTES_HEADER, [('R1', '60'), ('R2', '9'), ('R3', '10א')]),
+        'trips.txt': (TRIPS_HEADER, [('R1', 'SV', 'T1'), ('R1', 'SV', 'T2'), ('R2', 'SV', 'T3'), ('R3', 'SV', 'T4')]),
+        'stop_times.txt': (STOP_TIMES_HEADER, [
+            *trip_stop_times('T1', ['S1', 'S2'], 7 * 60 + 5),
+            *trip_stop_times('T2', ['S1', 'S2'], 25 * 60 + 10),
+            *trip_stop_times('T3', ['S2', 'S1'], 6 * 60),
+            *trip_stop_times('T4', ['S1'], 23 * 60 + 59),
+        ]),
+        'calendar.txt': (CALENDAR_HEADER, [every_day_calendar('SV')]),
+    })
+    week_days = window()
+    weekly_schedule = build_weekly_schedule_from_zip(zip_path, week_days, Profile('test', ['60', '9', '10א'], {'100'}))
+    return render_schedule(weekly_schedule, week_days, tmp_path / 'schedule2.txt')
+
+
+@pytest.mark.parametrize('version', [1, 2])
+def test_round_trip_is_byte_identical(weekly_text, version):
+    compact = encode_schedule_lines(weekly_text.split('\n'), version=version)
+    payload = json.dumps(compact, ensure_ascii=False, separators=(',', ':'))
+
+    assert json.loads(payload)['version'] == version
+    assert '\n'.join(decode_schedule(payload)) == weekly_text
+    assert '\n'.join(decode_schedule(payload.encode('utf-8'))) == weekly_text
+
+
+def test_version_2_stores_identical_days_once(weekly_text):
+    lines = weekly_text.split('\n')
+    compact = encode_schedule_lines(lines)
+
+    # 7 ימים זהים: כל רשימת זמנים נשמרת פעם אחת, וכל יום מפנה אליה
+    assert len(compact['rows']) == len(lines) == 7 * len(compact['patterns'])
+    assert '25:10' in weekly_text and 'מרכז/רציף 3' in weekly_text
+
+
+def test_compressed_files_round_trip(weekly_text, tmp_path):
+    output_path = str(tmp_path / 'schedule2.txt')
+    written = write_compact_schedule(weekly_text.split('\n'), output_path)
+
+    for path in written:
+        assert '\n'.join(load_compact_schedule(path)) == weekly_text
+
+
+@pytest.mark.skipif(not os.path.exists(REPO_SCHEDULE), reason="schedule2.txt is not in the working tree")
+@pytest.mark.parametrize('version', [1, 2])
+def test_published_schedule_round_trip(version):
+    with open(REPO_SCHEDULE, encoding='utf-8', newline='') as f:
+        text = f.read()
+    compact = encode_schedule_lines(text.split('\n'), version=version)
+
+    assert '\n'.join(decode_schedule(json.dumps(compact, ensure_ascii=False))) == text
+
+
+def test_unsupported_version_is_rejected(weekly_text):
+    compact = encode_schedule_lines(weekly_text.split('\n'))
+    compact['version'] = 3
+    with pytest.raises(Exception, match='Unsupported'):
+        decode_schedule(compact)
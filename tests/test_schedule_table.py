@@ -0,0 +1,67 @@
+# tests/test_schedule_table.py
+import pytest
+
+from gtfs_utils import Profile
+from schedule_table import parse_gtfs_time, parse_departure_minutes, format_minutes
+from stop_departures import build_stop_departures
+from trip_patterns import build_trip_patterns
+from gtfs_fixtures import (
+    write_feed, every_day_calendar, trip_stop_times, window, START_DATE,
+    STOPS_HEADER, ROUTES_HEADER, TRIPS_HEADER, STOP_TIMES_HEADER, CALENDAR_HEADER,
+)
+
+# ----------------------------------------------------
+# הפענוח היחיד של זמנים (parse_gtfs_time) והפורמט היחיד (format_minutes).
+# ----------------------------------------------------
+
+
+@pytest.mark.parametrize('time_str, seconds', [
+    ('07:05:30', 7 * 3600 + 5 * 60 + 30),
+    ('7:05:00', 7 * 3600 + 5 * 60),
+    ('25:10:00', 25 * 3600 + 10 * 60),
+    ('07:05', 7 * 3600 + 5 * 60),
+    (' 07:05:00 ', 7 * 3600 + 5 * 60),
+    ('', -1),
+    ('   ', -1),
+    ('7', -1),
+    ('07:5', -1),
+    ('aa:bb:cc', -1),
+    ('07:05:xx', -1),
+])
+def test_parse_gtfs_time_is_tolerant(time_str, seconds):
+    assert parse_gtfs_time(time_str) == seconds
+
+
+def test_minutes_and_format_agree():
+    assert parse_departure_minutes('25:10:59') == 25 * 60 + 10
+    assert parse_departure_minutes('bad') == -1
+    assert format_minutes(parse_departure_minutes('25:10')) == '25:10'
+    assert format_minutes(0) == '00:00'
+
+
+@pytest.fixture
+def malformed_feed(tmp_path):
+    """נסיעה אחת עם שורה פגומה ב-stop_times (HH:MM ורווחים), ונסיעה תקינה."""
+    bad_rows = trip_stop_times('T1', ['S1', 'S2', 'S3'], 7 * 60)
+    bad_rows[1] = ('T1', ' 7:05 ', 'x', 'S2', '2')
+    return write_feed(str(tmp_path / 'gtfs.zip'), {
+        'stops.txt': (STOPS_HEADER, [('S1', '100', 'א', '32.1', '34.8'), ('S2', '200', 'ב', '32.1', '34.8'),
+                                     ('S3', '300', 'ג', '32.1', '34.8')]),
+        'routes.txt': (ROUTES_HEADER, [('R1', '1')]),
+        'trips.txt': (TRIPS_HEADER, [('R1', 'SV', 'T1'), ('R1', 'SV', 'T2')]),
+        'stop_times.txt': (STOP_TIMES_HEADER, [*bad_rows, *trip_stop_times('T2', ['S1', 'S2', 'S3'], 8 * 60)]),
+        'calendar.txt': (CALENDAR_HEADER, [every_day_calendar('SV')]),
+    })
+
+
+def test_malformed_stop_times_row_does_not_abort_builds(malformed_feed):
+    profile = Profile('test', ['1'], {'200', '300'}, stop_pairs=[('100', '300')])
+    date_str = START_DATE.strftime('%Y%m%d')
+
+    stop_departures = build_stop_departures(malformed_feed, window(1), profile)
+    # departure_time פגום -> נופלים ל-arrival_time (' 7:05 ')
+    assert list(stop_departures.get_departures('1', '200', date_str)) == [7 * 3600 + 5 * 60, 8 * 3600 + 5 * 60]
+
+    trip_patterns, stop_code_to_ids = build_trip_patterns(malformed_feed, window(1), profile)
+    trips = trip_patterns.sweep(profile.stop_pairs, stop_code_to_ids)[('100', '300')]
+    assert [(departure, arrival) for _, departure, arrival, _, _ in trips] == [(7 * 3600, 7 * 3600 + 600), (8 * 3600, 8 * 3600 + 600)]
@@ -0,0 +1,45 @@
+# tests/test_stop_grid.py
+import random
+
+import pytest
+
+from stop_grid import StopGrid, distance_m
+
+# ----------------------------------------------------
+# k התחנות הקרובות מה-Grid זהות לחיפוש מלא, גם לנקודה רחוקה מכל התחנות -
+# ובלי לעבור על טבעות ריקות מחוץ לתחום התחנות.
+# ----------------------------------------------------
+
+
+@pytest.fixture(scope='module')
+def grid():
+    rng = random.Random(7)
+    rows = [(f"S{n}", str(10000 + n), f"תחנה {n}", f"{31.7 + rng.random() * 0.2:.6f}", f"{34.7 + rng.random() * 0.2:.6f}")
+            for n in range(500)]
+    return StopGrid.from_rows(rows)
+
+
+def brute_force(grid, lat, lon, k):
+    return sorted((distance_m(lat, lon, grid.lats[i], grid.lons[i]), i) for i in range(len(grid.lats)))[:k]
+
+
+@pytest.mark.parametrize('lat, lon', [(31.8, 34.8), (31.7, 34.7), (32.5, 34.8), (31.8, 36.0), (29.5, 32.0)])
+def test_nearest_matches_brute_force(grid, lat, lon):
+    assert grid.nearest(lat, lon, 5) == brute_force(grid, lat, lon, 5)
+
+
+def test_far_point_visits_only_cells_in_the_extent(grid, monkeypatch):
+    min_row, max_row, min_col, max_col = grid.extent
+    visited = []
+    distances = grid._distances
+
+    def counting_distances(lat, lon, cells):
+        cells = list(cells)
+        visited.extend(cells)
+        return distances(lat, lon, cells)
+    monkeypatch.setattr(grid, '_distances', counting_distances)
+
+    # (0, 0) - בערך 4,000 ק"מ מהתחנות: מאות אלפי טבעות לפני התיקון
+    assert grid.nearest(0.0, 0.0, 3) == brute_force(grid, 0.0, 0.0, 3)
+    assert all(min_row <= row <= max_row and min_col <= col <= max_col for row, col in visited)
+    assert len(visited) <= (max_row - min_row + 1) * (max_col - min_col + 1)
@@ -0,0 +1,59 @@
+# tests/test_table_loader.py
+import zlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import gtfs_utils
+from gtfs_utils import iter_csv_columns, get_rows_read
+from gtfs_fixtures import write_feed, trip_stop_times, STOP_TIMES_HEADER
+
+# ----------------------------------------------------
+# פריסה דרך open_zip_member (isal/zlib-ng בלי לשנות את zipfile), ומונה השורות מכמה Threads.
+# ----------------------------------------------------
+
+ROWS = [row for n in range(200) for row in trip_stop_times(f"T{n}", ['S1', 'S2', 'S3'], 300 + n)]
+
+
+@pytest.fixture
+def zip_path(tmp_path):
+    return write_feed(str(tmp_path / 'gtfs.zip'), {'stop_times.txt': (STOP_TIMES_HEADER, ROWS)})
+
+
+@pytest.fixture
+def fast_zlib(monkeypatch):
+    """הפריסה המהירה פעילה גם בלי isal/zlib-ng (עם zlib הרגיל באותו API)."""
+    monkeypatch.setattr(gtfs_utils, 'fast_zlib', gtfs_utils.fast_zlib or zlib)
+    return gtfs_utils.fast_zlib
+
+
+def read_rows(zip_path):
+    with zipfile.ZipFile(zip_path) as zfile:
+        return list(iter_csv_columns(zfile, 'stop_times.txt', STOP_TIMES_HEADER))
+
+
+def test_fast_decompression_reads_the_same_rows(zip_path, fast_zlib, monkeypatch):
+    rows = read_rows(zip_path)
+    monkeypatch.setattr(gtfs_utils, 'fast_zlib', None)
+
+    assert rows == read_rows(zip_path) == [tuple(row) for row in ROWS]
+    # zipfile עצמו לא שונה
+    assert zipfile.zlib is zlib
+    assert zipfile.crc32 is zlib.crc32
+
+
+def test_fast_decompression_checks_crc(zip_path, fast_zlib):
+    with zipfile.ZipFile(zip_path) as zfile:
+        zfile.getinfo('stop_times.txt').CRC ^= 1
+        with pytest.raises(Exception, match='Bad CRC-32'):
+            list(iter_csv_columns(zfile, 'stop_times.txt', ('trip_id',)))
+
+
+def test_rows_read_is_counted_from_many_threads(zip_path, fast_zlib):
+    before = get_rows_read(['stop_times.txt'])
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        counts = list(executor.map(lambda _: len(read_rows(zip_path)), range(16)))
+
+    assert counts == [len(ROWS)] * 16
+    assert get_rows_read(['stop_times.txt']) - before == 16 * len(ROWS)
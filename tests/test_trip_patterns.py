@@ -0,0 +1,67 @@
+# tests/test_trip_patterns.py
+import pytest
+
+from gtfs_utils import Profile
+from trip_patterns import build_trip_patterns, format_pair_lines
+from gtfs_fixtures import (
+    write_feed, every_day_calendar, trip_stop_times, window,
+    STOPS_HEADER, ROUTES_HEADER, TRIPS_HEADER, STOP_TIMES_HEADER, CALENDAR_HEADER,
+)
+
+# ----------------------------------------------------
+# קיבוץ הנסיעות לתבניות תוך כדי קריאת stop_times (גם כשהקובץ לא מקובץ לפי trip_id),
+# וסדר הקווים בקובץ הזוגות - אותו סדר כמו ב-schedule2.txt.
+# ----------------------------------------------------
+
+PROFILE = Profile('test', ['9', '10', '60', '60א'], {'100', '300'}, stop_pairs=[('100', '300')])
+
+
+def pair_feed(path, stop_times_rows):
+    return write_feed(str(path), {
+        'stops.txt': (STOPS_HEADER, [('S1', '100', 'א', '32.1', '34.8'), ('S2', '200', 'ב', '32.1', '34.8'),
+                                     ('S3', '300', 'ג', '32.1', '34.8')]),
+        'routes.txt': (ROUTES_HEADER, [('R9', '9'), ('R10', '10'), ('R60', '60'), ('R60A', '60א')]),
+        'trips.txt': (TRIPS_HEADER, [('R10', 'SV', 'T10'), ('R9', 'SV', 'T9'), ('R60A', 'SV', 'T60A'),
+                                     ('R60', 'SV', 'T60'), ('R9', 'SV', 'TX')]),
+        'stop_times.txt': (STOP_TIMES_HEADER, stop_times_rows),
+        'calendar.txt': (CALENDAR_HEADER, [every_day_calendar('SV')]),
+    })
+
+
+TRIP_ROWS = [
+    trip_stop_times('T10', ['S1', 'S2', 'S3'], 7 * 60),
+    trip_stop_times('T9', ['S1', 'S2', 'S3'], 8 * 60),
+    trip_stop_times('T60A', ['S1', 'S2', 'S3'], 9 * 60),
+    trip_stop_times('T60', ['S1', 'S3'], 10 * 60),
+    trip_stop_times('TX', ['S3', 'S2', 'S1'], 11 * 60),
+]
+
+
+def pair_lines(zip_path):
+    trip_patterns, stop_code_to_ids = build_trip_patterns(zip_path, window(1), PROFILE)
+    return trip_patterns, format_pair_lines(trip_patterns.sweep(PROFILE.stop_pairs, stop_code_to_ids))
+
+
+def test_pair_routes_are_sorted_like_schedule2(tmp_path):
+    _, lines = pair_lines(pair_feed(tmp_path / 'gtfs.zip', [row for rows in TRIP_ROWS for row in rows]))
+
+    assert lines == [
+        '9|100|300|0:08:00-08:10',
+        '10|100|300|0:07:00-07:10',
+        '60|100|300|0:10:00-10:05',
+        '60א|100|300|0:09:00-09:10',
+    ]
+
+
+@pytest.mark.parametrize('order', ['grouped', 'interleaved'])
+def test_trips_are_grouped_whatever_the_row_order(tmp_path, order):
+    if order == 'grouped':
+        rows = [row for rows in TRIP_ROWS for row in rows]
+    else:
+        # השורות של כל נסיעה מפוזרות בקובץ (ובסדר stop_sequence הפוך)
+        rows = [rows[position] for position in (2, 1, 0) for rows in TRIP_ROWS if position < len(rows)]
+    trip_patterns, lines = pair_lines(pair_feed(tmp_path / 'gtfs.zip', rows))
+
+    assert trip_patterns.trip_count() == 5
+    assert len(trip_patterns.patterns) == 3
+    assert lines[0] == '9|100|300|0:08:00-08:10'
@@ -0,0 +1,288 @@
+# trip_patterns.py
+import zipfile
+import argparse
+from array import array
+from datetime import date
+
+from gtfs_utils import (
+    list_zip_contents,
+    iter_csv_columns,
+    map_service_ids_for_days,
+    map_stop_info,
+    map_trip_days,
+    get_default_profile,
+    route_sort_key,
+)
+from pipeline_stats import PipelineStats
+from schedule_table import parse_gtfs_time, format_minutes
+
+# ----------------------------------------------------
+# נסיעות ישירות מתחנה A לתחנה B (הזוגות ב-[PAIRS]): מתי יוצאים מ-A ומתי מגיעים ל-B.
+# הנסיעות של הקווים שבקונפיג מקובצות לתבניות (Trip Patterns) - נסיעות עם אותו רצף תחנות.
+# רצף התחנות נשמר פעם אחת לכל תבנית, ולכל נסיעה רק שעת ההתחלה ומספר של "תזמון"
+# (המרווחים מתחילת הנסיעה, משותפים לכל הנסיעות עם אותם מרווחים).
+# כל הזוגות נענים מאינדקס תחנה -> תבניות: נקודת העלייה והירידה מחושבות פעם אחת לתבנית,
+# ואז כל נסיעה בתבנית היא רק חיבור של שעת ההתחלה למרווחים - בלי מעבר נוסף על stop_times.
+# stop_times.txt ממוין לפי trip_id, ולכן כל נסיעה מקובצת ברגע שהשורות שלה נגמרות -
+# בזיכרון יש רק הנסיעה הנוכחית, ולא כל השורות של הקווים שבקונפיג.
+# ----------------------------------------------------
+
+PAIRS_SUFFIX = '.pairs.txt'
+STOP_TIMES_FILE = 'stop_times.txt'
+STOP_TIMES_COLUMNS = ('trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence')
+
+
+def get_pairs_path(schedule_path):
+    """schedule2.txt -> schedule2.pairs.txt (ליד קובץ הלוח)"""
+    base = schedule_path[:-4] if schedule_path.endswith('.txt') else schedule_path
+    return f"{base}{PAIRS_SUFFIX}"
+
+
+class TripPatterns:
+    """
+    patterns[pid] = tuple של stop_id לפי stop_sequence.
+    timings[tid] = (arrival_offsets, departure_offsets) - array('i') של שניות מתחילת הנסיעה (-1 = אין זמן בתחנה).
+    pattern_trips[pid] = [(trip_id, route, start_seconds, tid, day_offsets), ...]
+    stop_patterns[stop_id] = set של pid שעוברים בתחנה.
+    """
+
+    def __init__(self):
+        self.patterns = []
+        self.pattern_index = {}
+        self.timings = []
+        self.timing_index = {}
+        self.pattern_trips = []
+        self.stop_patterns = {}
+
+    def add_trip(self, trip_id, route, day_offsets, stop_rows):
+        """stop_rows: [(stop_sequence, stop_id, arrival_seconds, departure_seconds)] בסדר כלשהו."""
+        stop_rows.sort()
+        stops = tuple(stop_id for _, stop_id, _, _ in stop_rows)
+        times = [seconds for _, _, arrival, departure in stop_rows for seconds in (arrival, departure) if seconds >= 0]
+        if not times:
+            return
+        start = min(times)
+
+        arrivals = array('i', [arrival - start if arrival >= 0 else -1 for _, _, arrival, _ in stop_rows])
+        departures = array('i', [departure - start if departure >= 0 else -1 for _, _, _, departure in stop_rows])
+        timing_key = (arrivals.tobytes(), departures.tobytes())
+        tid = self.timing_index.get(timing_key)
+        if tid is None:
+            tid = self.timing_index[timing_key] = len(self.timings)
+            self.timings.append((arrivals, departures))
+
+        pid = self.pattern_index.get(stops)
+        if pid is None:
+            pid = self.pattern_index[stops] = len(self.patterns)
+            self.patterns.append(stops)
+            self.pattern_trips.append([])
+            for stop_id in stops:
+                self.stop_patterns.setdefault(stop_id, set()).add(pid)
+        self.pattern_trips[pid].append((trip_id, route, start, tid, day_offsets))
+
+    def trip_count(self):
+        return sum(len(trips) for trips in self.pattern_trips)
+
+    @staticmethod
+    def _board_alight(stops, origin_ids, destination_ids):
+        """(i, j) של הנסיעה הקצרה ביותר בתבנית: עלייה ב-origin במיקום i וירידה ב-destination במיקום j > i."""
+        best = None
+        board = None
+        for position, stop_id in enumerate(stops):
+            if board is not None and stop_id in destination_ids:
+                if best is None or position - board < best[1] - best[0]:
+                    best = (board, position)
+            if stop_id in origin_ids:
+                board = position
+        return best
+
+    def direct_trips(self, origin_ids, destination_ids):
+        """
+        כל הנסיעות הישירות מאחת מ-origin_ids לאחת מ-destination_ids:
+        [(day_offset, departure_seconds, arrival_seconds, route, trip_id)] ממוין.
+        """
+        origin_patterns = set().union(*(self.stop_patterns.get(stop_id, ()) for stop_id in origin_ids))
+        destination_patterns = set().union(*(self.stop_patterns.get(stop_id, ()) for stop_id in destination_ids))
+
+        results = []
+        for pid in origin_patterns & destination_patterns:
+            positions = self._board_alight(self.patterns[pid], origin_ids, destination_ids)
+            if positions is None:
+                continue
+            board, alight = positions
+            for trip_id, route, start, tid, day_offsets in self.pattern_trips[pid]:
+                arrivals, departures = self.timings[tid]
+                # בתחנות שאינן נקודות תזמון חסר אחד הזמנים - משתמשים בשני
+                departure = departures[board] if departures[board] >= 0 else arrivals[board]
+                arrival = arrivals[alight] if arrivals[alight] >= 0 else departures[alight]
+                if departure < 0 or arrival < 0:
+                    continue
+                for day_offset in day_offsets:
+                    results.append((day_offset, start + departure, start + arrival, route, trip_id))
+        results.sort()
+        return results
+
+    def sweep(self, stop_pairs, stop_code_to_ids):
+        """
+        עונה על כל הזוגות בבת אחת: { (origin_code, destination_code): direct_trips(...) }.
+        קוד תחנה עם כמה Stop IDs נחשב לכולם. זוג שאחת מתחנותיו לא נמצאה ב-stops.txt מדולג.
+        """
+        results = {}
+        for origin_code, destination_code in stop_pairs:
+            origin_ids = set(stop_code_to_ids.get(origin_code, ()))
+            destination_ids = set(stop_code_to_ids.get(destination_code, ()))
+            if not origin_ids or not destination_ids:
+                missing = destination_code if origin_ids else origin_code
+                print(f"WARNING: Pair {origin_code}->{destination_code}: Stop Code {missing} not found in stops.txt. Ignoring.")
+                continue
+            results[(origin_code, destination_code)] = self.direct_trips(origin_ids, destination_ids)
+        return results
+
+
+def _stop_row(arrival_time, departure_time, stop_id, stop_sequence):
+    sequence = int(stop_sequence) if stop_sequence.isdigit() else -1
+    return (sequence, stop_id, parse_gtfs_time(arrival_time), parse_gtfs_time(departure_time))
+
+
+def add_trips_as_they_end(trip_patterns, stop_times_data, trip_days):
+    """
+    מוסיף כל נסיעה מ-trip_days ברגע שהשורות שלה ב-stop_times נגמרות (מתחילה נסיעה אחרת).
+    מחזיר False אם נסיעה שכבר נוספה מופיעה שוב (הקובץ לא מקובץ לפי trip_id) - ואז התבניות חלקיות.
+    """
+    finished = set()
+    current_trip, stop_rows = None, []
+    for trip_id, arrival_time, departure_time, stop_id, stop_sequence in stop_times_data:
+        if trip_id != current_trip:
+            if stop_rows:
+                route_short_name, offsets = trip_days[current_trip]
+                trip_patterns.add_trip(current_trip, route_short_name, tuple(offsets), stop_rows)
+                finished.add(current_trip)
+            current_trip, stop_rows = trip_id, []
+        if trip_id not in trip_days:
+            continue
+        if trip_id in finished:
+            return False
+        stop_rows.append(_stop_row(arrival_time, departure_time, stop_id, stop_sequence))
+
+    if stop_rows:
+        route_short_name, offsets = trip_days[current_trip]
+        trip_patterns.add_trip(current_trip, route_short_name, tuple(offsets), stop_rows)
+    return True
+
+
+def add_buffered_trips(trip_patterns, stop_times_data, trip_days):
+    """כמו add_trips_as_they_end, לקובץ שאינו מקובץ לפי trip_id: כל השורות של הנסיעות נאספות בזיכרון קודם."""
+    trip_rows = {}
+    for trip_id, arrival_time, departure_time, stop_id, stop_sequence in stop_times_data:
+        if trip_id in trip_days:
+            trip_rows.setdefault(trip_id, []).append(_stop_row(arrival_time, departure_time, stop_id, stop_sequence))
+
+    for trip_id, stop_rows in trip_rows.items():
+        route_short_name, offsets = trip_days[trip_id]
+        trip_patterns.add_trip(trip_id, route_short_name, tuple(offsets), stop_rows)
+
+
+def build_trip_patterns(zip_path, days, profile=None, stats=None):
+    """
+    מעבר יחיד על stop_times.txt: כל השורות של נסיעות הקווים שבקונפיג שפעילות באחד מ-days,
+    מקובצות לתבניות. מחזיר (TripPatterns, stop_code_to_ids).
+    """
+    profile = profile if profile is not None else get_default_profile()
+    stats = stats if stats is not None else PipelineStats()
+    trip_patterns = TripPatterns()
+
+    with zipfile.ZipFile(zip_path, 'r') as zfile:
+        zip_contents = list_zip_contents(zfile)
+
+        with stats.stage('pattern_calendar_mapping') as record:
+            service_offsets = map_service_ids_for_days(zfile, [(day['offset'], day['date_str']) for day in days], zip_contents)
+            record['rows_kept'] = len(service_offsets)
+
+        with stats.stage('pattern_stop_mapping') as record:
+            _, stop_code_to_ids = map_stop_info(zfile, zip_contents)
+            record['rows_kept'] = len(stop_code_to_ids)
+
+        # trip_id -> (קו, הימים שבהם הנסיעה פעילה), לקווים שבקונפיג בלבד
+        with stats.stage('pattern_trip_mapping') as record:
+            trip_days = map_trip_days(zfile, service_offsets, None, zip_contents, profile)
+            record['rows_kept'] = len(trip_days)
+
+        with stats.stage('trip_patterns') as record:
+            if STOP_TIMES_FILE not in zip_contents: raise Exception(f"File {STOP_TIMES_FILE} is not in the archive!")
+
+            stop_times_data = iter_csv_columns(zfile, STOP_TIMES_FILE, STOP_TIMES_COLUMNS)
+            if not add_trips_as_they_end(trip_patterns, stop_times_data, trip_days):
+                print(f"WARNING: {STOP_TIMES_FILE} is not grouped by trip_id. Grouping the configured trips in memory instead.")
+                trip_patterns = TripPatterns()
+                add_buffered_trips(trip_patterns, iter_csv_columns(zfile, STOP_TIMES_FILE, STOP_TIMES_COLUMNS), trip_days)
+            record['rows_kept'] = trip_patterns.trip_count()
+            record['patterns'] = len(trip_patterns.patterns)
+            record['timings'] = len(trip_patterns.timings)
+
+    print(f"DEBUG: Grouped {trip_patterns.trip_count()} trips into {len(trip_patterns.patterns)} patterns "
+          f"and {len(trip_patterns.timings)} distinct timings.")
+    return trip_patterns, stop_code_to_ids
+
+
+def format_pair_lines(pair_trips):
+    """
+    { (origin_code, destination_code): direct_trips } -> שורות בפורמט
+    RouteID|OriginCode|DestinationCode|DayOffset:HH:MM-HH:MM,... (יציאה מהמוצא - הגעה ליעד).
+    """
+    lines = []
+    for (origin_code, destination_code), trips in pair_trips.items():
+        by_route = {}
+        for day_offset, departure, arrival, route, _ in trips:
+            by_route.setdefault(route, {}).setdefault(day_offset, []).append(
+                f"{format_minutes(departure // 60)}-{format_minutes(arrival // 60)}")
+        # אותו סדר קווים כמו ב-schedule2.txt (9 לפני 10); קווים עם אותו מספר לפי השם
+        for route in sorted(sorted(by_route), key=route_sort_key):
+            for day_offset, times in sorted(by_route[route].items()):
+                lines.append(f"{route}|{origin_code}|{destination_code}|{day_offset}:{','.join(times)}")
+    return lines
+
+
+def generate_pair_schedule(zip_path, days, output_path, profile=None, stats=None):
+    """בונה את התבניות, עונה על כל [PAIRS] של הפרופיל וכותב את הקובץ. מחזיר את מספר השורות."""
+    profile = profile if profile is not None else get_default_profile()
+    stats = stats if stats is not None else PipelineStats()
+    if not profile.stop_pairs:
+        return 0
+
+    trip_patterns, stop_code_to_ids = build_trip_patterns(zip_path, days, profile, stats)
+    with stats.stage('pair_sweep') as record:
+        pair_trips = trip_patterns.sweep(profile.stop_pairs, stop_code_to_ids)
+        lines = format_pair_lines(pair_trips)
+        record['rows_kept'] = sum(len(trips) for trips in pair_trips.values())
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+    print(f"SUCCESS: Writing {len(lines)} direct-trip lines for {len(pair_trips)} stop pairs to {output_path}.")
+    return len(lines)
+
+
+if __name__ == '__main__':
+    # ייבוא מקומי: weekly_parser מייבא את המודול הזה
+    from weekly_parser import get_week_days
+
+    parser = argparse.ArgumentParser(description="Direct trips between stop pairs (default: the [PAIRS] section of config.ini).")
+    parser.add_argument('--zip', default='gtfs.zip')
+    parser.add_argument('--days', type=int, default=7, help="Number of days, starting today (default: 7).")
+    parser.add_argument('--from', dest='origin', help="Origin stop code (with --to, instead of [PAIRS]).")
+    parser.add_argument('--to', dest='destination', help="Destination stop code.")
+    parser.add_argument('--output', help="Write the pair schedule to this file instead of printing it.")
+    args = parser.parse_args()
+
+    default_profile = get_default_profile()
+    if args.origin and args.destination:
+        default_profile.stop_pairs = [(args.origin, args.destination)]
+    if not default_profile.stop_pairs:
+        raise SystemExit("No stop pairs: add a [PAIRS] section to config.ini or pass --from/--to.")
+
+    window = get_week_days(date.today(), args.days)
+    if args.output:
+        generate_pair_schedule(args.zip, window, args.output, default_profile)
+    else:
+        patterns, code_to_id = build_trip_patterns(args.zip, window, default_profile)
+        for line in format_pair_lines(patterns.sweep(default_profile.stop_pairs, code_to_id)):
+            print(line)
@@ -1,14 +1,36 @@
 # weekly_parser.py
 
-import os
+import zipfile
 from datetime import date, timedelta
-from gtfs_parser import generate_schedule # ייבוא פונקציית הליבה מהקובץ הקיים
-from gtfs_utils import CRITICAL_STOP_CODES # ייבוא קבועים קריטיים
-# נניח ש-gtfs_utils מכיל את הפונקציות הבאות:
-# get_service_id_for_date, map_service_ids_for_date
+from gtfs_utils import (
+    list_zip_contents,
+    map_service_ids_for_days,
+    dedupe_service_days,
+    expand_service_days,
+    map_stop_info,
+    convert_codes_to_ids,
+    scan_stop_times,
+    map_trip_days,
+    extract_weekly_stop_times,
+    extract_weekly_stop_departures,
+    format_schedule_lines,
+    get_default_profile,
+)
+from gtfs_cache import load_feed_cache, CACHE_DIR
+from gtfs_index import load_feed_index, INDEX_DIR
+from parallel_stop_times import parallel_scan_stop_times, STOP_TIMES_FILE
+from pipeline_stats import PipelineStats
+from schedule_format import write_compact_schedule
+from schedule_delta import publish_schedule_delta, read_schedule_text
+from schedule_table import measure_schedule_memory
+from stop_grid import resolve_profile_locations
+from trip_patterns import generate_pair_schedule, get_pairs_path
+from stop_departures import get_stops_path
+from table_loader import side_tables, CALENDAR_FILES, TRIP_FILES
 
 ZIP_FILE_PATH = "path/to/your/gtfs.zip" 
 OUTPUT_FILE_PATH = "schedule2.txt"
+WEEK_LENGTH = 7
 
 def get_day_info_for_date(target_date):
     """
@@ -21,15 +43,13 @@ def get_day_info_for_date(target_date):
     return date_str, day_index
 
 
-def generate_weekly_schedule(zip_path, output_path):
+def get_week_days(start_date, days=WEEK_LENGTH):
     """
-    מייצרת קובץ לוח זמנים שבועי המשלב את כל 7 הימים הבאים.
+    מחזירה את רשימת הימים בחלון (0=היום, 1=מחר, ... 6=היום השישי).
+    days: אורך החלון - לוח השירות מבוסס תאריכים, ולכן אפשר גם חלון של כמה שבועות.
     """
-    
-    # 1. חישוב 7 הימים הקרובים (0=היום, 1=מחר, ... 6=היום השישי)
-    start_date = date.today()
     week_days = []
-    for day_offset in range(7):
+    for day_offset in range(days):
         current_date = start_date + timedelta(days=day_offset)
         date_str, gtfs_day_index = get_day_info_for_date(current_date)
         
@@ -38,50 +58,270 @@ def generate_weekly_schedule(zip_path, output_path):
             'date_str': date_str,
             'gtfs_day_index': gtfs_day_index
         })
-    
+    return week_days
+
+
+def _record_kept(record, weekly_schedule):
+    """מספר שעות המוצא שנשמרו לכל offset, והזיכרון של הלוח ליציאה (ראו schedule_table.py)."""
+    record['rows_kept_by_day'] = {day_offset: final_schedule.departure_count()
+                                  for day_offset, final_schedule in sorted(weekly_schedule.items())}
+    record['rows_kept'] = sum(record['rows_kept_by_day'].values())
+    record['schedule_memory'] = measure_schedule_memory(weekly_schedule.values())
+
+
+def _load_service_trips(zfile, zip_contents, week, profile, stats):
+    """
+    הטבלאות הקטנות של build_weekly_schedule_from_zip (רץ ב-Thread נפרד, ראו table_loader.py):
+    לוח השירות ו-trip_id -> (קו, ימים) לקווים שבקונפיג, לפני הסינון הגיאוגרפי.
+    """
+    with stats.stage('calendar_mapping', files=CALENDAR_FILES) as record:
+        service_offsets = map_service_ids_for_days(zfile, week, zip_contents)
+        # ימים עם אותו סט שירותים מחושבים פעם אחת
+        service_offsets, day_aliases = dedupe_service_days(service_offsets)
+        record['rows_kept'] = len(service_offsets)
+        record['distinct_days'] = len(set(day_aliases.values()))
+
+    with stats.stage('trip_mapping', files=TRIP_FILES) as record:
+        candidate_trip_days = map_trip_days(zfile, service_offsets, None, zip_contents, profile)
+        record['rows_kept'] = len(candidate_trip_days)
+    return day_aliases, candidate_trip_days
+
+
+def build_weekly_schedule_from_zip(zip_path, week_days, profile=None, workers=1, stats=None, with_stops=False):
+    """
+    פארסינג יחיד של ה-ZIP עבור כל ימי השבוע. מחזיר WeeklySchedule ({ day_offset: DaySchedule }).
+    calendar/routes/trips נטענים ב-Thread נפרד בזמן הסריקה של stop_times.txt.
+    עם workers > 1, הסריקה של stop_times.txt מתחלקת בין כמה Processes.
+    with_stops: אותה סריקה אוספת גם את היציאות בתחנות שבקונפיג עצמן, ומוחזר
+    (weekly_schedule, stop_schedule) - ראו extract_weekly_stop_departures.
+    """
+    profile = profile if profile is not None else get_default_profile()
+    stats = stats if stats is not None else PipelineStats()
+    week = [(day['offset'], day['date_str']) for day in week_days]
+    stop_rows = [] if with_stops else None
+    with zipfile.ZipFile(zip_path, 'r') as zfile:
+        zip_contents = list_zip_contents(zfile)
+
+        # התחנות קודם: הסריקה של stop_times צריכה את ה-Stop IDs של התחנות שבקונפיג
+        with stats.stage('stop_mapping', files=('stops.txt',)) as record:
+            stop_id_to_info, stop_code_to_ids = map_stop_info(zfile, zip_contents)
+            record['rows_kept'] = len(stop_id_to_info)
+
+        with stats.stage('code_to_id_conversion') as record:
+            converted_ids = convert_codes_to_ids(stop_code_to_ids, profile)
+            record['rows_kept'] = len(converted_ids)
+        if not converted_ids:
+            print("WARNING: No valid Stop IDs found for the critical Stop Codes. Proceeding without geographic filter.")
+
+        with side_tables(zip_path, _load_service_trips, week, profile, stats) as service_trips:
+            with stats.stage('stop_filtering', files=(STOP_TIMES_FILE,)) as record:
+                if workers > 1:
+                    # ה-Workers מקבלים את ה-Trips של הקווים והימים (כדי להחזיר רק אותם) אחרי הפריסה של הקובץ
+                    relevant_trip_ids, first_departures = parallel_scan_stop_times(
+                        zfile, zip_contents, workers, profile,
+                        candidate_trip_ids=lambda: service_trips.result()[1].keys(), stop_rows=stop_rows
+                    )
+                else:
+                    # מעבר יחיד על stop_times: סינון גיאוגרפי + איסוף שעות המוצא (ואם צריך, היציאות בתחנות)
+                    relevant_trip_ids, first_departures = scan_stop_times(zfile, zip_contents, profile, stop_rows)
+                record['rows_kept'] = len(first_departures)
+
+            with stats.stage('side_tables_wait') as record:
+                day_aliases, candidate_trip_days = service_trips.result()
+                record['rows_kept'] = len(candidate_trip_days)
+
+    # סינון גיאוגרפי של ה-Trips לפי תוצאות הסריקה
+    trip_days = {trip_id: trip_info for trip_id, trip_info in candidate_trip_days.items()
+                 if relevant_trip_ids is None or trip_id in relevant_trip_ids}
+    print(f"DEBUG: Identified {len(trip_days)} relevant trips for the window after filtering by stops and routes.")
+
+    with stats.stage('stop_times_extraction') as record:
+        weekly_schedule = expand_service_days(extract_weekly_stop_times(first_departures, trip_days, stop_id_to_info), day_aliases)
+        record['rows_scanned'] = len(first_departures)
+        _record_kept(record, weekly_schedule)
+    if not with_stops:
+        return weekly_schedule
+
+    with stats.stage('stop_departures_extraction') as record:
+        stop_schedule = expand_service_days(extract_weekly_stop_departures(stop_rows, trip_days, stop_id_to_info), day_aliases)
+        record['rows_scanned'] = len(stop_rows)
+        _record_kept(record, stop_schedule)
+    return weekly_schedule, stop_schedule
+
+
+def build_weekly_schedule_from_cache(feed_cache, week_days, profile=None, stats=None, with_stops=False):
+    """אותו חישוב כמו build_weekly_schedule_from_zip (כולל with_stops), מול ה-Cache העמודתי (ללא קריאת CSV)."""
+    profile = profile if profile is not None else get_default_profile()
+    stats = stats if stats is not None else PipelineStats()
+
+    with stats.stage('calendar_mapping') as record:
+        service_offsets = feed_cache.map_service_ids_for_days(
+            [(day['offset'], day['date_str']) for day in week_days]
+        )
+        service_offsets, day_aliases = dedupe_service_days(service_offsets)
+        record['rows_kept'] = len(service_offsets)
+        record['distinct_days'] = len(set(day_aliases.values()))
+
+    with stats.stage('stop_mapping') as record:
+        stop_id_to_info, stop_code_to_ids = feed_cache.map_stop_info()
+        record['rows_kept'] = len(stop_id_to_info)
+
+    with stats.stage('code_to_id_conversion') as record:
+        converted_ids = convert_codes_to_ids(stop_code_to_ids, profile)
+        record['rows_kept'] = len(converted_ids)
+    if not converted_ids:
+        print("WARNING: No valid Stop IDs found for the critical Stop Codes. Proceeding without geographic filter.")
+
+    with stats.stage('stop_filtering') as record:
+        relevant_trips = feed_cache.find_relevant_trips_by_stops(converted_ids)
+        record['rows_scanned'] = len(feed_cache.st_stop)
+        record['rows_kept'] = None if relevant_trips is None else int(relevant_trips.sum())
+
+    with stats.stage('trip_mapping') as record:
+        trip_bits = feed_cache.map_trip_days(service_offsets, relevant_trips, profile.target_routes)
+        record['rows_scanned'] = len(trip_bits)
+        record['rows_kept'] = int((trip_bits != 0).sum())
+
+    with stats.stage('stop_times_extraction') as record:
+        weekly_schedule = expand_service_days(feed_cache.extract_weekly_stop_times(trip_bits, stop_id_to_info), day_aliases)
+        record['rows_scanned'] = len(feed_cache.first_row)
+        _record_kept(record, weekly_schedule)
+    if not with_stops:
+        return weekly_schedule
+
+    with stats.stage('stop_departures_extraction') as record:
+        stop_schedule = expand_service_days(feed_cache.extract_weekly_stop_departures(trip_bits, stop_id_to_info, converted_ids), day_aliases)
+        record['rows_scanned'] = len(feed_cache.st_stop)
+        _record_kept(record, stop_schedule)
+    return weekly_schedule, stop_schedule
+
+
+def build_weekly_schedule_from_index(feed_index, week_days, profile=None, stats=None, with_stops=False):
+    """אותו חישוב מול האינדקס ההפוך (כולל with_stops): רק חיפושים לפי הקווים והתחנות שבקונפיג."""
+    profile = profile if profile is not None else get_default_profile()
+    stats = stats if stats is not None else PipelineStats()
+
+    with stats.stage('index_lookup') as record:
+        weekly_schedule = feed_index.build_weekly_schedule(week_days, profile.target_routes, profile.critical_stop_codes)
+        _record_kept(record, weekly_schedule)
+    if not with_stops:
+        return weekly_schedule
+
+    with stats.stage('stop_departures_extraction') as record:
+        stop_schedule = feed_index.build_weekly_stop_departures(week_days, profile.target_routes, profile.critical_stop_codes)
+        _record_kept(record, stop_schedule)
+    return weekly_schedule, stop_schedule
+
+
+def write_weekly_schedule(weekly_schedule, week_days, output_path, stats=None, compact=False):
+    """
+    כותבת את { day_offset: DaySchedule } לקובץ בפורמט RouteID|StopCode|StopName|DayOffset:times.
+    compact: כותבת גם את הפורמט הקומפקטי (schedule2.json + גרסאות דחוסות, ראו schedule_format.py).
+    """
+    stats = stats if stats is not None else PipelineStats()
     all_output_lines = []
     
-    # 2. הרצת הפארסר עבור כל יום בנפרד
-    for day in week_days:
-        temp_output_path = f"temp_schedule_{day['offset']}.txt"
-        
-        print(f"\n--- Starting parsing for Day Offset {day['offset']} ({day['date_str']}) ---")
-        
-        try:
-            # הפעלת הפארסר הראשי עבור היום הספציפי
-            generate_schedule(
-                zip_path, 
-                temp_output_path, 
-                day_info=(day['date_str'], day['gtfs_day_index'])
-            )
-            
-            # 3. קריאת הפלט הזמני ושילוב מפתח היום
-            with open(temp_output_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
+    with stats.stage('writing') as record:
+        lines_by_day = {}
+
+        # שילוב מפתח היום בשורות של כל יום
+        for day in week_days:
+            final_schedule = weekly_schedule.get(day['offset'])
+
+            if not final_schedule:
+                print(f"WARNING: Skipping Day Offset {day['offset']} ({day['date_str']}): no relevant trips found.")
+                continue
+
             # הפורמט הנוכחי הוא: RouteID|StopCode:times
             # הפורמט החדש הוא: RouteID|StopCode|DayOffset:times
-            for line in lines:
+            lines_before = len(all_output_lines)
+            for line in format_schedule_lines(final_schedule):
                 if ':' in line:
                     key_part, times_part = line.split(':', 1)
                     # יצירת המפתח המורכב: קו|תחנה|מספר_יום_רציף
                     new_key = f"{key_part}|{day['offset']}"
                     all_output_lines.append(f"{new_key}:{times_part.strip()}")
-            
-            os.remove(temp_output_path) # מחיקת הקובץ הזמני
-            
-        except Exception as e:
-            print(f"WARNING: Skipping Day Offset {day['offset']} due to error: {e}")
-            if os.path.exists(temp_output_path):
-                 os.remove(temp_output_path)
-
-    # 4. כתיבת הקובץ הסופי
-    if all_output_lines:
-        print(f"\nSUCCESS: Writing {len(all_output_lines)} combined schedule lines to {output_path}.")
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(all_output_lines))
+            lines_by_day[day['offset']] = len(all_output_lines) - lines_before
+
+        # כתיבת הקובץ הסופי
+        if all_output_lines:
+            print(f"\nSUCCESS: Writing {len(all_output_lines)} combined schedule lines to {output_path}.")
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(all_output_lines))
+        else:
+            print("CRITICAL: No schedule data generated for the entire week.")
+
+        record['rows_kept'] = len(all_output_lines)
+        record['rows_kept_by_day'] = lines_by_day
+
+    if compact and all_output_lines:
+        with stats.stage('writing_compact') as record:
+            write_compact_schedule(all_output_lines, output_path)
+            record['rows_kept'] = len(all_output_lines)
+    return len(all_output_lines)
+
+
+def generate_weekly_schedule(zip_path, output_path, engine='cache', profile=None, workers=1, compact=False, delta=False):
+    """
+    מייצרת קובץ לוח זמנים שבועי המשלב את כל 7 הימים הבאים.
+    כל טבלה ב-GTFS נקראת פעם אחת בלבד עבור כל השבוע (במקום 7 הרצות של generate_schedule).
+    engine:
+      'zip'   - קריאה ישירה של ה-ZIP.
+      'cache' - Cache עמודתי (numpy) שנבנה פעם אחת לכל Feed. חוזר ל-'zip' אם numpy לא מותקן.
+      'index' - אינדקס הפוך שנבנה פעם אחת לכל Feed; כל שינוי בקונפיג הוא רק חיפוש באינדקס.
+    workers: מספר ה-Processes לסריקת stop_times.txt במנוע 'zip'.
+    compact: כותבת גם את הפורמט הקומפקטי ליד קובץ הפלט (schedule2.json, .json.gz, .json.br).
+    נכתבות גם היציאות בתחנות שבקונפיג עצמן, באותו פורמט (schedule2.stops.txt).
+    אם בפרופיל יש [PAIRS], נכתבות גם הנסיעות הישירות בין הזוגות (schedule2.pairs.txt, ראו trip_patterns.py).
+    delta: כותבת גם Patch מהפלט הקודם ו-Manifest (schedule2.patch.json, schedule2.manifest.json, ראו schedule_delta.py).
+    בסיום נכתב דוח מדידות לכל שלב ליד קובץ הפלט (schedule2.stats.json).
+    """
+    stats = PipelineStats(label=f"weekly:{engine}")
+
+    # מקומות מ-[LOCATIONS] -> קודי תחנות (דרך האינדקס המרחבי של ה-Feed)
+    profile = profile if profile is not None else get_default_profile()
+    with stats.stage('location_resolution') as record:
+        resolve_profile_locations(profile, zip_path)
+        record['rows_kept'] = len(profile.critical_stop_codes)
+
+    # 1. חישוב 7 הימים הקרובים
+    week_days = get_week_days(date.today())
+    
+    # 2. פארסינג יחיד עבור כל ימי השבוע
+    if engine == 'index':
+        with stats.stage('feed_loading'):
+            feed_index = load_feed_index(zip_path, INDEX_DIR)
+        weekly_schedule, stop_schedule = build_weekly_schedule_from_index(feed_index, week_days, profile, stats, with_stops=True)
     else:
-        print("CRITICAL: No schedule data generated for the entire week.")
+        feed_cache = None
+        if engine == 'cache':
+            with stats.stage('feed_loading'):
+                feed_cache = load_feed_cache(zip_path, CACHE_DIR)
+
+        if feed_cache is not None:
+            weekly_schedule, stop_schedule = build_weekly_schedule_from_cache(feed_cache, week_days, profile, stats, with_stops=True)
+        else:
+            weekly_schedule, stop_schedule = build_weekly_schedule_from_zip(zip_path, week_days, profile, workers, stats, with_stops=True)
+
+    # 3. כתיבת הקובץ הסופי (הפלט הקודם נשמר בזיכרון לחישוב ה-Patch)
+    previous_text = read_schedule_text(output_path) if delta else None
+    lines_written = write_weekly_schedule(weekly_schedule, week_days, output_path, stats, compact)
+    if delta and lines_written:
+        with stats.stage('writing_delta') as record:
+            manifest = publish_schedule_delta(output_path, previous_text, week_days[0]['date_str'])
+            record['rows_kept'] = manifest['patch']['new_lines'] if manifest['patch'] else None
+            record['patch_bytes'] = manifest['patch']['bytes'] if manifest['patch'] else None
+            record['snapshot_bytes'] = manifest['snapshot']['bytes']
+
+    # 4. היציאות בתחנות שבקונפיג עצמן (ולא רק בתחנת המוצא), באותו פורמט
+    if any(stop_schedule.values()):
+        with stats.stage('writing_stops') as record:
+            record['rows_kept'] = write_weekly_schedule(stop_schedule, week_days, get_stops_path(output_path))
+
+    # 5. נסיעות ישירות בין זוגות התחנות שב-[PAIRS]
+    if profile.stop_pairs:
+        generate_pair_schedule(zip_path, week_days, get_pairs_path(output_path), profile, stats)
+    stats.write_report(output_path)
 
 
 if __name__ == '__main__':